@@ -0,0 +1,43 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from .. import crud, schemas
+from ..database import get_db
+from ..offline_jobs import offline_jobs, start_offline_job
+
+router = APIRouter()
+
+@router.post("/", response_model=schemas.OfflineJob)
+def create_offline_job(job_in: schemas.OfflineJobCreate, db: Session = Depends(get_db)):
+    source = crud.get_video_source(db, source_id=job_in.source_id)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Source not found")
+    if source.type != "file" or not os.path.exists(source.path_url):
+        raise HTTPException(status_code=400, detail="Offline counting is only available for uploaded files")
+    if crud.get_tripwire_config(db, source.id) is None:
+        raise HTTPException(status_code=400, detail="Configure a tripwire for this source first")
+    for job in offline_jobs.values():
+        if job.source_id == source.id and job.status in ("queued", "running"):
+            raise HTTPException(status_code=409, detail=f"Source already has an offline job in progress ({job.job_id})")
+
+    job = start_offline_job(source.id, source.path_url, job_in.recorded_at)
+    return job.to_dict()
+
+@router.get("/", response_model=list[schemas.OfflineJob])
+def list_offline_jobs():
+    return [job.to_dict() for job in offline_jobs.values()]
+
+@router.get("/{job_id}", response_model=schemas.OfflineJob)
+def get_offline_job(job_id: int):
+    job = offline_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.delete("/{job_id}", response_model=schemas.OfflineJob)
+def cancel_offline_job(job_id: int):
+    job = offline_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.cancel()
+    return job.to_dict()
@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 import cv2
 import os
@@ -15,11 +16,14 @@ from pydantic import BaseModel
 
 from ..database import get_db, SessionLocal
 from .. import crud, models
-from ..services.async_yolo import MultiprocessYOLO
+from ..pipeline import pipelines, presence, VIEWER, SCHEDULE
+from ..services.jpeg_hub import BLANK_JPEG, mjpeg_part
+from ..services import webrtc_relay
+from ..services.stream_quality import AdaptiveQuality, DEFAULT_INTERVAL, HIDDEN_FPS, HIDDEN_VARIANT, stream_variant
+from ..services.overlay_feed import compact_metadata, lines_key, sse_event
 
 try:
-    from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack, RTCConfiguration, RTCIceServer
-    from av import VideoFrame
+    from aiortc import RTCPeerConnection, RTCSessionDescription
 except ImportError:
     pass
 
@@ -42,189 +46,155 @@ def save_frontend_metric(metric: FrontendMetric):
     metrics_logger.info(f"[FRONTEND Metrics] Camera '{metric.camera_name}' (ID: {metric.source_id}) loaded in {metric.load_time_sec:.2f} seconds.")
     return {"status": "logged"}
 
-yolo_processors = {}
-active_viewers = {}
-camera_threads = {}
-processor_lock = threading.Lock()
+class ViewerPresence(BaseModel):
+    viewer_id: str
+    visible: bool
+
+@router.post("/presence")
+async def report_viewer_presence(report: ViewerPresence):
+    """
+    El navegador avisa si la vista del stream está visible (Page Visibility + IntersectionObserver).
+    Un visor oculto recibe solo instantáneas livianas y, si todos los de la cámara lo están
+    y no hay conteo programado, el pipeline baja la inferencia al mínimo.
+    """
+    return {"status": "ok", "known": presence.report(report.viewer_id, report.visible)}
+
+# Sin metadatos nuevos, el feed SSE manda un comentario cada tanto para mantener viva la conexión
+SSE_KEEPALIVE_SEC = 15.0
+
 pcs = set()
+webrtc_broadcaster = webrtc_relay.WebRTCBroadcaster()
+
+class WebRTCOffer(BaseModel):
+    sdp: str
+    type: str
 
 def cleanup_all_processes():
     print("[STREAM] Limpiando todos los procesos YOLO...")
-    with processor_lock:
-        for p in list(yolo_processors.values()):
-            try:
-                p.stop()
-            except Exception:
-                pass
-        yolo_processors.clear()
-        active_viewers.clear()
-        
-        # We can't easily kill threads, but we set active_viewers to 0 so they exit naturally
-        for pc in list(pcs):
-            asyncio.run_coroutine_threadsafe(pc.close(), asyncio.get_event_loop())
-        pcs.clear()
+    pipelines.stop_all()
+    for pc in list(pcs):
+        asyncio.run_coroutine_threadsafe(pc.close(), asyncio.get_event_loop())
+    pcs.clear()
 
-def get_tripwire_data(source_id):
-    db = SessionLocal()
-    try:
-        return crud.get_tripwire(db, source_id=source_id)
-    finally:
-        db.close()
+@router.get("/rates")
+def get_inference_rates():
+    """FPS de inferencia que el controlador adaptativo asigna actualmente a cada cámara activa."""
+    rates = []
+    for source_id, pipeline in pipelines.items():
+        if pipeline.processor:
+            # Un solo pipeline por fuente: live, scheduled o live+scheduled según sus suscriptores
+            mode = "+".join(name for kind, name in ((VIEWER, "live"), (SCHEDULE, "scheduled")) if pipeline.refs[kind])
+            rates.append({"source_id": source_id, "mode": mode, "inference_fps": pipeline.processor.get_inference_rate()})
+    return rates
 
-def camera_worker(source_id: int, source_path: str, is_rtsp: bool):
-    """Background thread that consumes the Main Stream and feeds YOLO."""
-    try:
-        if is_rtsp:
-            os.environ["OPENCV_FFMPEG_LOGLEVEL"] = "-8"
-            os.environ["AV_LOG_LEVEL"] = "-8"
-            # Optimiza tiempo de conexion reduciendo probing y timeouts
-            os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp|fflags;nobuffer|fflags;discardcorrupt|flags;low_delay|analyzeduration;500000|probesize;50000|stimeout;3000000|rw_timeout;3000000"
-            
-        raw_cap = cv2.VideoCapture(source_path, cv2.CAP_FFMPEG) if is_rtsp else cv2.VideoCapture(source_path)
-        from ..services.video_reader import VideoReaderWrapper
-        cap = VideoReaderWrapper(raw_cap, is_rtsp=is_rtsp)
-        
-        if is_rtsp and "OPENCV_FFMPEG_CAPTURE_OPTIONS" in os.environ:
-            del os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"]
-            
-        if not cap.isOpened():
-            print(f"[STREAM-{source_id}] ERROR: No se pudo conectar a la fuente principal {source_path}")
-            return
-            
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)
-        
-        tripwire_data = get_tripwire_data(source_id)
-        last_tripwire_update = time.time()
-        
-        video_fps = 30.0
-        if not is_rtsp:
-            fps_prop = cap.get(cv2.CAP_PROP_FPS)
-            if fps_prop > 0: video_fps = fps_prop
-
-        start_time_real = time.time()
-        frame_idx = 0
-            
-        with processor_lock:
-            if source_id not in yolo_processors:
-                initial_in, initial_out = 0, 0
-                if is_rtsp:
-                    try:
-                        db = SessionLocal()
-                        db_in, db_out = crud.get_todays_historico_totals(db, source_id)
-                        initial_in += db_in
-                        initial_out += db_out
-                        db.close()
-                    except Exception: pass
-                yolo_processors[source_id] = MultiprocessYOLO(source_id, initial_in, initial_out)
-            processor = yolo_processors[source_id]
 
-        while True:
-            # Check if anyone is still watching
-            with processor_lock:
-                if active_viewers.get(source_id, 0) <= 0:
-                    break
-                    
-            success, frame = cap.read()
-            if not success:
-                if not is_rtsp:
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    start_time_real = time.time()
-                    frame_idx = 0
-                    continue
-                else:
-                    time.sleep(1)
-                    continue
-                    
-            if not is_rtsp:
-                frame_idx += 1
-                
-            if time.time() - last_tripwire_update > 5:
-                tripwire_data = get_tripwire_data(source_id)
-                last_tripwire_update = time.time()
-                
-            tw_dict = None
-            if tripwire_data:
-                tw_dict = {'x1': tripwire_data.x1, 'y1': tripwire_data.y1, 'x2': tripwire_data.x2, 'y2': tripwire_data.y2, 'direction': tripwire_data.direction}
-                
-            processor.update_frame(frame, tw_dict)
-            
-            if not is_rtsp:
-                curr_real = (time.time() - start_time_real)
-                curr_video_time = frame_idx / video_fps
-                sleep_time = curr_video_time - curr_real
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
+async def generate_mjpeg_frames(source_id: int, source_path: str, is_rtsp: bool,
+                                width=None, quality=None, fps=None, adaptive=False, viewer_id=None):
+    """
+    Generador async de MJPEG: corre en el event loop, sin ocupar hilos del threadpool.
+    Starlette espera a que cada parte se envíe antes de pedir la siguiente, así que un
+    cliente lento recibe el JPEG más reciente cuando su socket se libera y los intermedios
+    se descartan en lugar de acumularse.
 
-    finally:
-        if 'cap' in locals(): cap.release()
-        import gc
-        gc.collect()
-        print(f"[STREAM-{source_id}] Camera worker finalizado.")
-        
-        with processor_lock:
-            if source_id in camera_threads:
-                del camera_threads[source_id]
-            if source_id in yolo_processors and active_viewers.get(source_id, 0) <= 0:
-                yolo_processors[source_id].stop()
-                del yolo_processors[source_id]
-
-
-def ensure_camera_running(source_id: int, source_path: str, is_rtsp: bool):
-    with processor_lock:
-        if source_id not in active_viewers:
-            active_viewers[source_id] = 0
-        active_viewers[source_id] += 1
-        
-        if source_id not in camera_threads:
-            t = threading.Thread(target=camera_worker, args=(source_id, source_path, is_rtsp), daemon=True)
-            camera_threads[source_id] = t
-            t.start()
-            
-def release_camera(source_id: int):
-    with processor_lock:
-        if source_id in active_viewers:
-            active_viewers[source_id] -= 1
-
-
-def generate_mjpeg_frames(source_id: int, source_path: str, is_rtsp: bool):
-    """Fallback generator para archivos VOD (archivos locales) en formato MJPEG."""
-    ensure_camera_running(source_id, source_path, is_rtsp)
-    
-    skip_encode_counter = 0
-    blank_frame = np.zeros((320, 320, 3), dtype=np.uint8)
+    width/quality eligen la variante (compartida con los visores que piden lo mismo), fps
+    limita los frames por segundo de este visor y adaptive baja resolución y calidad
+    mientras su socket no drena. Con viewer_id el navegador reporta si la vista está
+    visible (/presence); oculta, solo recibe una instantánea liviana cada pocos segundos.
+    """
+    # Si el conteo programado ya tiene la fuente abierta, el visor se suma a ese mismo pipeline
+    pipeline = pipelines.acquire(source_id, source_path, is_rtsp, VIEWER)
+    loop = asyncio.get_running_loop()
+    hub = pipeline.hub
+    control = AdaptiveQuality(width, quality) if adaptive else None
+    variant = control.variant if control else stream_variant(width, quality)
+    visible_variant, visible_fps = variant, fps
+    hidden = False
+    new_frame = hub.subscribe_async(loop, variant=variant, fps=fps)
+    if viewer_id:
+        presence.join(viewer_id, new_frame)
     
     try:
+        yield mjpeg_part(BLANK_JPEG)
+        sent_seq = 0
+        next_send = 0.0
         while True:
-            processor = yolo_processors.get(source_id)
-            if processor:
-                frame = processor.get_latest_processed_frame(blank_frame)
-            else:
-                frame = blank_frame
-                
-            skip_encode_counter += 1
-            if skip_encode_counter % 2 == 0:
-                ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 65])
-                if ret:
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-            
-            time.sleep(0.01)
+            try:
+                await asyncio.wait_for(new_frame.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                # Sin frames: si el pipeline murió o se reinició (p. ej. otro visor reintentó la conexión), seguir al nuevo
+                current = pipelines.revive(pipeline)
+                if current is not None and current is not pipeline:
+                    hub.unsubscribe_async(loop, new_frame, variant=variant, fps=fps)
+                    if hidden:
+                        pipeline.hidden_viewers -= 1
+                        current.hidden_viewers += 1
+                    pipeline, hub = current, current.hub
+                    if viewer_id:
+                        presence.leave(viewer_id, new_frame)
+                    new_frame = hub.subscribe_async(loop, variant=variant, fps=fps)
+                    if viewer_id:
+                        presence.join(viewer_id, new_frame)
+                    sent_seq = 0
+                continue
+            new_frame.clear()
+
+            if viewer_id and presence.is_visible(viewer_id) == hidden:
+                # La vista cambió de visible a oculta (o al revés): instantáneas livianas mientras no se ve
+                hidden = not hidden
+                pipeline.hidden_viewers += 1 if hidden else -1
+                new_variant, new_fps = (HIDDEN_VARIANT, HIDDEN_FPS) if hidden else (visible_variant, visible_fps)
+                hub.change_variant(variant, fps, new_variant, new_fps)
+                variant, fps = new_variant, new_fps
+                sent_seq = 0
+                next_send = 0.0
+                metrics_logger.info(f"[MJPEG] Camera {source_id}: viewer {viewer_id} {'hidden' if hidden else 'visible'}")
+
+            interval = 1.0 / fps if fps else DEFAULT_INTERVAL
+            if fps and loop.time() < next_send:
+                # Este visor pidió menos FPS: se espera y se envía el JPEG más reciente de ese momento.
+                # Un reporte de visibilidad despierta la espera para no demorar el cambio de variante.
+                try:
+                    await asyncio.wait_for(new_frame.wait(), timeout=next_send - loop.time())
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            seq, jpeg = hub.latest(variant)
+            if jpeg is None or seq <= sent_seq:
+                continue
+            sent_seq = seq
+            sent_at = loop.time()
+            next_send = sent_at + interval * 0.9
+            yield mjpeg_part(jpeg)
+            if control is not None and not hidden and control.update(loop.time() - sent_at, interval):
+                hub.change_variant(variant, fps, control.variant, fps)
+                variant = visible_variant = control.variant
+                sent_seq = 0
+                metrics_logger.info(f"[MJPEG] Camera {source_id}: slow viewer moved to {variant[0] or 'full'}px, quality {variant[1]}")
     except Exception as e:
         print(f"[MJPEG] Error in generator for {source_id}: {e}")
     finally:
-        release_camera(source_id)
+        hub.unsubscribe_async(loop, new_frame, variant=variant, fps=fps)
+        if viewer_id:
+            presence.leave(viewer_id, new_frame)
+        if hidden:
+            pipeline.hidden_viewers -= 1
+        pipelines.release(source_id, VIEWER)
 
 @router.get("/rtsp/{source_id}")
-def stream_rtsp(source_id: int, db: Session = Depends(get_db)):
+def stream_rtsp(source_id: int, width: int = Query(None, ge=16, le=4096), quality: int = Query(None, ge=1, le=100),
+                fps: float = Query(None, gt=0, le=60), adaptive: bool = False, viewer: str = Query(None, max_length=64),
+                db: Session = Depends(get_db)):
     db_source = crud.get_video_source(db, source_id=source_id)
     if not db_source or db_source.type != "rtsp":
         raise HTTPException(status_code=404, detail="RTSP source not found")
         
-    return StreamingResponse(generate_mjpeg_frames(source_id, db_source.path_url, is_rtsp=True),
+    return StreamingResponse(generate_mjpeg_frames(source_id, db_source.path_url, True, width, quality, fps, adaptive, viewer),
                                 media_type="multipart/x-mixed-replace; boundary=frame")
 
 @router.get("/file/{source_id}")
-def stream_file(source_id: int, db: Session = Depends(get_db)):
+def stream_file(source_id: int, width: int = Query(None, ge=16, le=4096), quality: int = Query(None, ge=1, le=100),
+                fps: float = Query(None, gt=0, le=60), adaptive: bool = False, viewer: str = Query(None, max_length=64),
+                db: Session = Depends(get_db)):
     db_source = crud.get_video_source(db, source_id=source_id)
     if not db_source or db_source.type != "file":
         raise HTTPException(status_code=404, detail="Video file not found")
@@ -232,5 +202,149 @@ def stream_file(source_id: int, db: Session = Depends(get_db)):
     if not os.path.exists(db_source.path_url):
         raise HTTPException(status_code=404, detail="File does not exist on disk")
     
-    return StreamingResponse(generate_mjpeg_frames(source_id, db_source.path_url, is_rtsp=False),
+    return StreamingResponse(generate_mjpeg_frames(source_id, db_source.path_url, False, width, quality, fps, adaptive, viewer),
                              media_type="multipart/x-mixed-replace; boundary=frame")
+
+async def generate_overlay_events(source_id: int, source_path: str, is_rtsp: bool, viewer_id=None):
+    """
+    SSE con los metadatos de cada resultado (cajas, IDs, conteos; líneas solo al cambiar).
+    Llegan a la tasa de inferencia, mientras el video sale de los frames del lector a la tasa
+    de los visores; el navegador dibuja el último resultado en un canvas encima del video.
+    Mientras la vista del visor está oculta no se envía nada.
+    """
+    pipeline = pipelines.acquire(source_id, source_path, is_rtsp, VIEWER)
+    loop = asyncio.get_running_loop()
+    hub = pipeline.hub
+    new_frame = hub.subscribe_async(loop, feed="meta")
+    hidden = False
+    if viewer_id:
+        presence.join(viewer_id, new_frame)
+
+    try:
+        sent_seq = 0
+        sent_lines = None
+        last_sent = loop.time()
+        while True:
+            try:
+                await asyncio.wait_for(new_frame.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                # Sin resultados: si el pipeline murió o se reinició, seguir al nuevo (como el MJPEG)
+                current = pipelines.revive(pipeline)
+                if current is not None and current is not pipeline:
+                    hub.unsubscribe_async(loop, new_frame, feed="meta")
+                    if hidden:
+                        pipeline.hidden_viewers -= 1
+                        current.hidden_viewers += 1
+                    pipeline, hub = current, current.hub
+                    if viewer_id:
+                        presence.leave(viewer_id, new_frame)
+                    new_frame = hub.subscribe_async(loop, feed="meta")
+                    if viewer_id:
+                        presence.join(viewer_id, new_frame)
+                    sent_seq = 0
+                    sent_lines = None
+                if loop.time() - last_sent >= SSE_KEEPALIVE_SEC:
+                    # Comentario SSE para que proxies y navegador no cierren la conexión
+                    yield b": keepalive\n\n"
+                    last_sent = loop.time()
+                continue
+            new_frame.clear()
+            if viewer_id and presence.is_visible(viewer_id) == hidden:
+                hidden = not hidden
+                pipeline.hidden_viewers += 1 if hidden else -1
+            if hidden:
+                continue
+            seq, meta = hub.latest_meta()
+            if meta is None or seq <= sent_seq:
+                continue
+            sent_seq = seq
+            key = lines_key(meta)
+            yield sse_event(compact_metadata(seq, meta, include_lines=key != sent_lines))
+            sent_lines = key
+            last_sent = loop.time()
+    except Exception as e:
+        print(f"[OVERLAY] Error in SSE generator for {source_id}: {e}")
+    finally:
+        hub.unsubscribe_async(loop, new_frame, feed="meta")
+        if viewer_id:
+            presence.leave(viewer_id, new_frame)
+        if hidden:
+            pipeline.hidden_viewers -= 1
+        pipelines.release(source_id, VIEWER)
+
+@router.get("/meta/{source_id}")
+def stream_overlay_metadata(source_id: int, viewer: str = Query(None, max_length=64), db: Session = Depends(get_db)):
+    db_source = crud.get_video_source(db, source_id=source_id)
+    if not db_source or db_source.type not in ("rtsp", "file"):
+        raise HTTPException(status_code=404, detail="Source not found")
+    if db_source.type == "file" and not os.path.exists(db_source.path_url):
+        raise HTTPException(status_code=404, detail="File does not exist on disk")
+
+    return StreamingResponse(generate_overlay_events(source_id, db_source.path_url, db_source.type == "rtsp", viewer),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _stream_source(source_id):
+    """(tipo, ruta) de la fuente, o None. Sesión propia: se llama desde el threadpool."""
+    db = SessionLocal()
+    try:
+        db_source = crud.get_video_source(db, source_id=source_id)
+        return (db_source.type, db_source.path_url) if db_source else None
+    finally:
+        db.close()
+
+@router.post("/webrtc/{source_id}")
+async def webrtc_offer(source_id: int, offer: WebRTCOffer):
+    """
+    Offer/answer WebRTC para ver la cámara en vivo. El video sale del mismo pipeline que
+    el MJPEG y, si el navegador ofrece H.264, se codifica una sola vez por fuente para todos
+    los peers. El frontend cae a MJPEG si este endpoint falla (503 sin aiortc/av).
+    """
+    if not webrtc_relay.WEBRTC_AVAILABLE:
+        raise HTTPException(status_code=503, detail="WebRTC not available (aiortc/av not installed)")
+    if offer.type != "offer":
+        raise HTTPException(status_code=400, detail="Expected an SDP offer")
+    # SQLAlchemy es síncrono: la consulta va al threadpool para no bloquear el event loop
+    source = await run_in_threadpool(_stream_source, source_id)
+    if not source or source[0] not in ("rtsp", "file"):
+        raise HTTPException(status_code=404, detail="Source not found")
+    source_type, source_path = source
+    if source_type == "file" and not os.path.exists(source_path):
+        raise HTTPException(status_code=404, detail="File does not exist on disk")
+
+    pipeline = pipelines.acquire(source_id, source_path, source_type == "rtsp", VIEWER)
+    pc = RTCPeerConnection(configuration=webrtc_relay.rtc_configuration())
+    pcs.add(pc)
+    track = None
+
+    async def close_peer():
+        # Puede llegar dos veces (failed y luego closed)
+        if pc not in pcs:
+            return
+        pcs.discard(pc)
+        if track is not None:
+            webrtc_broadcaster.release_track(source_id, track)
+        pipelines.release(source_id, VIEWER)
+        await pc.close()
+
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        metrics_logger.info(f"[WEBRTC] Camera {source_id}: peer {pc.connectionState}")
+        if pc.connectionState in ("failed", "closed"):
+            await close_peer()
+
+    try:
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=offer.sdp, type=offer.type))
+        track, codecs = webrtc_broadcaster.create_track(source_id, pipeline, offer.sdp, revive=pipelines.revive)
+        sender = pc.addTrack(track)
+        if codecs:
+            for transceiver in pc.getTransceivers():
+                if transceiver.sender == sender:
+                    transceiver.setCodecPreferences(codecs)
+        answer = await pc.createAnswer()
+        await pc.setLocalDescription(answer)
+    except Exception as e:
+        await close_peer()
+        raise HTTPException(status_code=400, detail=f"WebRTC negotiation failed: {e}")
+
+    return {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 import cv2
+import datetime
 import os
+import time
+import numpy as np
 from .. import crud, models, schemas
 from ..database import get_db
+from ..services import trajectory_store
+from ..services.tripwire_engine import LEGACY_LINE_NAME, MAX_LINES, line_configs
 
 router = APIRouter()
 
@@ -25,6 +30,67 @@ def delete_tripwire(source_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Tripwire not found")
     return {"message": "Tripwire deleted successfully"}
 
+@router.get("/source/{source_id}/lines", response_model=list[schemas.TripwireLine])
+def get_tripwire_lines(source_id: int, db: Session = Depends(get_db)):
+    return crud.get_tripwire_lines(db, source_id=source_id)
+
+@router.post("/lines", response_model=schemas.TripwireLine)
+def create_tripwire_line(line: schemas.TripwireLineCreate, db: Session = Depends(get_db)):
+    if len(line.points) < 2 or any(len(p) != 2 for p in line.points):
+        raise HTTPException(status_code=400, detail="A line needs at least 2 [x, y] points")
+    # Los conteos por línea se llevan por nombre; "principal" es el tripwire clásico de la cámara
+    if line.name == LEGACY_LINE_NAME:
+        raise HTTPException(status_code=400, detail=f"'{LEGACY_LINE_NAME}' is reserved for the camera's main tripwire")
+    if crud.get_tripwire_line_by_name(db, line.source_id, line.name):
+        raise HTTPException(status_code=409, detail=f"This source already has a line named '{line.name}'")
+    if not crud.get_video_source(db, source_id=line.source_id):
+        raise HTTPException(status_code=404, detail="Source not found")
+    # El tracker marca las líneas ya contadas de cada persona en un bitmask de MAX_LINES bits
+    if len(line_configs(crud.get_tripwire_config(db, line.source_id))) >= MAX_LINES:
+        raise HTTPException(status_code=400, detail=f"A source can have at most {MAX_LINES} lines, including the main tripwire")
+    return crud.create_tripwire_line(db, line=line)
+
+@router.delete("/lines/{line_id}")
+def delete_tripwire_line(line_id: int, db: Session = Depends(get_db)):
+    success = crud.delete_tripwire_line(db, line_id=line_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Tripwire line not found")
+    return {"message": "Tripwire line deleted successfully"}
+
+@router.post("/whatif", response_model=schemas.WhatIfResult)
+def what_if_tripwire(request: schemas.WhatIfRequest, db: Session = Depends(get_db)):
+    """
+    Recalcula entradas/salidas de líneas candidatas sobre las trayectorias guardadas
+    de la cámara (por defecto las últimas 24 h), sin volver a correr YOLO.
+    """
+    if not crud.get_video_source(db, source_id=request.source_id):
+        raise HTTPException(status_code=404, detail="Source not found")
+    if request.lines is not None:
+        lines = [l.dict() for l in request.lines]
+    else:
+        config = crud.get_tripwire_config(db, request.source_id)
+        lines = line_configs(config)
+    if not lines or any(len(l["points"]) < 2 or any(len(p) != 2 for p in l["points"]) for l in lines):
+        raise HTTPException(status_code=400, detail="Each line needs at least 2 [x, y] points")
+
+    end = request.end or datetime.datetime.now()
+    start = request.start or end - datetime.timedelta(hours=24)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    t0 = time.time()
+    points = trajectory_store.load(request.source_id, start.timestamp(), end.timestamp())
+    counts = trajectory_store.recount(points, lines, frame_size=trajectory_store.frame_size(request.source_id))
+    return schemas.WhatIfResult(
+        source_id=request.source_id,
+        start=start,
+        end=end,
+        tracks=len(np.unique(points["track"])),
+        points=len(points),
+        lines=[schemas.WhatIfLineCount(name=c["name"], total_in=c["in"], total_out=c["out"]) for c in counts],
+        elapsed_ms=(time.time() - t0) * 1000
+    )
+
 @router.get("/frame/{source_id}")
 def get_source_frame(source_id: int, db: Session = Depends(get_db)):
     db_source = crud.get_video_source(db, source_id=source_id)
@@ -1,3 +1,4 @@
+import json
 from sqlalchemy.orm import Session
 from . import models, schemas
 
@@ -60,6 +61,64 @@ def delete_tripwire(db: Session, source_id: int):
         return True
     return False
 
+def _line_from_db(db_line):
+    # points se guarda como JSON en SQLite; la API lo expone como lista
+    return schemas.TripwireLine(
+        id=db_line.id,
+        source_id=db_line.source_id,
+        name=db_line.name,
+        points=json.loads(db_line.points),
+        direction=db_line.direction,
+        updated_at=db_line.updated_at
+    )
+
+def get_tripwire_lines(db: Session, source_id: int):
+    lines = db.query(models.TripwireLine).filter(models.TripwireLine.source_id == source_id).all()
+    return [_line_from_db(l) for l in lines]
+
+def get_tripwire_line_by_name(db: Session, source_id: int, name: str):
+    return db.query(models.TripwireLine).filter(models.TripwireLine.source_id == source_id,
+                                                models.TripwireLine.name == name).first()
+
+def create_tripwire_line(db: Session, line: schemas.TripwireLineCreate):
+    db_line = models.TripwireLine(
+        source_id=line.source_id,
+        name=line.name,
+        points=json.dumps(line.points),
+        direction=line.direction
+    )
+    db.add(db_line)
+    db.commit()
+    db.refresh(db_line)
+    return _line_from_db(db_line)
+
+def delete_tripwire_line(db: Session, line_id: int):
+    db_line = db.query(models.TripwireLine).filter(models.TripwireLine.id == line_id).first()
+    if db_line:
+        db.delete(db_line)
+        db.commit()
+        return True
+    return False
+
+def get_tripwire_config(db: Session, source_id: int):
+    """
+    Plain dict with the camera's tripwire and extra lines, ready to send to the
+    inference process (SQLAlchemy models can't be pickled). None if nothing is configured.
+    """
+    tripwire = db.query(models.Tripwire).filter(models.Tripwire.source_id == source_id).first()
+    lines = db.query(models.TripwireLine).filter(models.TripwireLine.source_id == source_id).all()
+    if not tripwire and not lines:
+        return None
+
+    config = {'x1': None, 'y1': None, 'x2': None, 'y2': None, 'direction': None}
+    if tripwire:
+        config = {'x1': tripwire.x1, 'y1': tripwire.y1, 'x2': tripwire.x2, 'y2': tripwire.y2, 'direction': tripwire.direction}
+    config['lines'] = [
+        {'name': l.name, 'points': json.loads(l.points), 'direction': l.direction}
+        for l in lines
+    ]
+    return config
+
 def get_camera_schedule(db: Session, source_id: int):
     return db.query(models.CameraSchedule).filter(models.CameraSchedule.source_id == source_id).first()
 
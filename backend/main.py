@@ -17,8 +17,12 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from .database import engine, get_db
 from . import models, schemas, crud
-from .api import ingestion, stream, tripwire, schedule, analytics
+from .api import ingestion, stream, tripwire, schedule, analytics, jobs
 from .scheduler import start_scheduler, stop_scheduler
+from .offline_jobs import cancel_all_jobs
+from .services.async_yolo import prewarm_inference_service, shutdown_inference_service
+from .services.inference_backends import benchmark_on_startup, calibration_clips, required_artifacts
+from .services.model_store import build_before_workers
 
 models.Base.metadata.create_all(bind=engine)
 
@@ -38,6 +42,7 @@ app.include_router(stream.router, prefix="/api/stream", tags=["streaming"])
 app.include_router(tripwire.router, prefix="/api/tripwires", tags=["tripwire"])
 app.include_router(schedule.router, prefix="/api/schedules", tags=["schedules"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["analytics"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["offline-jobs"])
 
 # Static Files
 app.mount("/static", StaticFiles(directory="backend/static"), name="static")
@@ -48,12 +53,19 @@ def read_root():
 
 @app.on_event("startup")
 def startup_event():
+    # Exports ONNX construidos una sola vez, antes de que los workers compitan por hacerlo
+    build_before_workers(required_artifacts(), calibration_clips=calibration_clips())
+    # Los servidores YOLO cargan el modelo ahora y no cuando se abre la primera cámara
+    prewarm_inference_service()
     start_scheduler()
+    benchmark_on_startup()
 
 @app.on_event("shutdown")
 def shutdown_event():
     stop_scheduler()
+    cancel_all_jobs()
     stream.cleanup_all_processes()
+    shutdown_inference_service()
 
 if __name__ == "__main__":
     import uvicorn
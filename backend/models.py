@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, Boolean, CheckConstraint, UniqueConstraint
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -13,6 +13,7 @@ class VideoSource(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     tripwire = relationship("Tripwire", back_populates="source", uselist=False)
+    tripwire_lines = relationship("TripwireLine", back_populates="source")
     schedule = relationship("CameraSchedule", back_populates="source", uselist=False)
 
 class Tripwire(Base):
@@ -29,6 +30,25 @@ class Tripwire(Base):
 
     source = relationship("VideoSource", back_populates="tripwire")
 
+class TripwireLine(Base):
+    """Líneas o polilíneas de conteo adicionales (una cámara puede vigilar varias puertas)."""
+    __tablename__ = "tripwire_lines"
+    # TripwireEngine lleva los conteos por nombre de línea: dos líneas con el mismo nombre compartirían contadores.
+    # En bases ya creadas create_all no agrega las restricciones; la API valida lo mismo al crear.
+    __table_args__ = (
+        UniqueConstraint("source_id", "name", name="uq_tripwire_lines_source_name"),
+        CheckConstraint("direction IN ('IN', 'OUT')", name="ck_tripwire_lines_direction"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_id = Column(Integer, ForeignKey("video_sources.id"), index=True)
+    name = Column(String)
+    points = Column(String) # JSON: [[x, y], ...] normalizados 0-1
+    direction = Column(String) # 'IN' or 'OUT'
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+
+    source = relationship("VideoSource", back_populates="tripwire_lines")
+
 class CameraSchedule(Base):
     __tablename__ = "camera_schedules"
 
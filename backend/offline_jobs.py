@@ -0,0 +1,156 @@
+import datetime
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import threading
+import time
+from .database import SessionLocal
+from . import crud
+from .services import offline_counter
+
+# Mismo log que el scheduler (scheduler.log)
+jobs_logger = logging.getLogger("scheduler")
+
+# Trabajos de conteo offline en memoria (como active_tasks del scheduler); se pierden al reiniciar
+offline_jobs = {}
+_job_ids = itertools.count(1)
+# Un trabajo a la vez: cada uno ya usa todos los núcleos con su pool
+_job_slot = threading.Semaphore(1)
+
+
+class OfflineCountJob(threading.Thread):
+    """
+    Cuenta un archivo completo sin reproducirlo a 1x y guarda los cruces en HistoricoConteo,
+    en bloques de BUCKET_MINUTES con la hora real de la grabación (recorded_at + tiempo del video).
+    """
+    def __init__(self, source_id, source_path, recorded_at=None):
+        super().__init__(daemon=True)
+        self.job_id = next(_job_ids)
+        self.source_id = source_id
+        self.source_path = source_path
+        self.recorded_at = recorded_at
+        ctx = mp.get_context("spawn")
+        self.progress = ctx.Value('q', 0)
+        self.cancel_flag = ctx.Value('b', 0)
+        self.frames_total = 0
+        self.status = "queued"
+        self.error = None
+        self.total_in = 0
+        self.total_out = 0
+        self.duration_sec = 0.0
+        self.created_at = datetime.datetime.now()
+        self.started_at = None
+        self.finished_at = None
+
+    def cancel(self):
+        self.cancel_flag.value = 1
+        if self.status == "queued":
+            self.status = "cancelled"
+
+    def run(self):
+        with _job_slot:
+            if self.cancel_flag.value:
+                self.status = "cancelled"
+                return
+            self.status = "running"
+            self.started_at = datetime.datetime.now()
+            try:
+                self._run()
+            except Exception as e:
+                self.status = "failed"
+                self.error = str(e)
+                jobs_logger.error(f"[OFFLINE] Job {self.job_id} (source {self.source_id}) failed: {e}")
+            finally:
+                self.finished_at = datetime.datetime.now()
+
+    def _run(self):
+        frame_count, fps = offline_counter.probe(self.source_path)
+        self.duration_sec = frame_count / fps
+        self.frames_total = offline_counter.total_frames(self.source_path)
+        if self.recorded_at is None:
+            # Sin hora explícita: asumimos que el archivo conserva su mtime original (fin de la grabación)
+            end = datetime.datetime.fromtimestamp(os.path.getmtime(self.source_path))
+            self.recorded_at = end - datetime.timedelta(seconds=self.duration_sec)
+
+        db = SessionLocal()
+        try:
+            tripwire = crud.get_tripwire_config(db, self.source_id)
+        finally:
+            db.close()
+        if tripwire is None:
+            raise ValueError("Source has no tripwire configured")
+
+        t0 = time.time()
+        events, fps = offline_counter.run_offline_count(self.source_path, tripwire, self.progress, self.cancel_flag)
+        if self.cancel_flag.value:
+            self.status = "cancelled"
+            return
+
+        self._save(events, fps)
+        self.status = "done"
+        jobs_logger.info(f"[OFFLINE] Job {self.job_id}: {self.duration_sec:.0f}s of video in {time.time() - t0:.0f}s, "
+                         f"IN {self.total_in}, OUT {self.total_out}")
+
+    def _save(self, events, fps):
+        bucket_minutes = offline_counter.BUCKET_MINUTES
+        counts = offline_counter.bucket_counts(events, fps, self.recorded_at, bucket_minutes)
+        start = self.recorded_at
+        end = start + datetime.timedelta(seconds=self.duration_sec)
+        # Una fila por bloque de reloj, también los vacíos, para que repetir el trabajo sobrescriba todo
+        bucket = start.replace(minute=start.minute - start.minute % bucket_minutes, second=0, microsecond=0)
+        db = SessionLocal()
+        try:
+            while bucket < end:
+                bucket_end = bucket + datetime.timedelta(minutes=bucket_minutes)
+                opened, closed = max(bucket, start), min(bucket_end, end)
+                total_in, total_out = counts.get(bucket, (0, 0))
+                crud.update_historico_conteo_realtime(
+                    db=db,
+                    source_id=self.source_id,
+                    fecha_registro=opened.strftime("%Y-%m-%d"),
+                    hora_apertura=opened.strftime("%H:%M:%S"),
+                    hora_cierre=closed.strftime("%H:%M:%S"),
+                    total_in=total_in,
+                    total_out=total_out
+                )
+                self.total_in += total_in
+                self.total_out += total_out
+                bucket = bucket_end
+        finally:
+            db.close()
+
+    def to_dict(self):
+        done = min(self.progress.value, self.frames_total)
+        elapsed = ((self.finished_at or datetime.datetime.now()) - self.started_at).total_seconds() if self.started_at else 0
+        fraction = done / self.frames_total if self.frames_total else 0.0
+        return {
+            "job_id": self.job_id,
+            "source_id": self.source_id,
+            "status": self.status,
+            "progress": 1.0 if self.status == "done" else fraction,
+            "frames_done": done,
+            "frames_total": self.frames_total,
+            # Segundos de video procesados por segundo de reloj
+            "speed": (fraction * self.duration_sec / elapsed) if elapsed > 0 else 0.0,
+            "recorded_at": self.recorded_at,
+            "total_in": self.total_in,
+            "total_out": self.total_out,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error
+        }
+
+
+def start_offline_job(source_id, source_path, recorded_at=None):
+    job = OfflineCountJob(source_id, source_path, recorded_at)
+    offline_jobs[job.job_id] = job
+    job.start()
+    jobs_logger.info(f"[OFFLINE] Job {job.job_id} queued for source {source_id}")
+    return job
+
+
+def cancel_all_jobs():
+    for job in offline_jobs.values():
+        job.cancel()
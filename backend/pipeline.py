@@ -0,0 +1,276 @@
+import gc
+import logging
+import os
+import threading
+import time
+import cv2
+from .database import SessionLocal
+from . import crud
+from .services.async_yolo import SERVER_OVERLAYS, MultiprocessYOLO
+from .services.jpeg_hub import JpegHub
+from .services.video_reader import VodClock, open_video_source
+
+# Tipos de suscriptor de un pipeline
+VIEWER = "viewer"
+SCHEDULE = "schedule"
+
+# Probing corto para conectar rápido (visores) y timeouts largos para no cortar el conteo programado
+RTSP_CAPTURE_OPTIONS = "rtsp_transport;tcp|fflags;nobuffer|fflags;discardcorrupt|flags;low_delay|analyzeduration;500000|probesize;50000|stimeout;10000000|rw_timeout;10000000"
+
+# Tope de FPS de inferencia cuando todos los visores tienen la vista oculta y no hay conteo programado
+HIDDEN_VIEWERS_FPS = 1.0
+
+# Mismo logger que api/stream.py (ahí se configura el archivo stream_metrics.log)
+metrics_logger = logging.getLogger("stream_metrics")
+
+
+def get_tripwire_data(source_id):
+    db = SessionLocal()
+    try:
+        return crud.get_tripwire_config(db, source_id=source_id)
+    finally:
+        db.close()
+
+
+class SourcePipeline(threading.Thread):
+    """
+    Un lector de video y una cámara en el servidor de inferencia por fuente, compartidos
+    por los visores en vivo y el conteo programado. Con visores el servidor publica cajas y
+    trails (y los dibuja si SERVER_OVERLAYS) y el lector alimenta también el video en vivo;
+    sin visores pasa a headless. Vive mientras tenga suscriptores (PipelineManager).
+    """
+    def __init__(self, source_id, source_path, is_rtsp):
+        super().__init__(daemon=True)
+        self.source_id = source_id
+        self.source_path = source_path
+        self.is_rtsp = is_rtsp
+        self.refs = {VIEWER: 0, SCHEDULE: 0}
+        # Visores suscritos cuya vista está oculta (pestaña en segundo plano o fuera de pantalla)
+        self.hidden_viewers = 0
+        self.stop_event = threading.Event()
+        self.processor = None
+        # Los visores MJPEG comparten un único JPEG por frame. Sin overlays del servidor el video
+        # sale de los frames del lector a la tasa de los visores, no a la de inferencia
+        self.hub = JpegHub(source_id, reader_frames=not SERVER_OVERLAYS)
+
+    @property
+    def mode(self):
+        return "+".join(kind for kind in (VIEWER, SCHEDULE) if self.refs[kind]) or "idle"
+
+    def run(self):
+        print(f"[PIPELINE-{self.source_id}] Starting ({self.mode})")
+        cap = None
+        try:
+            if self.is_rtsp:
+                os.environ["OPENCV_FFMPEG_LOGLEVEL"] = "-8"
+                os.environ["AV_LOG_LEVEL"] = "-8"
+            cap = open_video_source(self.source_path, self.is_rtsp, self.source_id,
+                                    capture_options=RTSP_CAPTURE_OPTIONS if self.is_rtsp else None)
+            if not cap.isOpened():
+                print(f"[PIPELINE-{self.source_id}] ERROR: No se pudo conectar a la fuente principal {self.source_path}")
+                return
+
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)
+            video_fps = 30.0
+            if not self.is_rtsp:
+                fps_prop = cap.get(cv2.CAP_PROP_FPS)
+                if fps_prop > 0: video_fps = fps_prop
+            clock = VodClock(video_fps)
+
+            # En RTSP los conteos visibles arrancan desde lo ya registrado hoy
+            initial_in, initial_out = 0, 0
+            if self.is_rtsp:
+                try:
+                    db = SessionLocal()
+                    initial_in, initial_out = crud.get_todays_historico_totals(db, self.source_id)
+                    db.close()
+                except Exception: pass
+            frame_count = 0 if self.is_rtsp else int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            self.processor = MultiprocessYOLO(self.source_id, initial_in, initial_out,
+                                              headless=self.refs[VIEWER] == 0, switchable=True,
+                                              vod_path=None if self.is_rtsp else self.source_path, frame_count=frame_count,
+                                              video_fps=video_fps)
+            self.hub.processor = self.processor
+            self.hub.start()
+
+            tripwire_data = None
+            last_tripwire_update = 0
+            frame_idx = 0
+            retrieved = 0
+            demand_view_fps = 0.0
+            while not self.stop_event.is_set():
+                # Sin visores el servidor no dibuja ni devuelve frames
+                self.processor.set_headless(self.refs[VIEWER] == 0)
+                # Solo visores ocultos: basta un mínimo para las instantáneas que reciben
+                idle = self.refs[VIEWER] > 0 and self.refs[SCHEDULE] == 0 and self.hidden_viewers >= self.refs[VIEWER]
+                self.processor.set_rate_cap(HIDDEN_VIEWERS_FPS if idle else None)
+
+                # grab() avanza sin convertir; solo se decodifica a BGR el frame que el servidor va a tomar
+                if not cap.grab():
+                    if not self.is_rtsp:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        clock.restart()
+                        frame_idx = 0
+                    else:
+                        time.sleep(1)
+                    continue
+
+                if time.time() - last_tripwire_update > 5:
+                    tripwire_data = get_tripwire_data(self.source_id)
+                    last_tripwire_update = time.time()
+                    if not self.is_rtsp:
+                        metrics_logger.info(f"[DECODE] Camera {self.source_id}: {retrieved} frames retrieved in the last 5 s, "
+                                            f"{clock.skipped} skipped so far to keep 1x")
+                    if self.hub.subscribers:
+                        metrics_logger.info(f"[ENCODE] Camera {self.source_id}: {self.hub.encoded} JPEGs encoded in the last 5 s "
+                                            f"for {self.hub.subscribers} viewers")
+                    self.hub.encoded = 0
+                    retrieved = 0
+                    demand_view_fps = -1.0
+
+                view_fps = self.hub.view_fps()
+                if view_fps != demand_view_fps:
+                    # El decodificador solo necesita los frames que llega a usar el servidor (inferencia + sondeo
+                    # de movimiento) y los del video en vivo; un visor nuevo no espera al próximo ciclo de 5 s
+                    cap.set_demand(max(self.processor.get_sampling_rate(), view_fps))
+                    demand_view_fps = view_fps
+
+                # En archivos solo se entregan frames de la grilla del caché: cada pasada del bucle muestrea
+                # los mismos frames aunque cambie la tasa (a lo sumo se demora stride-1 frames)
+                infer = self.processor.frame_needed(lead=1.0 / video_fps) and (self.is_rtsp or self.processor.on_cache_grid(frame_idx))
+                view = self.hub.frame_wanted()
+                if infer or view:
+                    success, frame = cap.retrieve()
+                    if success:
+                        retrieved += 1
+                        if infer:
+                            # Índice del frame dentro del archivo (0-based) para reutilizar detecciones en cada vuelta del bucle
+                            self.processor.update_frame(frame, tripwire_data, frame_index=None if self.is_rtsp else frame_idx)
+                        if view:
+                            self.hub.push_frame(frame)
+                frame_idx += 1
+
+                if not self.is_rtsp:
+                    # Reloj virtual 1x: duerme si va adelantado, salta frames si se atrasó
+                    frame_idx = clock.pace(cap, frame_idx)
+        except Exception as e:
+            print(f"[PIPELINE-{self.source_id}] Error: {e}")
+        finally:
+            self.hub.stop()
+            if self.hub.is_alive():
+                # Antes de cerrar el ring de resultados que el hub está leyendo
+                self.hub.join(timeout=2.0)
+            if cap is not None:
+                cap.release()
+            if self.processor is not None:
+                self.processor.stop()
+            gc.collect()
+            print(f"[PIPELINE-{self.source_id}] Finalizado.")
+
+
+class ViewerPresence:
+    """
+    Visibilidad que reporta cada visor del navegador (Page Visibility + IntersectionObserver).
+    Un visor (viewer_id) puede tener varios streams abiertos (video y metadatos); cada uno se
+    registra con el asyncio.Event que espera, y un reporte nuevo los despierta a todos.
+    """
+    def __init__(self):
+        self.viewers = {}
+        self.lock = threading.Lock()
+
+    def join(self, viewer_id, event):
+        with self.lock:
+            entry = self.viewers.setdefault(viewer_id, {"visible": True, "events": set()})
+            entry["events"].add(event)
+
+    def leave(self, viewer_id, event):
+        with self.lock:
+            entry = self.viewers.get(viewer_id)
+            if entry is not None:
+                entry["events"].discard(event)
+                if not entry["events"]:
+                    del self.viewers[viewer_id]
+
+    def is_visible(self, viewer_id):
+        entry = self.viewers.get(viewer_id)
+        return entry is None or entry["visible"]
+
+    def report(self, viewer_id, visible):
+        """Llamar desde el event loop. Retorna False si el visor no tiene streams abiertos."""
+        with self.lock:
+            entry = self.viewers.get(viewer_id)
+            if entry is None:
+                return False
+            entry["visible"] = visible
+            events = list(entry["events"])
+        for event in events:
+            event.set()
+        return True
+
+
+class PipelineManager:
+    """Un SourcePipeline por fuente con vida por conteo de referencias de sus suscriptores."""
+    def __init__(self):
+        self.pipelines = {}
+        self.lock = threading.Lock()
+
+    def _replace(self, source_id, source_path, is_rtsp, previous=None):
+        """Arranca un pipeline nuevo para la fuente conservando los suscriptores del anterior (si sigue vigente)."""
+        refs = previous.refs if previous is not None and not previous.stop_event.is_set() else None
+        pipeline = SourcePipeline(source_id, source_path, is_rtsp)
+        if refs:
+            pipeline.refs.update(refs)
+        self.pipelines[source_id] = pipeline
+        return pipeline
+
+    def acquire(self, source_id, source_path, is_rtsp, kind):
+        with self.lock:
+            pipeline = self.pipelines.get(source_id)
+            if pipeline is None or pipeline.stop_event.is_set() or (pipeline.ident and not pipeline.is_alive()):
+                # Nuevo, o el anterior terminó (p. ej. la fuente no se pudo abrir): se vuelve a intentar
+                pipeline = self._replace(source_id, source_path, is_rtsp, pipeline)
+                pipeline.refs[kind] += 1
+                pipeline.start()
+            else:
+                pipeline.refs[kind] += 1
+            return pipeline
+
+    def revive(self, pipeline):
+        """
+        Pipeline vigente de la fuente de `pipeline`. Si ese pipeline terminó por su cuenta (error de
+        lectura, caída del servidor) y nadie lo reemplazó, arranca uno nuevo con los mismos suscriptores
+        sin sumar referencias. None si la fuente ya no tiene pipeline (se liberó o se detuvo todo).
+        """
+        with self.lock:
+            current = self.pipelines.get(pipeline.source_id)
+            if current is pipeline and not pipeline.stop_event.is_set() and pipeline.ident and not pipeline.is_alive():
+                current = self._replace(pipeline.source_id, pipeline.source_path, pipeline.is_rtsp, pipeline)
+                current.start()
+            return current
+
+    def release(self, source_id, kind):
+        with self.lock:
+            pipeline = self.pipelines.get(source_id)
+            if pipeline is None:
+                return
+            pipeline.refs[kind] = max(0, pipeline.refs[kind] - 1)
+            if not any(pipeline.refs.values()):
+                pipeline.stop_event.set()
+                del self.pipelines[source_id]
+
+    def get(self, source_id):
+        return self.pipelines.get(source_id)
+
+    def items(self):
+        with self.lock:
+            return list(self.pipelines.items())
+
+    def stop_all(self):
+        with self.lock:
+            for pipeline in self.pipelines.values():
+                pipeline.stop_event.set()
+            self.pipelines.clear()
+
+
+pipelines = PipelineManager()
+presence = ViewerPresence()
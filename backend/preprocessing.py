@@ -2,6 +2,28 @@ import cv2
 import numpy as np
 import os
 
+def compute_tripwire_roi(x1, y1, x2, y2, padding=0.25, min_size=0.3):
+    """
+    Normalized ROI [x1, y1, x2, y2] around a tripwire segment: its bounding box
+    grown by `padding` on every side and at least `min_size` wide/tall, so people
+    approaching the line are fully inside the crop. Clamped to the frame.
+    """
+    def _span(a, b):
+        lo, hi = min(a, b) - padding, max(a, b) + padding
+        if hi - lo < min_size:
+            center = (lo + hi) / 2.0
+            lo, hi = center - min_size / 2.0, center + min_size / 2.0
+        # Shift back inside [0, 1] before clamping so the band keeps its size at the borders
+        if lo < 0:
+            hi, lo = hi - lo, 0.0
+        if hi > 1:
+            lo, hi = lo - (hi - 1.0), 1.0
+        return max(0.0, lo), min(1.0, hi)
+
+    rx1, rx2 = _span(x1, x2)
+    ry1, ry2 = _span(y1, y2)
+    return [rx1, ry1, rx2, ry2]
+
 class PreprocessingModule:
     """
     Standardizes and optimizes frames for detection models.
@@ -45,9 +67,13 @@ class PreprocessingModule:
             if key in config:
                 self.config[key] = config[key]
 
-    def _apply_roi(self, frame):
+    def _roi_bounds(self, frame):
+        """
+        Pixel bounds (ix1, iy1, ix2, iy2) of the configured ROI, or None when the
+        ROI is disabled or invalid.
+        """
         if self.config["roi"] is None:
-            return frame
+            return None
         
         h, w = frame.shape[:2]
         x1, y1, x2, y2 = self.config["roi"]
@@ -61,10 +87,29 @@ class PreprocessingModule:
         ix2, iy2 = min(w, ix2), min(h, iy2)
         
         if ix2 <= ix1 or iy2 <= iy1:
+            return None
+            
+        return ix1, iy1, ix2, iy2
+
+    def _apply_roi(self, frame):
+        bounds = self._roi_bounds(frame)
+        if bounds is None:
             return frame # Fallback to full frame if ROI is invalid
             
+        ix1, iy1, ix2, iy2 = bounds
         return frame[iy1:iy2, ix1:ix2]
 
+    def crop_roi(self, frame):
+        """
+        Returns (crop, (offset_x, offset_y)) so detections made on the crop can be
+        mapped back to full-frame coordinates by adding the offset.
+        """
+        bounds = self._roi_bounds(frame)
+        if bounds is None:
+            return frame, (0, 0)
+        ix1, iy1, ix2, iy2 = bounds
+        return frame[iy1:iy2, ix1:ix2], (ix1, iy1)
+
     def _apply_resize(self, frame):
         target_w = self.config["resize"]["width"]
         target_h = self.config["resize"]["height"]
@@ -7,7 +7,7 @@ import os
 from apscheduler.schedulers.background import BackgroundScheduler
 from .database import SessionLocal
 from . import crud, models, schemas
-from .services.async_yolo import MultiprocessYOLO
+from .pipeline import pipelines, SCHEDULE, VIEWER
 
 scheduler_logger = logging.getLogger("scheduler")
 scheduler_logger.setLevel(logging.INFO)
@@ -19,125 +19,116 @@ if not scheduler_logger.handlers:
 active_tasks = {}
 
 class HeadlessStreamTask(threading.Thread):
+    """
+    Suscripción del horario al pipeline compartido de la fuente (pipeline.py). Si ya hay
+    visores mirando la cámara se usa ese mismo lector y tracker; la tarea solo persiste
+    los conteos de su sesión (lo contado desde que arrancó) en el histórico.
+    Si el pipeline muere en medio del horario, la tarea sigue al que lo reemplaza.
+    """
+    # Cada cuánto se leen eventos/conteos del pipeline y se persisten
+    POLL_SEC = 1.0
+
     def __init__(self, source_id, source_path, is_rtsp):
         super().__init__(daemon=True)
         self.source_id = source_id
         self.source_path = source_path
         self.is_rtsp = is_rtsp
         self.stop_event = threading.Event()
-        self.processor = None
+        self.pipeline = None
+        self.baseline = None
+        # Conteos de la sesión acumulados en pipelines anteriores (si hubo que reemplazarlo)
+        self.carried = (0, 0)
         self.start_time_record = datetime.datetime.now()
-        
+
+    @property
+    def processor(self):
+        return self.pipeline.processor if self.pipeline else None
+
+    def save_counts(self, total_in, total_out):
+        db = SessionLocal()
+        try:
+            crud.update_historico_conteo_realtime(
+                db=db,
+                source_id=self.source_id,
+                fecha_registro=self.start_time_record.strftime("%Y-%m-%d"),
+                hora_apertura=self.start_time_record.strftime("%H:%M:%S"),
+                hora_cierre=datetime.datetime.now().strftime("%H:%M:%S"),
+                total_in=total_in,
+                total_out=total_out
+            )
+        finally:
+            db.close()
+
+    def session_counts(self):
+        curr_in, curr_out = self.processor.get_counts()
+        if self.baseline is None:
+            # Los contadores del pipeline pueden traer lo de los visores o el total del día: se cuenta desde aquí
+            self.baseline = (curr_in, curr_out)
+        return (self.carried[0] + curr_in - self.baseline[0],
+                self.carried[1] + curr_out - self.baseline[1])
+
+    def follow_pipeline(self):
+        """
+        Pasa al pipeline vigente de la fuente si el actual murió (se revive con las mismas
+        referencias) o ya fue reemplazado. False si no hay de dónde seguir contando.
+        """
+        current = pipelines.revive(self.pipeline)
+        if current is None:
+            return False
+        if current is not self.pipeline:
+            if self.processor and self.baseline is not None:
+                # El stop() del pipeline viejo dejó sus últimos conteos en el processor
+                self.carried = self.session_counts()
+            scheduler_logger.warning(f"[SCHEDULER] Pipeline of camera {self.source_id} was restarted, following the new one")
+            self.baseline = None
+            self.pipeline = current
+        return True
+
     def run(self):
         scheduler_logger.info(f"[SCHEDULER] Iniciando pipeline headless para fuente {self.source_id}")
-        
-        if self.is_rtsp:
-            os.environ["OPENCV_FFMPEG_LOGLEVEL"] = "-8"
-            os.environ["AV_LOG_LEVEL"] = "-8"
-            os.environ["OPENCV_LOG_LEVEL"] = "SILENT"
-            os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp|fflags;nobuffer|fflags;discardcorrupt|flags;low_delay|stimeout;10000000|rw_timeout;10000000"
-
-        raw_cap = cv2.VideoCapture(self.source_path, cv2.CAP_FFMPEG) if self.is_rtsp else cv2.VideoCapture(self.source_path)
-        from .services.video_reader import VideoReaderWrapper
-        cap = VideoReaderWrapper(raw_cap, is_rtsp=self.is_rtsp)
-        
-        if self.is_rtsp and "OPENCV_FFMPEG_CAPTURE_OPTIONS" in os.environ:
-            del os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"]
+        self.pipeline = pipelines.acquire(self.source_id, self.source_path, self.is_rtsp, SCHEDULE)
+        if self.pipeline.refs[VIEWER]:
+            scheduler_logger.info(f"[SCHEDULER] Camera {self.source_id} already open for live viewers, sharing its pipeline")
 
-        if not cap.isOpened():
-            scheduler_logger.error(f"[SCHEDULER] No se pudo abrir la fuente {self.source_id}")
-            return
-            
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, 2)
-        
-        self.processor = MultiprocessYOLO(self.source_id)
-        
-        last_tripwire_update = 0
-        tw_dict = None
-        
         last_saved_in = -1
         last_saved_out = -1
-        
-        while not self.stop_event.is_set():
-            success, frame = cap.read()
-            if not success:
-                if not self.is_rtsp:
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        try:
+            while not self.stop_event.wait(self.POLL_SEC):
+                if not self.processor:
+                    if not self.pipeline.is_alive() and self.pipeline.ident:
+                        scheduler_logger.error(f"[SCHEDULER] No se pudo abrir la fuente {self.source_id}")
+                        break
                     continue
-                else:
-                    time.sleep(1)
+                if not self.pipeline.is_alive() or pipelines.get(self.source_id) is not self.pipeline:
+                    if not self.follow_pipeline():
+                        scheduler_logger.error(f"[SCHEDULER] Camera {self.source_id} has no pipeline anymore")
+                        break
                     continue
-            
-            curr_time = time.time()
-            if curr_time - last_tripwire_update > 5:
-                db = SessionLocal()
-                tripwire_data = crud.get_tripwire(db, self.source_id)
-                db.close()
-                if tripwire_data:
-                    tw_dict = {
-                        'x1': tripwire_data.x1, 'y1': tripwire_data.y1,
-                        'x2': tripwire_data.x2, 'y2': tripwire_data.y2,
-                        'direction': tripwire_data.direction
-                    }
-                last_tripwire_update = curr_time
-                
-            self.processor.update_frame(frame, tw_dict)
-            self.processor.get_latest_processed_frame(frame)
-            
-            # Real-time synchronization
-            curr_in, curr_out = self.processor.get_counts()
-            if curr_in != last_saved_in or curr_out != last_saved_out:
+                for track_id, direction, ts in self.processor.poll_events():
+                    scheduler_logger.info(f"[SCHEDULER] Camera {self.source_id}: track {track_id} crossed {direction}")
+
+                # Real-time synchronization
+                curr_in, curr_out = self.session_counts()
+                if curr_in != last_saved_in or curr_out != last_saved_out:
+                    try:
+                        self.save_counts(curr_in, curr_out)
+                        last_saved_in = curr_in
+                        last_saved_out = curr_out
+                    except Exception as e:
+                        scheduler_logger.error(f"[SCHEDULER] Error saving realtime count for camera {self.source_id}: {e}")
+        finally:
+            # Cleanup and Save History
+            scheduler_logger.info(f"[SCHEDULER] Deteniendo pipeline headless para fuente {self.source_id}")
+            if self.processor and self.baseline is not None:
+                # Guardamos historial final asegurándonos que quede asentado
+                total_in, total_out = self.session_counts()
                 try:
-                    db = SessionLocal()
-                    curr_datetime = datetime.datetime.now()
-                    crud.update_historico_conteo_realtime(
-                        db=db,
-                        source_id=self.source_id,
-                        fecha_registro=self.start_time_record.strftime("%Y-%m-%d"),
-                        hora_apertura=self.start_time_record.strftime("%H:%M:%S"),
-                        hora_cierre=curr_datetime.strftime("%H:%M:%S"),
-                        total_in=curr_in,
-                        total_out=curr_out
-                    )
-                    db.close()
-                    last_saved_in = curr_in
-                    last_saved_out = curr_out
+                    self.save_counts(total_in, total_out)
+                    scheduler_logger.info(f"[SCHEDULER] Historial finalizado: IN {total_in}, OUT {total_out}")
                 except Exception as e:
-                    scheduler_logger.error(f"[SCHEDULER] Error saving realtime count for camera {self.source_id}: {e}")
-            
-            if not self.is_rtsp:
-                time.sleep(0.033)
-                
-        # Cleanup and Save History
-        scheduler_logger.info(f"[SCHEDULER] Deteniendo pipeline headless para fuente {self.source_id}")
-        cap.release()
-        
-        if self.processor:
-            total_in, total_out = self.processor.get_counts()
-            self.processor.stop()
-            
-        import gc
-        gc.collect()
-            
-        if self.processor:
-            # Guardamos historial final asegurándonos que quede asentado
-            db = SessionLocal()
-            end_time_record = datetime.datetime.now()
-            try:
-                crud.update_historico_conteo_realtime(
-                    db=db,
-                    source_id=self.source_id,
-                    fecha_registro=self.start_time_record.strftime("%Y-%m-%d"),
-                    hora_apertura=self.start_time_record.strftime("%H:%M:%S"),
-                    hora_cierre=end_time_record.strftime("%H:%M:%S"),
-                    total_in=total_in,
-                    total_out=total_out
-                )
-                scheduler_logger.info(f"[SCHEDULER] Historial finalizado: IN {total_in}, OUT {total_out}")
-            except Exception as e:
-                scheduler_logger.error(f"[SCHEDULER] Error guardando historial final: {e}")
-            finally:
-                db.close()
+                    scheduler_logger.error(f"[SCHEDULER] Error guardando historial final: {e}")
+            # El pipeline sigue vivo si quedan visores
+            pipelines.release(self.source_id, SCHEDULE)
 
 def check_schedules():
     """Esta función es llamada cada minuto por APScheduler"""
@@ -209,9 +200,5 @@ def stop_scheduler():
         scheduler.shutdown(wait=False)
         for source_id, task in list(active_tasks.items()):
             task.stop_event.set()
-            if task.processor:
-                try:
-                    task.processor.stop()
-                except Exception:
-                    pass
+            task.join(timeout=2.0)
         scheduler = None
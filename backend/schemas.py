@@ -1,6 +1,9 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
+
+# Sentido que cuenta como entrada al cruzar una línea
+Direction = Literal["IN", "OUT"]
 
 class VideoSourceBase(BaseModel):
     name: str
@@ -23,7 +26,7 @@ class TripwireBase(BaseModel):
     y1: float
     x2: float
     y2: float
-    direction: str
+    direction: Direction
 
 class TripwireCreate(TripwireBase):
     source_id: int
@@ -39,6 +42,22 @@ class Tripwire(TripwireBase):
     class Config:
         orm_mode = True
 
+class TripwireLineBase(BaseModel):
+    name: str
+    points: List[List[float]] # [[x, y], ...] normalizados 0-1, mínimo 2 puntos
+    direction: Direction
+
+class TripwireLineCreate(TripwireLineBase):
+    source_id: int
+
+class TripwireLine(TripwireLineBase):
+    id: int
+    source_id: int
+    updated_at: datetime
+
+    class Config:
+        orm_mode = True
+
 class CameraScheduleBase(BaseModel):
     monday: bool = True
     tuesday: bool = True
@@ -80,3 +99,45 @@ class HistoricoConteo(HistoricoConteoBase):
 
     class Config:
         orm_mode = True
+
+class OfflineJobCreate(BaseModel):
+    source_id: int
+    # Hora real en que empieza la grabación; si falta se estima con el mtime del archivo
+    recorded_at: Optional[datetime] = None
+
+class OfflineJob(BaseModel):
+    job_id: int
+    source_id: int
+    status: str # 'queued', 'running', 'done', 'failed' or 'cancelled'
+    progress: float
+    frames_done: int
+    frames_total: int
+    speed: float # segundos de video por segundo de reloj
+    recorded_at: Optional[datetime] = None
+    total_in: int
+    total_out: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+
+class WhatIfRequest(BaseModel):
+    source_id: int
+    # Líneas candidatas; si faltan se usan las configuradas hoy (para comparar)
+    lines: Optional[List[TripwireLineBase]] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+class WhatIfLineCount(BaseModel):
+    name: Optional[str] = None
+    total_in: int
+    total_out: int
+
+class WhatIfResult(BaseModel):
+    source_id: int
+    start: datetime
+    end: datetime
+    tracks: int
+    points: int
+    lines: List[WhatIfLineCount]
+    elapsed_ms: float
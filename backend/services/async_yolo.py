@@ -1,207 +1,719 @@
 import multiprocessing as mp
+import os
+import queue
+import threading
 import time
+import uuid
+import cv2
 import numpy as np
 
+from ..preprocessing import PreprocessingModule, compute_tripwire_roi
+from .motion_gate import MotionGate
+from .rate_controller import AdaptiveRateController, CpuSaturationSampler
+from .detection_cache import DetectionCache, cache_key, cache_stride, file_key, on_grid
+from .trajectory_store import TrajectoryWriter
+from .shm_transport import SharedFrameRing
+from .tripwire_engine import line_configs
+
+# Pool de servidores de inferencia pre-calentados (un modelo y un pool de hilos cada uno).
+# Se arrancan al iniciar la API y las cámaras se les asignan/devuelven sin matar procesos.
+# Tamaño según núcleos: cada servidor recibe WORKER_THREADS hilos de inferencia.
+WORKER_THREADS = 4
+INFERENCE_SERVERS = max(1, (os.cpu_count() or 2) // WORKER_THREADS)
+# Estados de cámara libres que cada servidor conserva para reutilizar en la siguiente alta
+SPARE_CAMERAS = 8
+# Target 12 FPS per camera to significantly reduce CPU usage when multiple cameras run.
+# El AdaptiveRateController mueve la inferencia de cada cámara entre MIN_FPS y MAX_FPS según la escena y la carga.
+MIN_FPS = float(os.environ.get("INFERENCE_MIN_FPS", "2.0"))
+MAX_FPS = max(MIN_FPS, float(os.environ.get("INFERENCE_MAX_FPS", "15.0")))
+TARGET_FPS = min(max(float(os.environ.get("INFERENCE_TARGET_FPS", "12.0")), MIN_FPS), MAX_FPS)
+# Entre inferencias el servidor toma frames a esta tasa solo para el MotionGate (un resize a 160 px).
+# Es independiente de MIN_FPS: con la escena vacía la inferencia baja al piso, pero el movimiento
+# se detecta en ~1/MOTION_PROBE_FPS s
+MOTION_PROBE_FPS = float(os.environ.get("MOTION_PROBE_FPS", "10.0"))
+# Máximo de frames (uno por cámara) agrupados en un mismo forward pass
+MAX_BATCH_SIZE = 8
+# Detectar solo en la franja alrededor del tripwire: a igual imgsz, las personas cerca de la línea se ven más grandes
+TRIPWIRE_ROI = True
+# Archivos de video en bucle: reutilizar las detecciones de pasadas anteriores (services/detection_cache.py)
+DETECTION_CACHE = True
+# Guardar las trayectorias de cada cámara para recalcular conteos con otras líneas (what-if)
+TRAJECTORIES = True
+# Dibujar cajas/IDs/trails/línea/HUD en el servidor. Por defecto no: el navegador los dibuja sobre un canvas
+# con los metadatos de /api/stream/meta/{id}, el video en vivo sale directo del lector (JpegHub con
+# reader_frames) y el servidor solo devuelve metadatos
+SERVER_OVERLAYS = os.environ.get("SERVER_OVERLAYS", "0") == "1"
+
+NO_DETECTIONS = np.zeros((0, 6), dtype=np.float32)
+# Si los metadatos de un resultado no entran en el ring se publican al menos estos: el conteo
+# headless (poll_events, scheduler) depende de los eventos; cajas y trails se pueden perder
+RESULT_ESSENTIAL_KEYS = ("ts", "entry_count", "exit_count", "line_counts", "events", "orig_shape")
+
+# Posiciones de los contadores dentro de la cabecera del ring de resultados
+ENTRY_COUNTER = 0
+EXIT_COUNTER = 1
+RATE_COUNTER = 2 # FPS de inferencia actual x100
+DUE_COUNTER = 3 # Momento (epoch en ms) en que el servidor tomará el próximo frame de esta cámara
+SAMPLE_COUNTER = 4 # FPS a los que el servidor toma frames (inferencia o sondeo de movimiento) x100
+
 class DummyTripwire:
     pass
 
-def yolo_worker(frame_queue, result_queue, source_id, entry_counter=None, exit_counter=None, initial_in=0, initial_out=0):
+def tripwire_from_dict(tripwire_data):
+    """
+    tripwire_data llega como diccionario plano, porque los modelos SQLAlchemy no se pueden serializar.
+    """
+    if not tripwire_data or (tripwire_data.get('x1') is None and not tripwire_data.get('lines')):
+        return None
+    tw_obj = DummyTripwire()
+    tw_obj.x1 = tw_obj.y1 = tw_obj.x2 = tw_obj.y2 = None
+    if tripwire_data.get('x1') is not None:
+        tw_obj.x1 = float(tripwire_data.get('x1', 0.0) or 0.0)
+        tw_obj.y1 = float(tripwire_data.get('y1', 0.0) or 0.0)
+        tw_obj.x2 = float(tripwire_data.get('x2', 0.0) or 0.0)
+        tw_obj.y2 = float(tripwire_data.get('y2', 0.0) or 0.0)
+    tw_obj.direction = tripwire_data.get('direction', 'any') or 'any'
+    # Líneas / polilíneas adicionales de la cámara (ver TripwireEngine)
+    tw_obj.lines = tripwire_data.get('lines') or []
+    return tw_obj
+
+
+class _ServerCamera:
+    """
+    Estado de una cámara dentro del proceso servidor: rings adjuntos + tracker propio.
+    Se presta a una fuente con lease() y al darla de baja se devuelve con release();
+    el servidor la guarda para la siguiente alta en vez de volver a crearla.
+    """
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.tracker.trajectories = TrajectoryWriter() if TRAJECTORIES else None
+        self.buffer = np.empty(0, dtype=np.uint8)
+        self.frame_ring = None
+        self.result_ring = None
+        self.cache = None
+
+    def lease(self, handle, source_id, frame_ring, result_ring, headless=False, vod=None, model_key=None):
+        """Asigna la cámara a una fuente; tracker, conteos y control de tasa empiezan de cero."""
+        self.handle = handle
+        self.source_id = source_id
+        self.headless = headless
+        self.frame_ring = frame_ring
+        self.result_ring = result_ring
+        self.tracker.reset(
+            entry_count=int(result_ring.counters[ENTRY_COUNTER]),
+            exit_count=int(result_ring.counters[EXIT_COUNTER])
+        )
+        if self.tracker.trajectories is not None:
+            self.tracker.trajectories.reset(source_id)
+        # Buffer propio: el tracker dibuja encima, así que no trabajamos sobre el slot compartido
+        if len(self.buffer) < frame_ring.frame_bytes:
+            self.buffer = np.empty(frame_ring.frame_bytes, dtype=np.uint8)
+        self.last_seq = 0
+        self.next_due = 0.0
+        # Próximo sondeo de movimiento (independiente de la tasa de inferencia)
+        self.next_probe = 0.0
+        # Evita correr YOLO mientras la franja del tripwire esté vacía y quieta
+        self.gate = MotionGate()
+        self.preprocessing = PreprocessingModule()
+        self.roi_key = None
+        self.rate = AdaptiveRateController(min_fps=MIN_FPS, max_fps=MAX_FPS, initial_fps=TARGET_FPS)
+        # vod = (clave del archivo, total de frames, stride del caché) para fuentes de archivo; None en RTSP
+        self.vod = vod if DETECTION_CACHE else None
+        self.model_key = model_key
+        self.cache_id = None
+
+    @property
+    def probe_interval(self):
+        # Con overlays del servidor los sondeos también son el video en vivo: no bajan de TARGET_FPS
+        # aunque la inferencia esté en el piso
+        fps = max(MOTION_PROBE_FPS, TARGET_FPS) if SERVER_OVERLAYS and not self.headless else MOTION_PROBE_FPS
+        # Con tope de FPS (visores ocultos) tampoco se sondea más rápido que el tope
+        return 1.0 / min(fps, self.rate.max_fps)
+
+    def publish_due(self):
+        """Publica cuándo el servidor tomará el próximo frame (inferencia o sondeo) para que el lector lo decodifique."""
+        self.result_ring.counters[DUE_COUNTER] = int(min(self.next_due, self.next_probe) * 1000)
+
+    def _update_roi(self, tw_obj):
+        key = None
+        if TRIPWIRE_ROI:
+            # Caja envolvente de todas las líneas de la cámara
+            points = [p for line in line_configs(tw_obj) for p in line["points"]]
+            if points:
+                xs, ys = [p[0] for p in points], [p[1] for p in points]
+                key = (min(xs), min(ys), max(xs), max(ys))
+        if key != self.roi_key:
+            self.roi_key = key
+            self.preprocessing.set_config({"roi": compute_tripwire_roi(*key) if key else None})
+
+    def crop_for_inference(self, frame, tw_obj):
+        """Recorta la región alrededor del tripwire. Retorna (recorte, (offset_x, offset_y))."""
+        self._update_roi(tw_obj)
+        return self.preprocessing.crop_roi(frame)
+
+    def detection_cache(self, frame, tw_obj):
+        """Caché de detecciones para este archivo, modelo, tamaño de frame y ROI actuales (None si no aplica)."""
+        if self.vod is None:
+            return None
+        self._update_roi(tw_obj)
+        file_id, frame_count, stride = self.vod
+        cache_id = cache_key(file_id, *self.model_key, frame.shape[:2], self.roi_key, stride)
+        if cache_id != self.cache_id:
+            if self.cache is not None:
+                self.cache.close()
+            self.cache_id = cache_id
+            self.cache = DetectionCache(cache_id, frame_count, info={"model": self.model_key, "roi": self.roi_key}, stride=stride)
+        return self.cache
+
+    def release(self):
+        self.frame_ring.close()
+        self.result_ring.close()
+        self.frame_ring = self.result_ring = None
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+        if self.tracker.trajectories is not None:
+            self.tracker.trajectories.close()
+
+
+def _apply_control(control_queue, cameras, spare, tracker_config, server_id, model_key=None):
+    """Procesa altas/bajas de cámaras enviadas por el proceso web."""
+    from .detection import CameraTracker
+
+    while True:
+        try:
+            msg = control_queue.get_nowait()
+        except queue.Empty:
+            return
+        action, handle = msg[0], msg[1]
+        if action == 'attach':
+            _, _, source_id, frame_spec, result_spec, headless, vod = msg
+            try:
+                frame_ring = SharedFrameRing.attach(frame_spec)
+                result_ring = SharedFrameRing.attach(result_spec)
+            except FileNotFoundError:
+                # El cliente se detuvo antes de que procesáramos su alta
+                continue
+            # El tracker sigue al backend que realmente cargó (puede no ser DETECTION_ENGINE si hubo fallback)
+            engine = model_key[0] if model_key else None
+            cam = spare.pop() if spare else _ServerCamera(CameraTracker(tracker_config=tracker_config, engine=engine))
+            cam.lease(handle, source_id, frame_ring, result_ring, headless, vod, model_key)
+            cameras[handle] = cam
+            mode = "headless" if headless else "annotated"
+            print(f"[YOLO-SERVER-{server_id}] Camera {source_id} attached, {mode} ({len(cameras)} active)")
+        elif action == 'mode':
+            # Un mismo pipeline pasa de headless a anotado (y viceversa) según haya visores
+            cam = cameras.get(handle)
+            if cam is not None:
+                cam.headless = msg[2]
+                mode = "headless" if cam.headless else "annotated"
+                print(f"[YOLO-SERVER-{server_id}] Camera {cam.source_id} switched to {mode}")
+        elif action == 'rate_cap':
+            # Todos los visores tienen la vista oculta: la cámara baja a un mínimo de FPS
+            cam = cameras.get(handle)
+            if cam is not None:
+                cap = msg[2]
+                cam.rate.max_fps = cap or MAX_FPS
+                cam.rate.min_fps = min(MIN_FPS, cap) if cap else MIN_FPS
+                cam.rate.fps = min(cam.rate.fps, cam.rate.max_fps)
+                print(f"[YOLO-SERVER-{server_id}] Camera {cam.source_id} rate cap {cap or 'off'}")
+        elif action == 'detach':
+            cam = cameras.pop(handle, None)
+            if cam is not None:
+                cam.release()
+                if len(spare) < SPARE_CAMERAS:
+                    spare.append(cam)
+                print(f"[YOLO-SERVER-{server_id}] Camera {cam.source_id} detached ({len(cameras)} active)")
+
+
+def _publish(cam, frame, detections, tw_obj, server_id):
+    try:
+        # En modo headless no se dibuja nada ni se devuelve el frame: solo conteos y eventos.
+        # Sin SERVER_OVERLAYS el frame vuelve limpio y el navegador dibuja con los metadatos
+        annotated, metadata = cam.tracker.process(frame, detections, tw_obj, render=not cam.headless, draw=SERVER_OVERLAYS)
+        cam.result_ring.counters[ENTRY_COUNTER] = cam.tracker.entry_count
+        cam.result_ring.counters[EXIT_COUNTER] = cam.tracker.exit_count
+        # Publicar resultado: el frame anotado se copia directo al slot compartido. Sin overlays del
+        # servidor los visores ven los frames del lector y aquí solo viajan los metadatos
+        cam.result_ring.write(annotated if SERVER_OVERLAYS else None, metadata, essential=RESULT_ESSENTIAL_KEYS)
+    except Exception as e:
+        import traceback
+        print(f"[YOLO-SERVER-{server_id}] Camera {cam.source_id} exception: {e}")
+        traceback.print_exc()
+
+
+def _publish_probe(cam, frame, tw_obj, server_id):
+    """Frame de sondeo para los visores: el último overlay sobre el frame nuevo, sin avanzar el tracker."""
+    try:
+        annotated, metadata = cam.tracker.overlay(frame, tw_obj, draw=SERVER_OVERLAYS)
+        cam.result_ring.write(annotated, metadata, essential=RESULT_ESSENTIAL_KEYS)
+    except Exception as e:
+        print(f"[YOLO-SERVER-{server_id}] Camera {cam.source_id} probe publish exception: {e}")
+
+
+def _schedule_next(cam, loop_start, latency, cpu_saturation):
+    fps = cam.rate.update(latency, cpu_saturation, len(cam.tracker.tracks), cam.tracker.approach_speed,
+                          motion=cam.gate.motion)
+    cam.result_ring.counters[RATE_COUNTER] = int(fps * 100)
+    cam.result_ring.counters[SAMPLE_COUNTER] = int(max(fps, 1.0 / cam.probe_interval) * 100)
+    cam.next_due = loop_start + cam.rate.interval
+    cam.next_probe = loop_start + cam.probe_interval
+    cam.publish_due()
+
+
+def inference_server(control_queue, stop_event, server_id, num_threads):
     """
-    Este Worker corre en su *propio proceso* (núcleo de CPU).
-    Mantiene su propia instancia del detector YOLO para evadir el GIL de Python.
+    Este Worker corre en su *propio proceso* y atiende a varias cámaras a la vez.
+    Recoge el frame más reciente de cada cámara activa, los procesa en un único
+    forward pass (el ONNX se exporta con dynamic=True) y entrega cada resultado
+    al tracker/tripwire propio de esa cámara.
     """
-    import os
-    os.environ["OMP_NUM_THREADS"] = "2"
-    os.environ["OPENBLAS_NUM_THREADS"] = "2"
-    os.environ["MKL_NUM_THREADS"] = "2"
-    
-    # Target 12 FPS to significantly reduce CPU usage when multiple cameras run
-    target_fps = 12.0
-    frame_interval = 1.0 / target_fps
-    
-    # Mantendremos la memoria de la última detección para devolverla rápido si no hay nuevo frame
-    last_processed_frame = None
-    
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    os.environ["OPENBLAS_NUM_THREADS"] = str(num_threads)
+    os.environ["MKL_NUM_THREADS"] = str(num_threads)
+
+    cameras = {}
+    spare = []
+    cpu_sampler = CpuSaturationSampler()
+
     try:
-        import torch
-        torch.set_num_threads(2)
-        import cv2
-        cv2.setNumThreads(2)
-        
-        from .detection import YoloDetector # Import lazy para no inicializar CUDA/MPS en proceso padre
-        detector = YoloDetector()
-        
-        detector.entry_count = initial_in
-        detector.exit_count = initial_out
+        try:
+            import torch
+            torch.set_num_threads(num_threads)
+        except ImportError:
+            # Motor ONNX nativo: no hay PyTorch en el despliegue
+            pass
+        cv2.setNumThreads(num_threads)
+
+        from .detection import CameraTracker, audit_single_model, get_detector, load_tracker_config # Import lazy para no inicializar CUDA/MPS en proceso padre
+        detector = get_detector(num_threads=num_threads)
+        audit_single_model(f"YOLO-SERVER-{server_id}")
+        tracker_config = load_tracker_config()
+        model_key = (detector.engine_name, detector.inference_size)
+        # Estados de cámara listos antes de la primera alta (el tracker ya importado y construido)
+        spare.extend(_ServerCamera(CameraTracker(tracker_config=tracker_config, engine=detector.engine_name)) for _ in range(2))
+        print(f"[YOLO-SERVER-{server_id}] Ready")
     except Exception as e:
         import traceback
         print(f"Init Error: {e}")
         return
 
-    while True:
+    while not stop_event.is_set():
         try:
-            # Obtiene el frame más reciente. Bloquea hasta tener algo que hacer.
-            data = frame_queue.get()
-            if data is None:
-                break # Señal de apagado
-            
+            _apply_control(control_queue, cameras, spare, tracker_config, server_id, model_key)
+
+            # Las cámaras que llevan más tiempo esperando entran primero al batch
+            now = time.time()
+            for cam in cameras.values():
+                if cam.tracker.trajectories is not None:
+                    # Escena quieta: append() no vuelve a correr, pero el what-if necesita los últimos puntos
+                    cam.tracker.trajectories.maybe_flush(now)
+            batch = []
+            idle = []
+            replay = []
+            for cam in sorted(cameras.values(), key=lambda c: min(c.next_due, c.next_probe)):
+                if len(batch) >= MAX_BATCH_SIZE:
+                    break
+                due = now >= cam.next_due
+                if (not due and now < cam.next_probe) or cam.frame_ring.latest_seq <= cam.last_seq:
+                    continue
+                seq, frame, tripwire_data = cam.frame_ring.read_latest(cam.last_seq, out=cam.buffer)
+                if frame is None:
+                    continue
+                cam.last_seq = seq
+                tw_obj = tripwire_from_dict(tripwire_data)
+                motion = None
+                if not due:
+                    # Sondeo entre inferencias: solo el MotionGate; con movimiento se infiere ya mismo
+                    motion = cam.gate.has_motion(frame, tw_obj)
+                    if not motion:
+                        if SERVER_OVERLAYS and not cam.headless:
+                            _publish_probe(cam, frame, tw_obj, server_id)
+                        cam.next_probe = now + cam.probe_interval
+                        cam.publish_due()
+                        continue
+                frame_index = tripwire_data.get('frame_index') if tripwire_data else None
+                cache = cam.detection_cache(frame, tw_obj) if frame_index is not None else None
+                cached = cache.get(frame_index) if cache is not None else None
+                if cached is not None:
+                    # Frame ya visto en una pasada anterior del archivo: sin inferencia
+                    replay.append((cam, frame, tw_obj, cached))
+                elif cam.gate.should_infer(frame, tw_obj, active_tracks=len(cam.tracker.tracks), now=now, motion=motion):
+                    crop, offset = cam.crop_for_inference(frame, tw_obj)
+                    batch.append((cam, frame, tw_obj, crop, offset, cache, frame_index))
+                else:
+                    idle.append((cam, frame, tw_obj))
+
+            if not batch and not idle and not replay:
+                time.sleep(0.002)
+                continue
+
             loop_start = time.time()
-            frame, tripwire_data = data
-            
-            # Procesar el frame (Aproximadamente 100-200ms en CPU)
-            # tripwire_data will arrive as a raw dictionary over the Queue, because SQLAlchemy models fail Pickling.
-            tw_obj = None
-            if tripwire_data and tripwire_data.get('x1') is not None:
-                tw_obj = DummyTripwire()
-                tw_obj.x1 = float(tripwire_data.get('x1', 0.0) or 0.0)
-                tw_obj.y1 = float(tripwire_data.get('y1', 0.0) or 0.0)
-                tw_obj.x2 = float(tripwire_data.get('x2', 0.0) or 0.0)
-                tw_obj.y2 = float(tripwire_data.get('y2', 0.0) or 0.0)
-                tw_obj.direction = tripwire_data.get('direction', 'any') or 'any'
-                
-            res = detector.process_frame(frame, source_id, tw_obj)
-            if isinstance(res, tuple):
-                last_processed_frame, metadata = res
-            else:
-                last_processed_frame, metadata = res, {}
-            
-            if entry_counter is not None and exit_counter is not None:
-                entry_counter.value = detector.entry_count
-                exit_counter.value = detector.exit_count
-            
-            # Enviar resultado de vuelta
-            # Vaciamos la cola de resultados vieja para asegurar insertar el último
-            while not result_queue.empty():
-                try:
-                    result_queue.get_nowait()
-                except Exception:
-                    pass
-            
-            result_queue.put((last_processed_frame, metadata))
-            
-            # Limitar FPS para evitar saturar el CPU al 100%
-            elapsed = time.time() - loop_start
-            sleep_time = frame_interval - elapsed
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-                
-        except (KeyboardInterrupt, EOFError, BrokenPipeError, FileNotFoundError):
+            # Un solo forward pass para todas las cámaras listas (Aproximadamente 100-200ms en CPU)
+            detections = detector.detect([crop for _, _, _, crop, _, _, _ in batch]) if batch else []
+
+            latency = time.time() - loop_start
+            cpu_saturation = cpu_sampler.sample()
+
+            for (cam, frame, tw_obj, _, offset, cache, frame_index), dets in zip(batch, detections):
+                if offset != (0, 0) and len(dets):
+                    # Volver a coordenadas del frame completo para el tracker, el cruce y los overlays
+                    dets[:, [0, 2]] += offset[0]
+                    dets[:, [1, 3]] += offset[1]
+                if cache is not None:
+                    cache.put(frame_index, dets)
+                _publish(cam, frame, dets, tw_obj, server_id)
+                # Limitar FPS por cámara para evitar saturar el CPU al 100%
+                _schedule_next(cam, loop_start, latency, cpu_saturation)
+
+            # Escena vacía y quieta: el tracker avanza con cero detecciones (envejece las pistas
+            # perdidas igual que con inferencia) y los visores siguen recibiendo el frame.
+            for cam, frame, tw_obj in idle:
+                _publish(cam, frame, NO_DETECTIONS, tw_obj, server_id)
+                _schedule_next(cam, loop_start, 0.0, cpu_sampler.sample())
+
+            # Detecciones cacheadas: el tracker las recibe igual que si vinieran del modelo
+            for cam, frame, tw_obj, cached in replay:
+                _publish(cam, frame, cached, tw_obj, server_id)
+                _schedule_next(cam, loop_start, 0.0, cpu_sampler.sample())
+
+        except (KeyboardInterrupt, EOFError, BrokenPipeError):
             # The parent process died or queue was closed. Exit gracefully.
             break
         except Exception as e:
             import traceback
-            print(f"!!! CRASH IN YOLO WORKER !!!")
-            print(f"[YOLO-WORKER-{source_id}] Exception: {e}")
+            print(f"!!! CRASH IN YOLO SERVER !!!")
+            print(f"[YOLO-SERVER-{server_id}] Exception: {e}")
             traceback.print_exc()
             time.sleep(0.5)
 
     # Cleanup phase when breaking out of loop
-    print(f"[YOLO-WORKER-{source_id}] Cleaning up detector memory...")
+    print(f"[YOLO-SERVER-{server_id}] Cleaning up detector memory...")
     try:
+        for cam in cameras.values():
+            cam.release()
+        cameras.clear()
+        spare.clear()
         if 'detector' in locals() and detector is not None:
+            from .detection import release_detectors
+            release_detectors()
             if hasattr(detector, 'model') and detector.model is not None:
                 del detector.model
             del detector
-            
+
         import gc
         gc.collect()
     except Exception as e:
-        print(f"[YOLO-WORKER-{source_id}] Cleanup Error: {e}")
+        print(f"[YOLO-SERVER-{server_id}] Cleanup Error: {e}")
+
+
+class _ServerHandle:
+    def __init__(self, server_id, num_threads):
+        self.server_id = server_id
+        self.num_threads = num_threads
+        self.control_queue = None
+        self.stop_event = None
+        self.process = None
+        self.clients = {}
+
+    def ensure_running(self):
+        if self.process is not None and self.process.is_alive():
+            return False
+        self.control_queue = mp.Queue()
+        self.stop_event = mp.Event()
+        self.process = mp.Process(
+            target=inference_server,
+            args=(self.control_queue, self.stop_event, self.server_id, self.num_threads),
+            daemon=True
+        )
+        self.process.start()
+        print(f"[YOLO-PROCESS] Inference server {self.server_id} started (pid {self.process.pid}, {self.num_threads} threads)")
+        return True
+
+    def send_attach(self, client):
+        self.control_queue.put(('attach', client.handle, client.source_id, client.frame_ring.spec(), client.result_ring.spec(), client.headless, client.vod))
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.stop_event.set()
+            self.process.join(timeout=2.0)
+            if self.process.is_alive():
+                print(f"[YOLO-PROCESS] Process {self.process.pid} still alive, sending SIGKILL")
+                self.process.kill()
+                self.process.join(timeout=1.0)
+        except Exception as e:
+            print(f"[YOLO-PROCESS] Error terminando proceso: {e}")
+        try:
+            self.control_queue.close()
+            self.control_queue.cancel_join_thread()
+        except Exception:
+            pass
+        self.process = None
+
+
+class InferenceService:
+    """
+    Servicio de inferencia compartido: reparte las cámaras activas entre
+    INFERENCE_SERVERS procesos, cada uno con una sola copia del modelo.
+    prewarm() los arranca al iniciar la API, así abrir una cámara o cruzar un
+    límite de horario solo presta un estado de cámara ya creado.
+    """
+    def __init__(self, num_servers=INFERENCE_SERVERS):
+        cores = os.cpu_count() or 2
+        threads = max(1, cores // num_servers)
+        self.servers = [_ServerHandle(i, threads) for i in range(num_servers)]
+        self.lock = threading.Lock()
+
+    def prewarm(self):
+        with self.lock:
+            for server in self.servers:
+                if server.ensure_running():
+                    for other in server.clients.values():
+                        server.send_attach(other)
+
+    def attach(self, client):
+        with self.lock:
+            server = min(self.servers, key=lambda s: len(s.clients))
+            if server.ensure_running():
+                # Si el servidor se había caído, re-registramos las cámaras que atendía
+                for other in server.clients.values():
+                    server.send_attach(other)
+            server.clients[client.handle] = client
+            server.send_attach(client)
+
+    def send_control(self, client, action, value):
+        """Mensaje de control ('mode', 'rate_cap') para la cámara de `client` en su servidor."""
+        with self.lock:
+            for server in self.servers:
+                if client.handle in server.clients and server.process is not None and server.process.is_alive():
+                    server.control_queue.put((action, client.handle, value))
+
+    def detach(self, client):
+        with self.lock:
+            for server in self.servers:
+                if server.clients.pop(client.handle, None) is not None:
+                    if server.process is not None and server.process.is_alive():
+                        server.control_queue.put(('detach', client.handle))
+
+    def shutdown(self):
+        with self.lock:
+            for server in self.servers:
+                server.stop()
+                server.clients.clear()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_inference_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = InferenceService()
+        return _service
+
+def prewarm_inference_service():
+    get_inference_service().prewarm()
+
+def shutdown_inference_service():
+    global _service
+    with _service_lock:
+        if _service is not None:
+            print("[YOLO-PROCESS] Shutting down inference servers...")
+            _service.shutdown()
+            _service = None
 
 
 class MultiprocessYOLO:
     """
-    Contenedor para delegar inferencia a un núcleo del CPU independiente.
+    Contenedor para delegar inferencia al servidor de inferencia compartido.
     El flujo web (FastAPI) deposita frames aquí y solicita la última inferencia
-    sin bloquear la cámara.
+    sin bloquear la cámara. Los frames viajan por dos SharedFrameRing
+    (cámara -> servidor y servidor -> web) en lugar de colas serializadas.
+
+    Con headless=True (conteo programado, nadie mirando) el servidor no dibuja
+    overlays ni devuelve frames: solo publica conteos y eventos de cruce.
+
+    Para archivos (vod_path) el servidor guarda las detecciones de una grilla fija de frames
+    (uno cada video_fps / MAX_FPS) y en las siguientes pasadas del bucle las reutiliza sin correr el modelo.
     """
-    def __init__(self, source_id, initial_in=0, initial_out=0):
+    def __init__(self, source_id, initial_in=0, initial_out=0, headless=False, vod_path=None, frame_count=0, switchable=False, video_fps=0):
         self.source_id = source_id
-        # Colas de tamaño 1: Solo guardamos el frame más reciente y olvidamos el resto
-        self.frame_queue = mp.Queue(maxsize=1)
-        self.result_queue = mp.Queue(maxsize=1)
-        
-        self.entry_counter = mp.Value('i', initial_in)
-        self.exit_counter = mp.Value('i', initial_out)
-        
-        self.process = mp.Process(
-            target=yolo_worker, 
-            args=(self.frame_queue, self.result_queue, self.source_id, self.entry_counter, self.exit_counter, initial_in, initial_out),
-            daemon=True
-        )
-        self.process.start()
-        
+        self.headless = headless
+        # switchable: el modo puede cambiar en vivo con set_headless(), así que con overlays del servidor
+        # el ring de resultados se reserva completo
+        self.switchable = switchable
+        self.rate_cap = None
+        self.vod = None
+        if vod_path and frame_count > 0 and DETECTION_CACHE:
+            try:
+                self.vod = (file_key(vod_path), int(frame_count), cache_stride(video_fps, MAX_FPS))
+            except OSError as e:
+                print(f"[YOLO-PROCESS] Detection cache disabled for {vod_path}: {e}")
+        # Identificador único: la misma fuente puede tener varios clientes (stream + scheduler)
+        self.handle = f"{source_id}:{uuid.uuid4().hex[:8]}"
+        self.frame_ring = SharedFrameRing()
+        # Sin frames de vuelta en headless ni sin overlays del servidor: el ring de resultados solo lleva metadatos
+        metadata_only = not SERVER_OVERLAYS or (headless and not switchable)
+        self.result_ring = SharedFrameRing(max_width=1, max_height=1) if metadata_only else SharedFrameRing()
+        self.result_ring.counters[ENTRY_COUNTER] = initial_in
+        self.result_ring.counters[EXIT_COUNTER] = initial_out
+        self.last_counts = (initial_in, initial_out)
+
         self.latest_result = None
         self.latest_metadata = {}
+        self.latest_seq = 0
+        self.last_event_seq = 0
+        # Frames que no se pudieron escribir en el ring (se loguean, nunca se pierden en silencio)
+        self.dropped_frames = 0
+        self.ring_lock = threading.Lock()
+
+        self.service = get_inference_service()
+        self.service.attach(self)
+
+    def set_headless(self, headless):
+        """Cambia entre headless (solo conteos) y anotado sin re-registrar la cámara ni perder su tracker."""
+        if headless == self.headless:
+            return
+        if not headless and not self.switchable and SERVER_OVERLAYS:
+            raise ValueError("This processor was created headless-only; create it with switchable=True")
+        self.headless = headless
+        self.service.send_control(self, 'mode', headless)
+
+    def set_rate_cap(self, fps):
+        """Tope de FPS de inferencia para esta cámara (None = el normal del controlador adaptativo)."""
+        if fps == self.rate_cap:
+            return
+        self.rate_cap = fps
+        self.service.send_control(self, 'rate_cap', fps)
+
+    def get_inference_rate(self):
+        """FPS de inferencia que el servidor está dando actualmente a esta cámara."""
+        with self.ring_lock:
+            if self.result_ring is None:
+                return 0.0
+            return int(self.result_ring.counters[RATE_COUNTER]) / 100.0
+
+    def get_sampling_rate(self):
+        """FPS a los que el servidor toma frames de esta cámara: inferencia más sondeos de movimiento."""
+        with self.ring_lock:
+            if self.result_ring is None:
+                return 0.0
+            return int(self.result_ring.counters[SAMPLE_COUNTER]) / 100.0
+
+    def frame_needed(self, lead=0.0):
+        """
+        True si vale la pena decodificar y entregar el próximo frame: el servidor tomará
+        uno dentro de `lead` segundos. Los demás se pueden saltar con grab() sin convertirlos.
+        """
+        with self.ring_lock:
+            if self.result_ring is None:
+                return False
+            due = int(self.result_ring.counters[DUE_COUNTER]) / 1000.0
+        # Sin dato todavía (primera inferencia pendiente): entregar siempre
+        return due == 0 or time.time() >= due - lead
+
+    def on_cache_grid(self, frame_index):
+        """True si el frame está en la grilla del caché de detecciones (siempre, si la fuente no usa caché)."""
+        return self.vod is None or on_grid(frame_index, self.vod[2])
 
     def get_counts(self):
-        return self.entry_counter.value, self.exit_counter.value
+        with self.ring_lock:
+            if self.result_ring is not None:
+                self.last_counts = (int(self.result_ring.counters[ENTRY_COUNTER]), int(self.result_ring.counters[EXIT_COUNTER]))
+        return self.last_counts
 
-    def update_frame(self, frame, tripwire_data=None):
-        """Envía frame a procesar reemplazando el anterior si no se ha consumido."""
+    def update_frame(self, frame, tripwire_data=None, frame_index=None):
+        """
+        Escribe el frame en el ring compartido; el servidor siempre toma el más reciente.
+        frame_index (0 = primer frame del archivo) habilita el caché de detecciones en fuentes de archivo.
+        """
+        if frame is None:
+            return
+        if frame_index is not None and self.vod is not None:
+            tripwire_data = dict(tripwire_data or {}, frame_index=frame_index)
         try:
-            # Vaciar fotogramas antiguos no procesados
-            while not self.frame_queue.empty():
-                try:
-                    self.frame_queue.get_nowait()
-                except Exception:
-                    pass
-                
-            self.frame_queue.put_nowait((frame, tripwire_data))
-        except Exception:
-            pass # Si la cola se llena justo ahora, simplemente saltamos este frame
+            with self.ring_lock:
+                if self.frame_ring is None:
+                    return
+                if not self.frame_ring.fits(frame):
+                    h, w = frame.shape[:2]
+                    scale = min(self.frame_ring.max_width / float(w), self.frame_ring.max_height / float(h))
+                    frame = cv2.resize(frame, (int(w * scale), int(h * scale)))
+                self.frame_ring.write(frame, tripwire_data)
+        except Exception as e:
+            # Normalmente el ring se está cerrando justo ahora; igual queda contado y en el log
+            self.dropped_frames += 1
+            # Primera vez y luego cada 100, igual que SharedFrameRing._log_drop
+            if self.dropped_frames == 1 or self.dropped_frames % 100 == 0:
+                print(f"[YOLO-PROCESS] ERROR: camera {self.source_id}: frame write failed: {e} ({self.dropped_frames} so far)")
 
     def get_latest_processed_frame(self, fallback_frame):
         """Devuelve el resultado. Si YOLO aún no acaba, devuelve el último conocido o el original sin procesar"""
         try:
-            # Verificar si el worker terminó de procesar un nuevo frame
-            if not self.result_queue.empty():
-                data = self.result_queue.get_nowait()
-                if isinstance(data, tuple):
-                    self.latest_result, self.latest_metadata = data
-                else:
-                    self.latest_result = data
+            # Varios visores pueden consultar a la vez; solo uno copia cada resultado nuevo
+            with self.ring_lock:
+                if self.result_ring is not None and self.result_ring.latest_seq > self.latest_seq:
+                    seq, frame, metadata = self.result_ring.read_latest(self.latest_seq)
+                    if seq:
+                        # Sin overlays del servidor los resultados traen solo metadatos
+                        self.latest_seq = seq
+                        if frame is not None:
+                            self.latest_result = frame
+                        self.latest_metadata = metadata or {}
         except Exception:
             pass
-            
+
         return self.latest_result if self.latest_result is not None else fallback_frame
-        
+
+    def wait_for_result(self, after_seq, timeout=1.0):
+        """Espera a que el servidor publique un resultado más nuevo que `after_seq` (sin copiarlo)."""
+        return self.result_ring is not None and self.result_ring.wait_for(after_seq, timeout)
+
     def get_latest_metadata(self):
         return self.latest_metadata
 
+    def poll_events(self):
+        """
+        Devuelve los cruces (track_id, 'IN'/'OUT', timestamp) publicados desde la última llamada.
+        El servidor mantiene una ventana de los últimos eventos, así que no se pierden
+        aunque el consumidor lea más lento que la inferencia.
+        """
+        with self.ring_lock:
+            if self.result_ring is not None and self.result_ring.latest_seq > self.latest_seq:
+                seq, frame, metadata = self.result_ring.read_latest(self.latest_seq)
+                if seq:
+                    self.latest_seq = seq
+                    if frame is not None:
+                        self.latest_result = frame
+                    self.latest_metadata = metadata or {}
+
+            new_events = []
+            for event_seq, track_id, direction, ts in self.latest_metadata.get("events", ()):
+                if event_seq > self.last_event_seq:
+                    new_events.append((track_id, direction, ts))
+                    self.last_event_seq = event_seq
+            return new_events
+
     def stop(self):
-        """Apaga el proceso de golpe para asegurar liberación de memoria OS-level sin deadlocks."""
+        """Da de baja la cámara en el servidor y libera la memoria compartida (el modelo sigue cargado para otras cámaras)."""
+        self.get_counts()
         try:
-            if hasattr(self, 'process') and self.process and self.process.is_alive():
-                print(f"[YOLO-PROCESS] Terminating process {self.process.pid} for camera {self.source_id}")
-                self.process.terminate()
-                self.process.join(timeout=1.0)
-                if self.process.is_alive():
-                    print(f"[YOLO-PROCESS] Process {self.process.pid} still alive, sending SIGKILL")
-                    self.process.kill()
-                self.process.join(timeout=1.0)
+            self.service.detach(self)
         except Exception as e:
-            print(f"[YOLO-PROCESS] Error terminando proceso: {e}")
-        
-        try:
-            # Drenar colas preventivamente y cancelar threads internos
-            while not self.frame_queue.empty():
-                try:
-                    self.frame_queue.get_nowait()
-                except: pass
-            self.frame_queue.close()
-            self.frame_queue.cancel_join_thread()
-        except:
-            pass
-            
-        try:
-            while not self.result_queue.empty():
+            print(f"[YOLO-PROCESS] Error dando de baja la cámara {self.source_id}: {e}")
+
+        # Liberar los segmentos de memoria compartida (solo el cliente hace unlink)
+        with self.ring_lock:
+            for ring in (self.frame_ring, self.result_ring):
                 try:
-                    self.result_queue.get_nowait()
-                except: pass
-            self.result_queue.close()
-            self.result_queue.cancel_join_thread()
-        except:
-            pass
-            
+                    if ring is not None:
+                        ring.close()
+                except Exception:
+                    pass
+            self.frame_ring = None
+            self.result_ring = None
+
         self.latest_result = None
@@ -0,0 +1,259 @@
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+# Estados de un track (mismos valores que ultralytics.trackers.basetrack.TrackState)
+NEW, TRACKED, LOST, REMOVED = 0, 1, 2, 3
+
+
+class KalmanFilterXYAH:
+    """Filtro de Kalman de velocidad constante sobre (cx, cy, aspecto, alto), igual al de ByteTrack."""
+    std_weight_position = 1.0 / 20
+    std_weight_velocity = 1.0 / 160
+
+    def __init__(self):
+        self.motion_mat = np.eye(8)
+        self.motion_mat[:4, 4:] = np.eye(4)
+
+    def initiate(self, measurement):
+        mean = np.r_[measurement, np.zeros(4)]
+        h = measurement[3]
+        std = [2 * self.std_weight_position * h, 2 * self.std_weight_position * h, 1e-2, 2 * self.std_weight_position * h,
+               10 * self.std_weight_velocity * h, 10 * self.std_weight_velocity * h, 1e-5, 10 * self.std_weight_velocity * h]
+        return mean, np.diag(np.square(std))
+
+    def multi_predict(self, mean, covariance):
+        h = mean[:, 3]
+        std = np.stack([
+            self.std_weight_position * h, self.std_weight_position * h, np.full_like(h, 1e-2), self.std_weight_position * h,
+            self.std_weight_velocity * h, self.std_weight_velocity * h, np.full_like(h, 1e-5), self.std_weight_velocity * h,
+        ], axis=1)
+        motion_cov = np.zeros((len(mean), 8, 8))
+        motion_cov[:, range(8), range(8)] = np.square(std)
+        mean = mean @ self.motion_mat.T
+        covariance = self.motion_mat @ covariance @ self.motion_mat.T + motion_cov
+        return mean, covariance
+
+    def update(self, mean, covariance, measurement):
+        h = mean[3]
+        innovation_cov = np.diag(np.square([self.std_weight_position * h, self.std_weight_position * h, 1e-1, self.std_weight_position * h]))
+        projected_cov = covariance[:4, :4] + innovation_cov
+        kalman_gain = np.linalg.solve(projected_cov, covariance[:, :4].T).T
+        new_mean = mean + (measurement - mean[:4]) @ kalman_gain.T
+        new_covariance = covariance - kalman_gain @ projected_cov @ kalman_gain.T
+        return new_mean, new_covariance
+
+
+def xyxy_to_xyah(xyxy):
+    w, h = xyxy[2] - xyxy[0], xyxy[3] - xyxy[1]
+    return np.array([xyxy[0] + w / 2, xyxy[1] + h / 2, w / h, h], dtype=np.float64)
+
+
+def iou_matrix(a, b):
+    """IoU entre todas las cajas xyxy de `a` (N, 4) y `b` (M, 4)."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-7)
+
+
+def linear_assignment(cost, thresh):
+    """
+    Asignación track-detección con costo <= thresh. Usa el húngaro de SciPy si está
+    instalado; si no, un emparejamiento greedy por costo ascendente (mismo resultado
+    en escenas de personas, donde casi no hay ambigüedad entre pares).
+    Devuelve (matches (K, 2), filas sin asignar, columnas sin asignar).
+    """
+    rows, cols = cost.shape
+    if cost.size == 0:
+        return np.empty((0, 2), dtype=int), list(range(rows)), list(range(cols))
+
+    if linear_sum_assignment is not None:
+        r, c = linear_sum_assignment(cost)
+        ok = cost[r, c] <= thresh
+        matches = np.stack([r[ok], c[ok]], axis=1)
+    else:
+        order = np.argsort(cost, axis=None, kind="stable")
+        order = order[cost.flat[order] <= thresh]
+        used_r = np.zeros(rows, dtype=bool)
+        used_c = np.zeros(cols, dtype=bool)
+        pairs = []
+        for r, c in zip(*np.unravel_index(order, cost.shape)):
+            if not used_r[r] and not used_c[c]:
+                used_r[r] = used_c[c] = True
+                pairs.append((r, c))
+        matches = np.array(pairs, dtype=int).reshape(-1, 2)
+
+    unmatched_r = sorted(set(range(rows)) - set(matches[:, 0].tolist()))
+    unmatched_c = sorted(set(range(cols)) - set(matches[:, 1].tolist()))
+    return matches, unmatched_r, unmatched_c
+
+
+class STrack:
+    def __init__(self, xyxy, score, cls, idx):
+        self.det_xyxy = np.asarray(xyxy, dtype=np.float64)
+        self.score = float(score)
+        self.cls = float(cls)
+        self.idx = int(idx)
+        self.mean = None
+        self.covariance = None
+        self.track_id = 0
+        self.state = NEW
+        self.is_activated = False
+        self.frame_id = 0
+        self.start_frame = 0
+
+    @property
+    def xyxy(self):
+        if self.mean is None:
+            return self.det_xyxy.copy()
+        cx, cy, a, h = self.mean[:4]
+        w = a * h
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+    def activate(self, kf, frame_id, track_id):
+        self.kf = kf
+        self.track_id = track_id
+        self.mean, self.covariance = kf.initiate(xyxy_to_xyah(self.det_xyxy))
+        self.state = TRACKED
+        # Igual que ByteTrack: solo en el primer frame un track nuevo nace confirmado
+        self.is_activated = frame_id == 1
+        self.frame_id = self.start_frame = frame_id
+
+    def update(self, det, frame_id):
+        self.mean, self.covariance = self.kf.update(self.mean, self.covariance, xyxy_to_xyah(det.det_xyxy))
+        self.state = TRACKED
+        self.is_activated = True
+        self.frame_id = frame_id
+        self.score, self.cls, self.idx = det.score, det.cls, det.idx
+
+
+class ByteTracker:
+    """
+    ByteTrack en NumPy puro, sin dependencias de Ultralytics ni PyTorch. Se configura
+    con el mismo custom_bytetrack.yaml y respeta el contrato de BYTETracker.update:
+    devuelve un array (N, 8) con x1, y1, x2, y2, track_id, score, cls, idx.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.kf = KalmanFilterXYAH()
+        self.tracked = []
+        self.lost = []
+        self.frame_id = 0
+        self.next_id = 1
+
+    def reset(self):
+        self.tracked = []
+        self.lost = []
+        self.frame_id = 0
+        self.next_id = 1
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def _dists(self, tracks, dets, fuse):
+        cost = 1.0 - iou_matrix(np.array([t.xyxy for t in tracks]).reshape(-1, 4),
+                                np.array([d.det_xyxy for d in dets]).reshape(-1, 4))
+        if fuse and cost.size:
+            cost = 1.0 - (1.0 - cost) * np.array([d.score for d in dets])[None, :]
+        return cost
+
+    def _predict(self, tracks):
+        if not tracks:
+            return
+        mean = np.array([t.mean for t in tracks])
+        mean[[t.state != TRACKED for t in tracks], 7] = 0
+        mean, cov = self.kf.multi_predict(mean, np.array([t.covariance for t in tracks]))
+        for t, m, c in zip(tracks, mean, cov):
+            t.mean, t.covariance = m, c
+
+    def update(self, detections, img=None):
+        """detections: (N, 6) x1, y1, x2, y2, conf, cls en píxeles del frame original."""
+        self.frame_id += 1
+        args = self.args
+        dets = np.asarray(detections, dtype=np.float64).reshape(-1, 6)
+        wh = dets[:, 2:4] - dets[:, :2]
+        valid = (wh[:, 0] > 0) & (wh[:, 1] > 0)
+        scores = dets[:, 4]
+        high = np.flatnonzero(valid & (scores >= args.track_high_thresh))
+        low = np.flatnonzero(valid & (scores > args.track_low_thresh) & (scores < args.track_high_thresh))
+        dets_high = [STrack(dets[i, :4], dets[i, 4], dets[i, 5], i) for i in high]
+        dets_low = [STrack(dets[i, :4], dets[i, 4], dets[i, 5], i) for i in low]
+
+        unconfirmed = [t for t in self.tracked if not t.is_activated]
+        confirmed = [t for t in self.tracked if t.is_activated]
+        pool = confirmed + [t for t in self.lost if t.track_id not in {c.track_id for c in confirmed}]
+        self._predict(pool)
+
+        activated, lost, removed = [], [], []
+
+        # 1) Detecciones de alta confianza contra todos los tracks (incluye perdidos)
+        matches, u_track, u_det = linear_assignment(self._dists(pool, dets_high, args.fuse_score), args.match_thresh)
+        for it, idet in matches:
+            pool[it].update(dets_high[idet], self.frame_id)
+            activated.append(pool[it])
+
+        # 2) Detecciones de baja confianza contra los tracks activos que quedaron libres
+        remaining = [pool[i] for i in u_track if pool[i].state == TRACKED]
+        matches, u_remaining, _ = linear_assignment(self._dists(remaining, dets_low, False), 0.5)
+        for it, idet in matches:
+            remaining[it].update(dets_low[idet], self.frame_id)
+            activated.append(remaining[it])
+        for it in u_remaining:
+            remaining[it].state = LOST
+            lost.append(remaining[it])
+
+        # 3) Tracks sin confirmar contra las detecciones altas sobrantes
+        dets_left = [dets_high[i] for i in u_det]
+        matches, u_unconfirmed, u_det = linear_assignment(self._dists(unconfirmed, dets_left, args.fuse_score), 0.7)
+        for it, idet in matches:
+            unconfirmed[it].update(dets_left[idet], self.frame_id)
+            activated.append(unconfirmed[it])
+        for it in u_unconfirmed:
+            unconfirmed[it].state = REMOVED
+            removed.append(unconfirmed[it])
+
+        # 4) Nuevos tracks
+        for idet in u_det:
+            det = dets_left[idet]
+            if det.score >= args.new_track_thresh:
+                det.activate(self.kf, self.frame_id, self._new_id())
+                activated.append(det)
+
+        # 5) Olvidar tracks perdidos hace más de track_buffer frames
+        for t in self.lost:
+            if self.frame_id - t.frame_id > args.track_buffer:
+                t.state = REMOVED
+                removed.append(t)
+
+        active_ids = set()
+        tracked = []
+        for t in [t for t in self.tracked if t.state == TRACKED] + activated:
+            if t.track_id not in active_ids:
+                active_ids.add(t.track_id)
+                tracked.append(t)
+        lost_pool = [t for t in self.lost + lost if t.state == LOST and t.track_id not in active_ids]
+        self.tracked, self.lost = self._remove_duplicates(tracked, lost_pool)
+
+        out = [[*t.xyxy, t.track_id, t.score, t.cls, t.idx] for t in self.tracked if t.is_activated]
+        return np.array(out, dtype=np.float32).reshape(-1, 8)
+
+    def _remove_duplicates(self, tracked, lost):
+        """Un track activo y uno perdido casi idénticos (IoU > 0.85): se queda el más antiguo."""
+        iou = iou_matrix(np.array([t.xyxy for t in tracked]).reshape(-1, 4), np.array([t.xyxy for t in lost]).reshape(-1, 4))
+        drop_a, drop_b = set(), set()
+        for p, q in zip(*np.nonzero(iou > 0.85)):
+            if tracked[p].frame_id - tracked[p].start_frame > lost[q].frame_id - lost[q].start_frame:
+                drop_b.add(q)
+            else:
+                drop_a.add(p)
+        return ([t for i, t in enumerate(tracked) if i not in drop_a],
+                [t for i, t in enumerate(lost) if i not in drop_b])
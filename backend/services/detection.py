@@ -1,192 +1,359 @@
+import os
+import time
+import types
+import weakref
 import cv2
 import numpy as np
-from ultralytics import YOLO
-from collections import defaultdict
+import yaml
+from collections import deque
 
-def ccw(A, B, C):
-    return (C[1]-A[1]) * (B[0]-A[0]) > (B[1]-A[1]) * (C[0]-A[0])
+try:
+    from ultralytics import YOLO
+except ImportError:
+    # Despliegues con DETECTION_ENGINE=onnx no necesitan Ultralytics ni PyTorch
+    YOLO = None
 
-def intersect(A, B, C, D):
-    return ccw(A, C, D) != ccw(B, C, D) and ccw(A, B, C) != ccw(A, B, D)
+from .tripwire_engine import LEGACY_LINE_NAME, MAX_JUMP_WIDTH, TripwireEngine, line_configs
+from . import model_store
+from .inference_backends import NATIVE_BACKENDS, load_backend, resolve_backend_name
+from .track_store import TrackStore
+
+TRACKER_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "custom_bytetrack.yaml")
+
+# Motor de detección + tracking por despliegue:
+#   "ultralytics" -> YOLO de Ultralytics + su BYTETracker (por defecto)
+#   "onnx"        -> onnxruntime directo sobre yolo11n.onnx + ByteTrack NumPy (services/bytetrack.py)
+#   "onnx-int8", "pytorch", "openvino" -> ver services/inference_backends.py
+#   "auto"        -> el más rápido según el último benchmark de este host
+DETECTION_ENGINE = os.environ.get("DETECTION_ENGINE", "ultralytics").lower()
+
+# Si el backend configurado no carga, se prueban estos en orden antes de rendirse
+FALLBACK_ENGINES = ("onnx", "ultralytics")
 
 class YoloDetector:
-    def __init__(self):
-        # Load a lightweight model, downloading if necessary
-        # We use yolo11n as the user specifically requested YOLOv11 and we need it to be fast on CPU
-        try:
-            import os
-            # Intenta cargar ONNX si existe para inferencia ultrarrápida y bajo consumo de memoria
-            onnx_path = 'yolo11n.onnx'
-            pt_path = 'yolo11n.pt'
-            
-            if os.path.exists(onnx_path):
-                self.model = YOLO(onnx_path, task='detect')
-                print("Loaded optimized ONNX model.")
-            else:
-                self.model = YOLO(pt_path)
-                try:
-                    # Exportar automáticamente a ONNX en el primer run, ahorra CPU y RAM
-                    print("Exporting model to ONNX for future optimized inference...")
-                    self.model.export(format='onnx', imgsz=320, dynamic=True)
-                except Exception as ex:
-                    print(f"Failed to export ONNX, continuing with PyTorch model: {ex}")
-        except Exception as e:
-            print(f"Error loading YOLO model: {e}")
-            self.model = None
-
-        if self.model is not None:
-            try:
-                # Warm up the model
-                dummy_frame = np.zeros((320, 320, 3), dtype=np.uint8)
-                self.model(dummy_frame, device='cpu', verbose=False)
-            except Exception as e:
-                print(f"Error warming up YOLO model: {e}")
+    # Instancias vivas, para la auditoría de un modelo por worker
+    live = weakref.WeakSet()
+
+    def __init__(self, engine=None, num_threads=1):
+        self.engine_name = resolve_backend_name(engine or DETECTION_ENGINE)
+        self.backend = None
+        self.model = None
 
         # Optimization settings
         self.conf_threshold = 0.40
         self.classes = [0] # 0 is 'person' in COCO dataset
-        
-        # Tracking history and tripwire state
-        self.tracks = defaultdict(list)
-        self.entry_count = 0
-        self.exit_count = 0
-        self.counted_ids = set() # To avoid double counting the same ID crossing multiple times
-        
-        self.frame_count = 0
-        self.last_boxes = [] # tuple of (box, track_id)
-        
-        # We process 1 in every N frames to save CPU. Tracking algorithm stabilizes it.
-        self.frame_skip = 5
+        # 320 instead of 640 dramatically speeds up YOLO on CPU
+        self.inference_size = 320
+
+        # Estado de tracking para el uso clásico de una sola cámara (process_frame), creado al primer uso
+        self._camera = None
+
+        # Un detector que no cargó devolvería listas vacías para siempre (0 conteos sin ningún error):
+        # se cae al siguiente backend con un error visible y, si ninguno carga, se aborta.
+        requested = self.engine_name
+        errors = []
+        for name in [requested] + [e for e in FALLBACK_ENGINES if e != requested]:
+            try:
+                if name == "ultralytics":
+                    self._load_ultralytics()
+                else:
+                    self._load_backend(name, num_threads)
+                self.engine_name = name
+                break
+            except Exception as e:
+                self.backend = self.model = None
+                errors.append(f"{name}: {e}")
+                print(f"[DETECTOR] ERROR: inference backend '{name}' failed to load: {e}")
+        else:
+            raise RuntimeError(f"No inference backend could be loaded ({'; '.join(errors)})")
+        if self.engine_name != requested:
+            print(f"[DETECTOR] ERROR: DETECTION_ENGINE '{requested}' unavailable, running on '{self.engine_name}' instead")
+
+        YoloDetector.live.add(self)
+
+    def _load_backend(self, name, num_threads):
+        self.backend = load_backend(name, imgsz=self.inference_size, conf_threshold=self.conf_threshold,
+                                    classes=self.classes, num_threads=num_threads)
+        # Warm up
+        self.backend.detect([np.zeros((self.inference_size, self.inference_size, 3), dtype=np.uint8)])
+        print(f"Loaded inference backend '{name}'.")
+
+    def _load_ultralytics(self):
+        if YOLO is None:
+            raise ImportError("ultralytics is not installed")
+        # Load a lightweight model, downloading if necessary
+        # We use yolo11n as the user specifically requested YOLOv11 and we need it to be fast on CPU
+        # ONNX del model store (construido una sola vez, con lock) para inferencia rápida y bajo consumo de memoria
+        try:
+            self.model = YOLO(model_store.onnx_path(self.inference_size), task='detect')
+            print("Loaded optimized ONNX model.")
+        except Exception as ex:
+            print(f"ONNX model unavailable, continuing with PyTorch model: {ex}")
+            self.model = YOLO(model_store.weights_path())
+
+        # Warm up the model
+        dummy_frame = np.zeros((320, 320, 3), dtype=np.uint8)
+        self.model(dummy_frame, device='cpu', verbose=False)
+
+    @property
+    def camera(self):
+        if self._camera is None:
+            self._camera = CameraTracker(engine=self.engine_name)
+        return self._camera
+
+    @property
+    def entry_count(self):
+        return self.camera.entry_count
+
+    @entry_count.setter
+    def entry_count(self, value):
+        self.camera.entry_count = value
+
+    @property
+    def exit_count(self):
+        return self.camera.exit_count
+
+    @exit_count.setter
+    def exit_count(self, value):
+        self.camera.exit_count = value
+
+    def detect(self, frames):
+        """
+        Runs one batched forward pass over frames from any number of cameras.
+        Returns one (N, 6) float32 array per frame: x1, y1, x2, y2, conf, cls.
+        """
+        if self.backend is not None:
+            return self.backend.detect(list(frames))
+        if self.model is None or not frames:
+            return [np.zeros((0, 6), dtype=np.float32) for _ in frames]
+
+        results = self.model.predict(
+            list(frames),
+            classes=self.classes,
+            conf=self.conf_threshold,
+            imgsz=self.inference_size,
+            verbose=False,
+            device='cpu'
+        )
+        return [r.boxes.data.cpu().numpy().astype(np.float32) for r in results]
 
     def process_frame(self, frame, source_id, tripwire_data=None):
         """
         Process a frame applying YOLO tracking and pure geometric intersection.
         """
-        if self.model is None or frame is None:
+        if (self.model is None and self.backend is None) or frame is None:
             return frame
 
+        detections = self.detect([frame])[0]
+        return self.camera.process(frame, detections, tripwire_data)
+
+
+def load_tracker_config(path=TRACKER_CONFIG_PATH):
+    """Reads custom_bytetrack.yaml once; ByteTrack only needs attribute access to the values."""
+    with open(path) as f:
+        return types.SimpleNamespace(**yaml.safe_load(f))
+
+
+class CameraTracker:
+    """
+    Per-camera tracking + tripwire stage. Receives raw detections (from a batched
+    inference pass shared by several cameras) and keeps this camera's ByteTrack
+    state, trajectories and entry/exit counts.
+    """
+    def __init__(self, entry_count=0, exit_count=0, tracker_config=None, engine=None):
+        cfg = tracker_config or load_tracker_config()
+        self.native_tracker = resolve_backend_name(engine or DETECTION_ENGINE) in NATIVE_BACKENDS
+        if self.native_tracker:
+            from .bytetrack import ByteTracker
+            self.tracker = ByteTracker(cfg)
+        else:
+            from ultralytics.trackers.byte_tracker import BYTETracker
+            try:
+                self.tracker = BYTETracker(args=cfg, frame_rate=30)
+            except TypeError:
+                # Ultralytics >= 8.4 dropped the frame_rate argument
+                self.tracker = BYTETracker(args=cfg)
+
+        # Tracking history and tripwire state (the store also remembers which (track, line) pairs already counted)
+        self.tracks = TrackStore(history=30)
+        # TrajectoryWriter opcional (services/trajectory_store.py): persiste los centroides para el what-if
+        self.trajectories = None
+        self.entry_count = entry_count
+        self.exit_count = exit_count
+        self.engine = TripwireEngine()
+        
+        self.frame_count = 0
+        self.last_xyxy = np.zeros((0, 4), dtype=np.int32)
+        self.last_ids = np.zeros((0,), dtype=np.int64)
+
+        # Últimos cruces (seq, track_id, 'IN'/'OUT', timestamp) para quien consuma solo metadatos
+        self.event_seq = 0
+        self.recent_events = deque(maxlen=64)
+
+        # Velocidad máxima hacia el tripwire (fracciones del frame por segundo), usada por el control de tasa
+        self.last_process_time = 0.0
+        self.approach_speed = 0.0
+
+    def reset(self, entry_count=0, exit_count=0):
+        """Deja el tracker como recién creado para una nueva cámara, sin volver a reservar nada."""
+        if self.native_tracker:
+            self.tracker.reset()
+        else:
+            # BYTETracker.reset() también llama a reset_id(), que reinicia el contador de clase
+            # BaseTrack._count para todas las cámaras del proceso: se limpia solo el estado propio
+            tracker = self.tracker
+            tracker.tracked_stracks, tracker.lost_stracks, tracker.removed_stracks = [], [], []
+            tracker.frame_id = 0
+            tracker.kalman_filter = tracker.get_kalmanfilter()
+        self.tracks.clear()
+        self.engine = TripwireEngine()
+        self.entry_count = entry_count
+        self.exit_count = exit_count
+        self.frame_count = 0
+        self.last_xyxy = self.last_xyxy[:0]
+        self.last_ids = self.last_ids[:0]
+        self.event_seq = 0
+        self.recent_events.clear()
+        self.last_process_time = 0.0
+        self.approach_speed = 0.0
+
+    def _track(self, frame, detections):
+        if detections is None or len(detections) == 0:
+            detections = np.zeros((0, 6), dtype=np.float32)
+        if self.native_tracker:
+            tracked = self.tracker.update(detections, frame)
+        else:
+            from ultralytics.engine.results import Boxes
+            tracked = self.tracker.update(Boxes(detections, frame.shape[:2]), frame)
+        if tracked is None or len(tracked) == 0:
+            return self.last_xyxy[:0], self.last_ids[:0]
+        # tracked: x1, y1, x2, y2, track_id, score, cls, idx
+        return tracked[:, :4].astype(np.int32), tracked[:, 4].astype(np.int64)
+
+    def _record_crossing(self, track_id, direction, line_idx=0, slot=None):
+        if direction == 'IN':
+            self.entry_count += 1
+        else:
+            self.exit_count += 1
+        if slot is not None:
+            self.tracks.mark_counted(slot, line_idx)
+        self.event_seq += 1
+        self.recent_events.append((self.event_seq, track_id, direction, time.time()))
+
+    def process(self, frame, detections, tripwire_data=None, render=True, draw=True):
+        """
+        Tracks, counts and (unless render=False) draws the overlays on the frame.
+        In headless mode nothing is drawn and only counts/crossing events are returned.
+        With draw=False the frame is returned untouched together with the full metadata,
+        so the browser can draw the overlays itself.
+        """
         self.frame_count += 1
         original_h, original_w = frame.shape[:2]
 
-        # 320 instead of 640 dramatically speeds up YOLO on CPU
-        inference_size = 320 
-        
-        import os
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        backend_dir = os.path.dirname(current_dir)
-        tracker_path = os.path.join(backend_dir, "custom_bytetrack.yaml")
-        
-        # Use model.track with ByteTrack for high performance CPU ID assigning
-        results = self.model.track(
-            frame, 
-            classes=self.classes, 
-            conf=self.conf_threshold, 
-            imgsz=inference_size, 
-            verbose=False,
-            device='cpu',
-            persist=True,
-            tracker=tracker_path
-        )
-        
-        new_boxes = []
-        
-        # Validar si el tripwire completo viene del DB
-        valid_tripwire = False
-        if tripwire_data and hasattr(tripwire_data, 'x1') and getattr(tripwire_data, 'x1') is not None and getattr(tripwire_data, 'y1') is not None and getattr(tripwire_data, 'x2') is not None and getattr(tripwire_data, 'y2') is not None:
-            tx1 = int(tripwire_data.x1 * original_w)
-            ty1 = int(tripwire_data.y1 * original_h)
-            tx2 = int(tripwire_data.x2 * original_w)
-            ty2 = int(tripwire_data.y2 * original_h)
-            valid_tripwire = True
-            A = (tx1, ty1)
-            B = (tx2, ty2)
-            dx = tx2 - tx1
-            dy = ty2 - ty1
-        
-        for r in results:
-            boxes = r.boxes
-            if boxes.id is not None:
-                track_ids = boxes.id.int().cpu().tolist()
-                xyxys = boxes.xyxy.cpu().numpy().astype(int)
-                
-                for box, track_id in zip(xyxys, track_ids):
-                    new_boxes.append((box, track_id))
-                    
-                    # Calculate center mass of the person
-                    cx = int((box[0] + box[2]) / 2)
-                    cy = int((box[1] + box[3]) / 2)
-                    
-                    history = self.tracks[track_id]
-                    history.append((cx, cy))
-                    
-                    if len(history) > 30:
-                        history.pop(0)
-
-                    # Try to intersect with Tripwire if available and this ID hasn't been counted recently
-                    if valid_tripwire and len(history) >= 2 and track_id not in self.counted_ids:
-                        P_prev = history[-2]
-                        P_curr = history[-1]
-                        
-                        # Verify distance between prev and curr to avoid fake jumps when Video files loop
-                        dist = np.sqrt((P_curr[0] - P_prev[0])**2 + (P_curr[1] - P_prev[1])**2)
-                        if dist < original_w / 3.0:  # Must move less than 33% of screen in one frame
-                            # 1. Did the trajectory segment physically intersect the Tripwire segment?
-                            if intersect(A, B, P_prev, P_curr):
-                                # 2. Calculate direction using 2D Determinant (Cross Product)
-                                side_prev = dx * (P_prev[1] - ty1) - dy * (P_prev[0] - tx1)
-                                side_curr = dx * (P_curr[1] - ty1) - dy * (P_curr[0] - tx1)
-                                
-                                # Front-end arrow matrix correlation
-                                # 'IN' points to cross < 0. 'OUT' points to cross > 0
-                                dir_cfg = getattr(tripwire_data, 'direction', 'IN')
-                                
-                                # Avoid counting twice in same exact timestamp (sometimes lines intersect cleanly on boundary)
-                                if side_prev > 0 and side_curr <= 0:
-                                    # Crossed towards negative (The arrow side if IN)
-                                    if dir_cfg == 'IN':
-                                        self.entry_count += 1
-                                    else:
-                                        self.exit_count += 1
-                                    self.counted_ids.add(track_id)
-                                    
-                                elif side_prev < 0 and side_curr >= 0:
-                                    # Crossed towards positive (The arrow side if OUT)
-                                    if dir_cfg == 'IN':
-                                        self.exit_count += 1
-                                    else:
-                                        self.entry_count += 1
-                                    self.counted_ids.add(track_id)
-
-        self.last_boxes = new_boxes
-        
-        # Cleanup untracked IDs to avoid memory leaks
-        active_ids = {tid for _, tid in new_boxes}
-        for track_id in list(self.tracks.keys()):
-            if track_id not in active_ids:
-                del self.tracks[track_id]
-                self.counted_ids.discard(track_id)
-        
+        now = time.time()
+        dt = now - self.last_process_time if self.last_process_time else 0.0
+        self.last_process_time = now
+        approach_speed = 0.0
+
+        # Todas las líneas de la cámara (tripwire principal + líneas/polilíneas extra)
+        self.engine.set_lines(line_configs(tripwire_data))
+        # Normal de la primera línea en coordenadas normalizadas (para medir qué tan rápido se acercan)
+        normal = None
+        if self.engine.lines:
+            (ax, ay), (bx, by) = self.engine.lines[0]["points"][:2]
+            nx, ny = -(by - ay), bx - ax
+            norm = float(np.hypot(nx, ny))
+            if norm > 0:
+                normal = (nx / norm, ny / norm)
+
+        xyxys, track_ids = self._track(frame, detections)
+
+        # Calculate center mass of each person and append it to its ring buffer
+        centers = ((xyxys[:, :2] + xyxys[:, 2:]) / 2).astype(np.int32)
+        slots = self.tracks.update(track_ids, centers)
+        if self.trajectories is not None and len(track_ids):
+            self.trajectories.append(now, track_ids, centers, original_w, original_h)
+        moving, prev_points, curr_points = self.tracks.last_steps(slots)
+
+        if dt > 0 and len(moving):
+            steps = (curr_points - prev_points) / np.array([original_w, original_h], dtype=np.float32)
+            if normal:
+                step = np.abs(steps[:, 0] * normal[0] + steps[:, 1] * normal[1])
+            else:
+                step = np.hypot(steps[:, 0], steps[:, 1])
+            approach_speed = float(step.max()) / dt
+
+        # Todas las pistas contra todas las líneas en una sola pasada vectorizada.
+        # Must move less than 33% of screen in one frame to avoid fake jumps when Video files loop
+        if len(moving) and self.engine.lines:
+            skip = self.tracks.counted_mask(slots[moving], len(self.engine.lines))
+            crossings = self.engine.evaluate(prev_points, curr_points, original_w, original_h, max_jump=original_w * MAX_JUMP_WIDTH, skip=skip)
+            for t, line_idx, direction in crossings:
+                i = moving[t]
+                self._record_crossing(int(track_ids[i]), direction, line_idx, slot=int(slots[i]))
+
+        self.last_xyxy = xyxys
+        self.last_ids = track_ids
+        self.approach_speed = approach_speed
+
+        if not render:
+            return None, {
+                "entry_count": self.entry_count,
+                "exit_count": self.exit_count,
+                "line_counts": self.engine.line_counts(),
+                "events": list(self.recent_events)
+            }
+
+        return self.overlay(frame, tripwire_data, draw=draw, now=now)
+
+    def overlay(self, frame, tripwire_data=None, draw=True, now=None):
+        """
+        Overlays of the last processed frame on a new one, without tracking or counting.
+        Used for the frames viewers get between inferences.
+        """
+        original_h, original_w = frame.shape[:2]
+        if draw:
+            self._render(frame, tripwire_data)
+
+        metadata = {
+            "ts": now or time.time(),
+            "boxes": self.last_xyxy,
+            "track_ids": self.last_ids,
+            "orig_shape": (original_w, original_h),
+            "entry_count": self.entry_count,
+            "exit_count": self.exit_count,
+            "line_counts": self.engine.line_counts(),
+            "events": list(self.recent_events),
+            "tripwire": tripwire_data,
+            "lines": self.engine.lines,
+            # Vistas de solo lectura sobre el TrackStore (sin copiar historias)
+            "tracks": self.tracks.trails()
+        }
+
+        return frame, metadata
+
+    def _render(self, frame, tripwire_data):
+        original_h, original_w = frame.shape[:2]
+
         # Render tracking visually
-        for box, track_id in self.last_boxes:
-            x1, y1, x2, y2 = box
-            
+        for (x1, y1, x2, y2), track_id in zip(self.last_xyxy.tolist(), self.last_ids.tolist()):
             # Draw box
             cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 165, 0), 2)
             cv2.putText(frame, f'ID:{track_id}', (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 165, 0), 2)
             
             # Draw trail
-            history = self.tracks[track_id]
-            for i in range(1, len(history)):
-                cv2.line(frame, history[i-1], history[i], (0, 255, 255), 2)
+            history = self.tracks.trail(track_id)
+            if len(history) >= 2:
+                cv2.polylines(frame, [history.reshape(-1, 1, 2)], False, (0, 255, 255), 2)
 
-        # Render global overlays
-        if valid_tripwire:
-            cv2.line(frame, (tx1, ty1), (tx2, ty2), (0, 0, 255), 3)
+        # Render global overlays (todas las líneas / polilíneas configuradas)
+        for line in self.engine.lines:
+            pts = np.array([[int(x * original_w), int(y * original_h)] for x, y in line["points"]], dtype=np.int32)
+            cv2.polylines(frame, [pts], False, (0, 0, 255), 3)
             # Add label for tripwire direction
-            dir_str = getattr(tripwire_data, 'direction', 'IN')
-            if dir_str is None:
-                dir_str = 'IN'
-            cv2.putText(frame, f"LINE ({dir_str})", (tx1, ty1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+            dir_str = line.get("direction") or 'IN'
+            label = "LINE" if line.get("name") == LEGACY_LINE_NAME else line.get("name")
+            cv2.putText(frame, f"{label} ({dir_str})", (int(pts[0][0]), int(pts[0][1]) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
 
         # Draw Counts (Improved HUD in Top-Right Corner)
         text_entries = f"Entradas: {self.entry_count}"
@@ -219,16 +386,28 @@ class YoloDetector:
         cv2.putText(frame, text_entries, (x_offset + 20, y_offset + h_ent + 15), font, font_scale, (100, 255, 100), thickness)
         cv2.putText(frame, text_exits, (x_offset + 20, y_offset + h_ent + h_ext + 25), font, font_scale, (100, 100, 255), thickness)
 
-        metadata = {
-            "boxes": self.last_boxes,
-            "orig_shape": (original_w, original_h),
-            "entry_count": self.entry_count,
-            "exit_count": self.exit_count,
-            "tripwire": tripwire_data,
-            "tracks": dict(self.tracks)
-        }
+# Registro de modelos del proceso: importar este módulo no carga nada, cada worker
+# construye su detector explícitamente con get_detector().
+_detectors = {}
 
-        return frame, metadata
+def get_detector(engine=None, num_threads=1):
+    """Devuelve el detector del proceso para `engine`, creándolo (carga + warmup) solo la primera vez."""
+    name = resolve_backend_name(engine or DETECTION_ENGINE)
+    if name not in _detectors:
+        _detectors[name] = YoloDetector(engine=name, num_threads=num_threads)
+    return _detectors[name]
+
+def release_detectors():
+    """Suelta los modelos del registro (al apagar el worker)."""
+    _detectors.clear()
+
+def loaded_models():
+    """Cantidad de modelos YOLO cargados en este proceso (detectores vivos con backend o modelo)."""
+    return sum(1 for d in list(YoloDetector.live) if d.backend is not None or d.model is not None)
 
-# Export a single dummy instance for backward compatibility just in case, but processes will make their own.
-detector = YoloDetector()
+def audit_single_model(worker_name):
+    """Auditoría de arranque: un worker debe tener exactamente un modelo cargado."""
+    count = loaded_models()
+    # RuntimeError y no assert: la auditoría tiene que correr también con python -O
+    if count != 1:
+        raise RuntimeError(f"[{worker_name}] expected exactly one YOLO model in this process, found {count}")
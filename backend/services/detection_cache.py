@@ -0,0 +1,145 @@
+import fcntl
+import hashlib
+import json
+import os
+
+import numpy as np
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+CACHE_DIR = os.environ.get("DETECTION_CACHE_DIR", os.path.join(PROJECT_DIR, "cache", "detections"))
+
+ROW_BYTES = 6 * 4 # x1, y1, x2, y2, conf, cls en float32
+
+def file_key(path):
+    """
+    Identidad del archivo por ruta, tamaño y mtime: no lee el contenido, así que abrir un
+    archivo grande no demora los primeros frames. Reemplazar o editar el archivo cambia la clave.
+    """
+    stat = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def cache_stride(video_fps, max_fps):
+    """
+    Paso de la grilla de frames del caché. Fijo por archivo (no depende de la tasa adaptativa
+    del momento): un frame cada 1/max_fps segundos, la resolución máxima de la inferencia.
+    """
+    if video_fps <= 0 or max_fps <= 0:
+        return 1
+    return max(1, int(round(video_fps / max_fps)))
+
+
+def on_grid(frame_index, stride):
+    """True si el frame está en la grilla del caché (solo esos se guardan y se reutilizan)."""
+    return frame_index >= 0 and frame_index % stride == 0
+
+
+def cache_key(file_id, model, imgsz, frame_shape, roi, stride=1):
+    """Identidad de un caché: mismo archivo, mismo modelo/imgsz, mismo tamaño de frame, misma ROI y misma grilla."""
+    roi_str = "full" if roi is None else ",".join(f"{v:.4f}" for v in roi)
+    raw = f"{model}|{imgsz}|{frame_shape[0]}x{frame_shape[1]}|{roi_str}|{stride}"
+    return f"{file_id[:16]}-{hashlib.sha1(raw.encode()).hexdigest()[:12]}"
+
+
+class DetectionCache:
+    """
+    Caché persistente de detecciones por frame de un archivo de video, en formato columnar:
+
+        index.i8   memmap (celdas, 2) int64 -> (fila inicial, cantidad), -1 = sin calcular
+        boxes.f4   filas (N, 6) float32 concatenadas, solo se agregan al final
+
+    Solo se guardan los frames de una grilla fija (frame_index % stride == 0, una celda cada
+    uno) y cada entrada es exactamente la de su frame: el tracker nunca recibe cajas de otro.
+    El pipeline entrega al servidor solo frames de la grilla, así que cada pasada muestrea
+    frames de la misma grilla aunque la tasa adaptativa cambie. La tasa de aciertos de una
+    pasada es la cobertura al empezarla; como cada fallo que llega a inferirse completa su
+    celda, la cobertura solo crece y las pasadas siguientes convergen a 100%.
+
+    Un solo proceso escribe (lock exclusivo no bloqueante); si otro ya lo tiene, este
+    caché queda en solo lectura y simplemente no agrega frames nuevos.
+    """
+    def __init__(self, key, frame_count, root=CACHE_DIR, info=None, stride=1):
+        self.dir = os.path.join(root, key)
+        os.makedirs(self.dir, exist_ok=True)
+        self.frame_count = frame_count
+        self.stride = max(1, int(stride))
+        cells = -(-frame_count // self.stride)
+
+        self.lock_file = open(os.path.join(self.dir, ".lock"), "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self.writer = True
+        except OSError:
+            self.writer = False
+
+        index_path = os.path.join(self.dir, "index.i8")
+        if self.writer and not os.path.exists(index_path):
+            index = np.memmap(index_path + ".tmp", dtype=np.int64, mode="w+", shape=(cells, 2))
+            index[:] = -1
+            index.flush()
+            del index
+            os.replace(index_path + ".tmp", index_path)
+            with open(os.path.join(self.dir, "info.json"), "w") as f:
+                json.dump(dict(info or {}, frame_count=frame_count, stride=self.stride), f)
+
+        self.index = None
+        if os.path.exists(index_path):
+            rows = os.path.getsize(index_path) // 16
+            self.index = np.memmap(index_path, dtype=np.int64, mode="r+" if self.writer else "r", shape=(rows, 2))
+        self.boxes_fd = os.open(os.path.join(self.dir, "boxes.f4"), os.O_RDWR | os.O_CREAT, 0o644)
+        self.hits = 0
+        self.misses = 0
+
+    def _cell(self, frame_index):
+        """Celda del frame, o None si no está en la grilla o queda fuera del índice."""
+        if self.index is None or not on_grid(frame_index, self.stride):
+            return None
+        cell = frame_index // self.stride
+        return cell if cell < len(self.index) else None
+
+    def get(self, frame_index):
+        """Detecciones (N, 6) del frame, o None si no está en la grilla o todavía no se calcularon."""
+        cell = self._cell(frame_index)
+        if cell is None:
+            return None
+        start, count = self.index[cell]
+        if count < 0:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if count == 0:
+            return np.zeros((0, 6), dtype=np.float32)
+        data = os.pread(self.boxes_fd, int(count) * ROW_BYTES, int(start) * ROW_BYTES)
+        return np.frombuffer(data, dtype=np.float32).reshape(-1, 6).copy()
+
+    def put(self, frame_index, detections):
+        cell = self._cell(frame_index)
+        if not self.writer or cell is None:
+            return
+        if self.index[cell, 1] >= 0:
+            return
+        data = np.ascontiguousarray(detections, dtype=np.float32).reshape(-1, 6)
+        end = os.lseek(self.boxes_fd, 0, os.SEEK_END)
+        start = end // ROW_BYTES
+        if end % ROW_BYTES:
+            # Cola de una escritura interrumpida: se descarta
+            start += 1
+        if len(data):
+            os.pwrite(self.boxes_fd, data.tobytes(), start * ROW_BYTES)
+        # El índice se escribe después de los datos: una entrada visible siempre apunta a filas completas
+        self.index[cell] = (start, len(data))
+
+    def coverage(self):
+        if self.index is None or len(self.index) == 0:
+            return 0.0
+        return float(np.count_nonzero(self.index[:, 1] >= 0)) / len(self.index)
+
+    def close(self):
+        if self.index is not None:
+            if self.writer:
+                self.index.flush()
+            self.index = None
+        os.close(self.boxes_fd)
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
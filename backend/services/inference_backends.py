@@ -0,0 +1,319 @@
+"""
+Registro de backends de inferencia y auto-benchmark.
+
+Backends disponibles (todos cumplen detect(frames) -> lista de arrays (N, 6)):
+    ultralytics  comportamiento clásico: el export ONNX vía Ultralytics si existe, si no los pesos .pt
+    pytorch      yolo11n.pt con Ultralytics/PyTorch
+    onnx         export ONNX FP32 con onnxruntime nativo (services/onnx_engine.py)
+    onnx-int8    cuantización estática INT8 calibrada con clips propios
+    openvino     IR de OpenVINO exportado por Ultralytics
+
+Los artefactos se guardan y construyen en services/model_store.py.
+
+Uso desde la raíz del proyecto:
+    python -m backend.services.inference_backends --clip cameras/ref.mp4 --calibration cameras/a.mp4 cameras/b.mp4
+
+El resultado se guarda en inference_backend.json y se usa con DETECTION_ENGINE=auto.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing as mp
+import os
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from . import model_store
+
+BACKEND_CHOICE_PATH = os.path.join(model_store.MODEL_DIR, 'inference_backend.json')
+
+# Backends que no necesitan Ultralytics: el tracking usa el ByteTrack NumPy
+NATIVE_BACKENDS = ("onnx", "onnx-int8")
+BENCHMARK_ORDER = ("pytorch", "onnx", "onnx-int8", "openvino")
+# Frames del clip de referencia que puntúa el benchmark: la calibración INT8 nunca los usa,
+# así la verificación de precisión no mide el modelo sobre sus propios datos de calibración
+BENCHMARK_FRAMES = 100
+
+
+class UltralyticsBackend:
+    """Adapta un modelo YOLO de Ultralytics (pt, onnx u openvino) al contrato detect(frames)."""
+    def __init__(self, model, imgsz=320, conf_threshold=0.40, classes=(0,)):
+        self.model = model
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.classes = list(classes)
+
+    def detect(self, frames):
+        if not frames:
+            return []
+        results = self.model.predict(list(frames), classes=self.classes, conf=self.conf_threshold,
+                                     imgsz=self.imgsz, verbose=False, device='cpu')
+        return [r.boxes.data.cpu().numpy().astype(np.float32) for r in results]
+
+
+def _load_pytorch(imgsz, conf_threshold, classes, num_threads):
+    from ultralytics import YOLO
+    return UltralyticsBackend(YOLO(model_store.weights_path()), imgsz, conf_threshold, classes)
+
+
+def _load_openvino(imgsz, conf_threshold, classes, num_threads):
+    from ultralytics import YOLO
+    return UltralyticsBackend(YOLO(model_store.openvino_path(imgsz), task='detect'), imgsz, conf_threshold, classes)
+
+
+def _load_onnx(imgsz, conf_threshold, classes, num_threads):
+    from .onnx_engine import OnnxDetector
+    return OnnxDetector(model_store.onnx_path(imgsz), imgsz=imgsz, conf_threshold=conf_threshold,
+                        classes=classes, num_threads=num_threads)
+
+
+def _load_onnx_int8(imgsz, conf_threshold, classes, num_threads):
+    from .onnx_engine import OnnxDetector
+    if not model_store.is_valid("onnx-int8", imgsz):
+        raise FileNotFoundError("No INT8 model built yet: run the benchmark/model_store CLI with --calibration clips")
+    return OnnxDetector(model_store.artifact_path("onnx-int8", imgsz), imgsz=imgsz, conf_threshold=conf_threshold,
+                        classes=classes, num_threads=num_threads)
+
+
+BACKENDS = {
+    "pytorch": _load_pytorch,
+    "onnx": _load_onnx,
+    "onnx-int8": _load_onnx_int8,
+    "openvino": _load_openvino,
+}
+
+def saved_choice(path=BACKEND_CHOICE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f).get("backend")
+    except (OSError, ValueError):
+        return None
+
+
+def resolve_backend_name(name):
+    """'auto' -> backend elegido por el último benchmark de este host (o 'ultralytics' si no hay)."""
+    name = (name or "ultralytics").lower()
+    if name == "auto":
+        return saved_choice() or "ultralytics"
+    return name
+
+
+def required_artifacts(name=None):
+    """Variantes del model store que necesita el backend configurado para arrancar."""
+    name = resolve_backend_name(name or os.environ.get("DETECTION_ENGINE", "ultralytics"))
+    # onnx-int8 también construye el FP32: es la base de la cuantización y el fallback si no hay clips de calibración
+    return {"ultralytics": ["onnx"], "pytorch": ["pytorch"], "onnx": ["onnx"], "onnx-int8": ["onnx", "onnx-int8"],
+            "openvino": ["openvino"]}.get(name, [])
+
+
+def calibration_clips():
+    """
+    Clips de BENCHMARK_CALIBRATION (separados por comas), o BENCHMARK_CLIP si no hay; en ese
+    caso la calibración toma los frames posteriores a los que puntúa el benchmark.
+    """
+    clips = [c for c in os.environ.get("BENCHMARK_CALIBRATION", "").split(",") if c]
+    clip = os.environ.get("BENCHMARK_CLIP")
+    return clips or ([clip] if clip else [])
+
+
+def load_backend(name, imgsz=320, conf_threshold=0.40, classes=(0,), num_threads=1):
+    if name not in BACKENDS:
+        raise ValueError(f"Backend de inferencia desconocido: {name}")
+    return BACKENDS[name](imgsz, conf_threshold, classes, num_threads)
+
+
+def read_clip(path, max_frames=100, stride=1, start=0):
+    """Frames BGR de un clip (desde el frame `start`, cada `stride` frames, hasta `max_frames`)."""
+    cap = cv2.VideoCapture(path)
+    frames = []
+    for _ in range(start):
+        if not cap.grab():
+            break
+    idx = 0
+    while len(frames) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        if idx % stride == 0:
+            frames.append(frame)
+        idx += 1
+    cap.release()
+    return frames
+
+
+# --- Construcción de artefactos ---
+
+def _holdout(eval_clip=None, eval_frames=BENCHMARK_FRAMES):
+    """{ruta absoluta: frames iniciales reservados para evaluar} (por defecto los de BENCHMARK_CLIP)."""
+    clip = eval_clip or os.environ.get("BENCHMARK_CLIP")
+    return {os.path.abspath(clip): eval_frames} if clip else {}
+
+
+def quantize_int8(calibration_clips, output, imgsz=320, max_frames=300, holdout=None):
+    """
+    Cuantización estática INT8 (QDQ, pesos por canal) de yolo11n.onnx. Los rangos de
+    activación se calibran con frames de nuestras propias cámaras, preprocesados con
+    el mismo letterbox que usa OnnxDetector. De los clips en `holdout` (ruta -> frames)
+    se saltan los primeros frames, que son los que puntúa el benchmark.
+    """
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from .onnx_engine import OnnxDetector
+
+    fp32_path = model_store.onnx_path(imgsz)
+    prep = OnnxDetector(fp32_path, imgsz=imgsz, max_batch=1)
+
+    holdout = _holdout() if holdout is None else holdout
+    per_clip = max(1, max_frames // max(1, len(calibration_clips)))
+    frames = [f for clip in calibration_clips
+              for f in read_clip(clip, per_clip, stride=5, start=holdout.get(os.path.abspath(clip), 0))]
+    if not frames:
+        raise ValueError("Los clips de calibración no tienen frames legibles fuera de los que evalúa el benchmark")
+
+    class ClipReader(CalibrationDataReader):
+        def __init__(self):
+            self.frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self.frames, None)
+            if frame is None:
+                return None
+            prep._letterbox([frame])
+            return {prep.input_name: prep.blob[:1].copy()}
+
+    quantize_static(fp32_path, output, ClipReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    print(f"[BACKENDS] INT8 model written to {output} ({len(frames)} calibration frames)")
+    return output
+
+
+def build_artifact(name, imgsz=320, calibration_clips=None, holdout=None):
+    """Construye en el model store el artefacto que necesita el backend `name` (si falta). False si no se pudo."""
+    if name == "pytorch":
+        model_store.weights_path()
+    elif name == "onnx":
+        model_store.onnx_path(imgsz)
+    elif name == "openvino":
+        model_store.openvino_path(imgsz)
+    elif name == "onnx-int8":
+        if model_store.is_valid(name, imgsz):
+            return True
+        if not calibration_clips:
+            print("[BACKENDS] onnx-int8 needs --calibration clips, skipping")
+            return False
+        model_store.ensure(name, lambda tmp_dir: quantize_int8(
+            calibration_clips, os.path.join(tmp_dir, model_store.artifact_name(name, imgsz)), imgsz, holdout=holdout), imgsz)
+    return model_store.is_valid(name, imgsz)
+
+
+# --- Benchmark ---
+
+def detection_f1(reference, candidate, iou_threshold=0.5):
+    """F1 de las detecciones de `candidate` contra `reference`, acumulado sobre todos los frames."""
+    from .bytetrack import iou_matrix, linear_assignment
+
+    tp = fp = fn = 0
+    for ref, cand in zip(reference, candidate):
+        matches, _, _ = linear_assignment(1.0 - iou_matrix(ref[:, :4], cand[:, :4]), 1.0 - iou_threshold)
+        tp += len(matches)
+        fp += len(cand) - len(matches)
+        fn += len(ref) - len(matches)
+    if tp + fp + fn == 0:
+        return 1.0
+    return 2.0 * tp / (2.0 * tp + fp + fn)
+
+
+def benchmark(clip, names=BENCHMARK_ORDER, calibration_clips=None, max_delta=0.02, max_frames=BENCHMARK_FRAMES,
+              warmup=5, imgsz=320, num_threads=None, save_path=BACKEND_CHOICE_PATH):
+    """
+    Mide cada backend en este host sobre `clip` (latencia mediana por frame) y compara sus
+    detecciones contra la referencia más precisa disponible (pytorch, si no onnx FP32).
+    Elige el más rápido cuya pérdida de F1 no supere `max_delta` y lo guarda en `save_path`.
+    Si hay que construir el INT8, su calibración no usa los frames de `clip` que se evalúan.
+    """
+    num_threads = num_threads or os.cpu_count() or 1
+    frames = read_clip(clip, max_frames)
+    if not frames:
+        raise ValueError(f"No se pudieron leer frames de {clip}")
+
+    results = {}
+    detections = {}
+    for name in names:
+        try:
+            if not build_artifact(name, imgsz, calibration_clips, holdout=_holdout(clip, max_frames)):
+                continue
+            backend = load_backend(name, imgsz=imgsz, num_threads=num_threads)
+            for frame in frames[:warmup]:
+                backend.detect([frame])
+            timings, output = [], []
+            for frame in frames:
+                t0 = time.perf_counter()
+                output.append(backend.detect([frame])[0])
+                timings.append(time.perf_counter() - t0)
+            detections[name] = output
+            results[name] = {"latency_ms": float(np.median(timings) * 1000.0)}
+            print(f"[BACKENDS] {name}: {results[name]['latency_ms']:.1f} ms/frame")
+        except Exception as e:
+            print(f"[BACKENDS] {name} unavailable: {e}")
+
+    reference = next((n for n in ("pytorch", "onnx") if n in detections), None)
+    if reference is None:
+        print("[BACKENDS] No reference backend (pytorch/onnx) could run, nothing selected")
+        return None, results
+
+    for name in results:
+        results[name]["f1_vs_reference"] = detection_f1(detections[reference], detections[name])
+    eligible = [n for n in results if 1.0 - results[n]["f1_vs_reference"] <= max_delta]
+    choice = min(eligible, key=lambda n: results[n]["latency_ms"])
+
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
+    with open(save_path, "w") as f:
+        json.dump({
+            "backend": choice,
+            "reference": reference,
+            "max_delta": max_delta,
+            "clip": clip,
+            "host": platform.node(),
+            "cpu_count": os.cpu_count(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "results": results
+        }, f, indent=2)
+    print(f"[BACKENDS] Selected '{choice}' (reference: {reference})")
+    return choice, results
+
+
+def benchmark_on_startup():
+    """
+    Con DETECTION_ENGINE=auto y sin benchmark previo en este host, lo lanza en segundo
+    plano sobre BENCHMARK_CLIP (y BENCHMARK_CALIBRATION, separado por comas). Mientras
+    tanto se usa el backend clásico.
+    """
+    if os.environ.get("DETECTION_ENGINE", "").lower() != "auto" or saved_choice():
+        return
+    clip = os.environ.get("BENCHMARK_CLIP")
+    if not clip or not os.path.exists(clip):
+        print("[BACKENDS] DETECTION_ENGINE=auto without a saved benchmark; set BENCHMARK_CLIP or run the CLI")
+        return
+    # Proceso aparte: no cargar PyTorch/OpenVINO en el proceso de la API
+    mp.get_context("spawn").Process(target=benchmark, args=(clip,), kwargs={"calibration_clips": calibration_clips()}, daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de backends de inferencia YOLO en este host")
+    parser.add_argument("--clip", required=True, help="Clip de referencia para latencia y precisión")
+    parser.add_argument("--calibration", nargs="*", default=None,
+                        help="Clips para calibrar la cuantización INT8 (por defecto el resto de --clip, sin los frames evaluados)")
+    parser.add_argument("--backends", nargs="*", default=list(BENCHMARK_ORDER), choices=list(BENCHMARK_ORDER))
+    parser.add_argument("--max-delta", type=float, default=0.02, help="Pérdida máxima de F1 aceptada frente a la referencia")
+    parser.add_argument("--frames", type=int, default=BENCHMARK_FRAMES)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    benchmark(args.clip, args.backends, calibration_clips=args.calibration or [args.clip], max_delta=args.max_delta,
+              max_frames=args.frames, num_threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
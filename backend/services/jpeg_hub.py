@@ -0,0 +1,308 @@
+import asyncio
+import os
+import threading
+import time
+import cv2
+import numpy as np
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
+JPEG_QUALITY = 65
+# Tope de FPS del video en vivo cuando sale de los frames del lector (visores sin fps pedido, WebRTC)
+VIEWER_MAX_FPS = float(os.environ.get("VIEWER_MAX_FPS", "25.0"))
+# Con video del lector los metadatos se revisan a este intervalo entre frames
+META_POLL_SEC = 0.05
+
+_turbo = None
+_turbo_lock = threading.Lock()
+
+
+def encode_jpeg(frame, quality=JPEG_QUALITY):
+    """JPEG con libjpeg-turbo (PyTurboJPEG) si está instalado; si no, cv2.imencode."""
+    global _turbo
+    if TurboJPEG is not None:
+        with _turbo_lock:
+            if _turbo is None:
+                try:
+                    _turbo = TurboJPEG()
+                except Exception as e:
+                    # El paquete está pero no encuentra la librería nativa
+                    print(f"[JPEG-HUB] TurboJPEG no disponible ({e}), usando OpenCV")
+                    _turbo = False
+        if _turbo:
+            return _turbo.encode(frame, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return buffer.tobytes() if ret else None
+
+
+def mjpeg_part(jpeg):
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
+
+
+# Lo que ve un visor mientras la cámara conecta
+BLANK_JPEG = encode_jpeg(np.zeros((320, 320, 3), dtype=np.uint8))
+
+
+def scale_to_width(frame, width):
+    """Reduce el frame a `width` píxeles de ancho (nunca agranda)."""
+    h, w = frame.shape[:2]
+    if not width or width >= w:
+        return frame
+    return cv2.resize(frame, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_AREA)
+
+
+class JpegHub(threading.Thread):
+    """
+    Codifica a JPEG cada frame nuevo de una fuente una sola vez y lo reparte a
+    todos sus visores MJPEG. Los visores esperan en una Condition en lugar de sondear;
+    sin suscriptores el hilo no codifica nada. El costo escala con cámaras, no con visores.
+    Los endpoints async se suscriben con subscribe_async() y esperan un asyncio.Event.
+
+    Cada visor pide una variante (ancho, calidad) y un FPS máximo: se codifica una vez por
+    variante con visores, a lo sumo al FPS del visor más exigente de esa variante.
+
+    Con reader_frames=True el video sale de los frames del lector (push_frame), a la tasa
+    que piden los visores y no a la de inferencia; del servidor solo se toman los metadatos
+    que el navegador dibuja encima (feed SSE). Sin reader_frames el video es el frame
+    anotado del ring de resultados (overlays dibujados en el servidor).
+    """
+    def __init__(self, source_id, quality=JPEG_QUALITY, reader_frames=False):
+        super().__init__(daemon=True)
+        self.source_id = source_id
+        self.reader_frames = reader_frames
+        self.default_variant = (None, quality)
+        self.processor = None
+        self.cond = threading.Condition()
+        self.subscribers = 0
+        # variante -> FPS máximos pedidos por sus visores (None = sin límite)
+        self.variants = {}
+        # variante -> (secuencia propia, jpeg)
+        self.jpegs = {}
+        self.last_encode = {}
+        # Consumidores del frame sin JPEG (p. ej. WebRTC, que codifica a H.264)
+        self.frame_subscribers = 0
+        # Consumidores solo de metadatos (feed SSE de overlays)
+        self.meta_subscribers = 0
+        # Visores asyncio: (loop, asyncio.Event) que se despiertan con call_soon_threadsafe
+        self.async_waiters = set()
+        self.seq = 0
+        self.frame = None
+        self.meta_seq = 0
+        self.meta = None
+        # Último frame entregado por el lector y todavía no tomado por el hilo (reader_frames)
+        self.pending = None
+        self.last_push = 0.0
+        self.encoded = 0
+        self.stop_event = threading.Event()
+
+    def _add_variant(self, variant, fps):
+        self.variants.setdefault(variant or self.default_variant, []).append(fps)
+        self.subscribers += 1
+
+    def _remove_variant(self, variant, fps):
+        variant = variant or self.default_variant
+        wanted = self.variants.get(variant)
+        if wanted and fps in wanted:
+            wanted.remove(fps)
+            self.subscribers = max(0, self.subscribers - 1)
+            if not wanted:
+                del self.variants[variant]
+                self.jpegs.pop(variant, None)
+                self.last_encode.pop(variant, None)
+
+    def subscribe(self, variant=None, fps=None):
+        with self.cond:
+            self._add_variant(variant, fps)
+            self.cond.notify_all()
+
+    def unsubscribe(self, variant=None, fps=None):
+        with self.cond:
+            self._remove_variant(variant, fps)
+
+    def subscribe_async(self, loop, feed="jpeg", variant=None, fps=None):
+        """
+        Registra un visor asyncio; el Event se activa en su loop con cada frame o metadato nuevo.
+        feed="frame" solo necesita el frame (el hub no codifica por él) y feed="meta" solo los metadatos.
+        """
+        event = asyncio.Event()
+        with self.cond:
+            self.async_waiters.add((loop, event))
+            if feed == "jpeg":
+                self._add_variant(variant, fps)
+            elif feed == "frame":
+                self.frame_subscribers += 1
+            else:
+                self.meta_subscribers += 1
+            self.cond.notify_all()
+        return event
+
+    def unsubscribe_async(self, loop, event, feed="jpeg", variant=None, fps=None):
+        with self.cond:
+            self.async_waiters.discard((loop, event))
+            if feed == "jpeg":
+                self._remove_variant(variant, fps)
+            elif feed == "frame":
+                self.frame_subscribers = max(0, self.frame_subscribers - 1)
+            else:
+                self.meta_subscribers = max(0, self.meta_subscribers - 1)
+
+    def change_variant(self, old, old_fps, new, new_fps):
+        """Mueve un visor de variante/FPS (modo adaptativo, vista oculta) sin perder su suscripción."""
+        with self.cond:
+            self._remove_variant(old, old_fps)
+            self._add_variant(new, new_fps)
+
+    def latest(self, variant=None):
+        """(secuencia de la variante, jpeg) más reciente; (0, None) si aún no se codificó."""
+        with self.cond:
+            return self.jpegs.get(variant or self.default_variant, (0, None))
+
+    def latest_frame(self):
+        with self.cond:
+            return self.seq, self.frame
+
+    def latest_meta(self):
+        """(secuencia, metadatos) del último resultado del servidor: cajas, IDs, conteos, líneas."""
+        with self.cond:
+            return self.meta_seq, self.meta
+
+    def view_fps(self):
+        """FPS de video que piden los visores al lector (0 sin visores de video o sin reader_frames)."""
+        with self.cond:
+            if not self.reader_frames:
+                return 0.0
+            wanted = [fps for variant_fps in self.variants.values() for fps in variant_fps]
+            if self.frame_subscribers:
+                wanted.append(None)
+        if not wanted:
+            return 0.0
+        return min(VIEWER_MAX_FPS, max(fps or VIEWER_MAX_FPS for fps in wanted))
+
+    def frame_wanted(self, now=None):
+        """True si toca entregar un frame del lector a los visores (a lo sumo a view_fps())."""
+        fps = self.view_fps()
+        # 10% de margen, igual que las variantes: los frames del lector llegan en instantes discretos
+        return fps > 0 and (now or time.time()) - self.last_push >= 0.9 / fps
+
+    def push_frame(self, frame, now=None):
+        """Frame crudo del lector para el video en vivo; el hilo del hub lo codifica y reparte."""
+        with self.cond:
+            self.pending = frame
+            self.last_push = now or time.time()
+            self.cond.notify_all()
+
+    def wait(self, after_seq, timeout=1.0, variant=None):
+        """Bloquea hasta que haya un JPEG de la variante más nuevo que `after_seq`. Retorna (seq, jpeg) o (after_seq, None)."""
+        variant = variant or self.default_variant
+        with self.cond:
+            if self.cond.wait_for(lambda: self.jpegs.get(variant, (0, None))[0] > after_seq or self.stop_event.is_set(), timeout):
+                seq, jpeg = self.jpegs.get(variant, (0, None))
+                if jpeg is not None:
+                    return seq, jpeg
+        return after_seq, None
+
+    def _encode_variants(self, frame):
+        now = time.time()
+        with self.cond:
+            wanted = [(variant, None if None in fps else max(fps)) for variant, fps in self.variants.items() if fps]
+        encoded = {}
+        scaled = {}
+        for variant, max_fps in wanted:
+            # 10% de margen: los resultados llegan en instantes discretos
+            if max_fps and now - self.last_encode.get(variant, 0) < 0.9 / max_fps:
+                continue
+            width, quality = variant
+            try:
+                if width not in scaled:
+                    scaled[width] = scale_to_width(frame, width)
+                jpeg = encode_jpeg(scaled[width], quality)
+            except Exception as e:
+                print(f"[JPEG-HUB-{self.source_id}] Error codificando: {e}")
+                continue
+            if jpeg is not None:
+                encoded[variant] = jpeg
+                self.last_encode[variant] = now
+                self.encoded += 1
+        return encoded
+
+    def run(self):
+        if self.reader_frames:
+            self._run_reader()
+        else:
+            self._run_results()
+
+    def _publish_frame(self, frame):
+        encoded = self._encode_variants(frame) if self.subscribers else {}
+        with self.cond:
+            self.seq += 1
+            self.frame = frame
+            for variant, jpeg in encoded.items():
+                if variant in self.variants:
+                    self.jpegs[variant] = (self.jpegs.get(variant, (0, None))[0] + 1, jpeg)
+            self.cond.notify_all()
+
+    def _run_reader(self):
+        processor = self.processor
+        meta_seq = 0
+        while not self.stop_event.is_set():
+            with self.cond:
+                if not self.subscribers and not self.frame_subscribers and not self.meta_subscribers:
+                    self.pending = None
+                    self.cond.wait(0.5)
+                    continue
+                self.cond.wait_for(lambda: self.pending is not None or self.stop_event.is_set(), META_POLL_SEC)
+                frame, self.pending = self.pending, None
+            woke = False
+            if frame is not None and (self.subscribers or self.frame_subscribers):
+                self._publish_frame(frame)
+                woke = True
+            # Metadatos del servidor (a la tasa de inferencia), independientes del video
+            processor.get_latest_processed_frame(None)
+            if processor.latest_seq != meta_seq:
+                meta_seq = processor.latest_seq
+                meta = processor.get_latest_metadata()
+                with self.cond:
+                    self.meta_seq += 1
+                    self.meta = meta
+                woke = True
+            if woke:
+                self._wake_async()
+
+    def _run_results(self):
+        processor = self.processor
+        frame_seq = 0
+        while not self.stop_event.is_set():
+            with self.cond:
+                if not self.subscribers and not self.frame_subscribers and not self.meta_subscribers:
+                    self.cond.wait(0.5)
+                    continue
+            # Un solo hilo por fuente espera al servidor; los visores esperan al hub
+            processor.wait_for_result(frame_seq, timeout=0.5)
+            frame = processor.get_latest_processed_frame(None)
+            if frame is None or processor.latest_seq == frame_seq:
+                continue
+            frame_seq = processor.latest_seq
+            with self.cond:
+                self.meta_seq += 1
+                self.meta = processor.get_latest_metadata()
+            self._publish_frame(frame)
+            self._wake_async()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+        self._wake_async()
+
+    def _wake_async(self):
+        with self.cond:
+            waiters = list(self.async_waiters)
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # El loop ya se cerró (apagado del servidor)
+                pass
@@ -0,0 +1,225 @@
+"""
+Almacén central de artefactos de modelo (pesos, exports ONNX/INT8/OpenVINO).
+
+Todo vive en MODEL_DIR (por defecto <proyecto>/models, o la variable MODEL_DIR), con
+un nombre por variante y tamaño de entrada, p. ej. yolo11n_320.onnx. Cada artefacto
+se construye una sola vez bajo un file lock, se escribe en un directorio temporal y
+se mueve con un rename atómico; su sha256 queda en manifest.json y se verifica al
+usarlo, así un export interrumpido nunca queda a medio escribir.
+
+Construir los artefactos antes de arrancar los workers:
+    python -m backend.services.model_store --backends onnx --imgsz 320
+"""
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+MODEL_DIR = os.environ.get("MODEL_DIR", os.path.join(PROJECT_DIR, "models"))
+MODEL_NAME = "yolo11n"
+MANIFEST = "manifest.json"
+
+# Sufijo de cada variante; openvino es un directorio
+VARIANTS = {
+    "pytorch": ".pt",
+    "onnx": ".onnx",
+    "onnx-int8": "_int8.onnx",
+    "openvino": "_openvino_model",
+}
+
+
+def artifact_name(variant, imgsz=320):
+    if variant == "pytorch":
+        # Los pesos no dependen del tamaño de entrada
+        return MODEL_NAME + VARIANTS[variant]
+    return f"{MODEL_NAME}_{imgsz}{VARIANTS[variant]}"
+
+
+def artifact_path(variant, imgsz=320):
+    return os.path.join(MODEL_DIR, artifact_name(variant, imgsz))
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    files = [path] if os.path.isfile(path) else sorted(
+        os.path.join(root, f) for root, _, names in os.walk(path) for f in names)
+    for file_path in files:
+        digest.update(os.path.relpath(file_path, path).encode() if file_path != path else b"")
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _signature(path):
+    """(ruta, tamaño, mtime) de cada archivo del artefacto: si no cambia, el checksum tampoco."""
+    files = [path] if os.path.isfile(path) else sorted(
+        os.path.join(root, f) for root, _, names in os.walk(path) for f in names)
+    return tuple((f, os.stat(f).st_size, os.stat(f).st_mtime_ns) for f in files)
+
+
+# ruta -> (firma, checksum) ya verificados en este proceso
+_verified = {}
+
+
+def _read_manifest():
+    try:
+        with open(os.path.join(MODEL_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(manifest):
+    tmp = os.path.join(MODEL_DIR, MANIFEST + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(MODEL_DIR, MANIFEST))
+
+
+def _record_checksum(name, digest):
+    """Agrega una entrada al manifest. Lock propio del manifest: cada build solo tiene el de su artefacto."""
+    with _locked(MANIFEST):
+        manifest = _read_manifest()
+        manifest[name] = digest
+        _write_manifest(manifest)
+
+
+@contextlib.contextmanager
+def _locked(name):
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    with open(os.path.join(MODEL_DIR, f".{name}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def is_valid(variant, imgsz=320):
+    """El artefacto existe y coincide con el checksum registrado al construirlo."""
+    name = artifact_name(variant, imgsz)
+    path = os.path.join(MODEL_DIR, name)
+    expected = _read_manifest().get(name)
+    if not os.path.exists(path) or expected is None:
+        return False
+    # Se vuelve a hashear solo si el artefacto cambió (tamaño/mtime) desde la última verificación
+    signature = _signature(path)
+    if _verified.get(path) == (signature, expected):
+        return True
+    if sha256_of(path) != expected:
+        return False
+    _verified[path] = (signature, expected)
+    return True
+
+
+def ensure(variant, builder, imgsz=320):
+    """
+    Devuelve la ruta del artefacto, construyéndolo con `builder(tmp_dir) -> ruta generada`
+    si falta o está corrupto. Varios procesos pueden llamarlo a la vez: solo uno construye
+    y los demás esperan el lock y reutilizan el resultado.
+    """
+    name = artifact_name(variant, imgsz)
+    path = os.path.join(MODEL_DIR, name)
+    if is_valid(variant, imgsz):
+        return path
+
+    with _locked(name):
+        # Otro proceso pudo haberlo construido mientras esperábamos el lock
+        if is_valid(variant, imgsz):
+            return path
+
+        print(f"[MODEL-STORE] Building {name}...")
+        tmp_dir = tempfile.mkdtemp(prefix=f".build-{name}-", dir=MODEL_DIR)
+        try:
+            built = builder(tmp_dir)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.replace(built, path)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        digest = sha256_of(path)
+        _record_checksum(name, digest)
+        print(f"[MODEL-STORE] {name} ready ({digest[:12]})")
+        return path
+
+
+# --- Builders ---
+
+def _copy_legacy_or_download(tmp_dir):
+    """yolo11n.pt: reutiliza el del directorio de trabajo de instalaciones anteriores o lo descarga."""
+    target = os.path.join(tmp_dir, MODEL_NAME + ".pt")
+    for legacy in (os.path.join(os.getcwd(), MODEL_NAME + ".pt"), os.path.join(PROJECT_DIR, MODEL_NAME + ".pt")):
+        if os.path.exists(legacy):
+            shutil.copy(legacy, target)
+            return target
+    from ultralytics import YOLO
+    cwd = os.getcwd()
+    try:
+        os.chdir(tmp_dir)
+        YOLO(MODEL_NAME + ".pt")
+    finally:
+        os.chdir(cwd)
+    return target
+
+
+def weights_path():
+    return ensure("pytorch", _copy_legacy_or_download)
+
+
+def _export(fmt, imgsz, tmp_dir):
+    """Exporta desde una copia de los pesos dentro de tmp_dir (Ultralytics escribe junto al .pt)."""
+    from ultralytics import YOLO
+    pt_copy = shutil.copy(weights_path(), os.path.join(tmp_dir, MODEL_NAME + ".pt"))
+    return YOLO(pt_copy).export(format=fmt, imgsz=imgsz, dynamic=True)
+
+
+def onnx_path(imgsz=320):
+    return ensure("onnx", lambda tmp_dir: _export("onnx", imgsz, tmp_dir), imgsz)
+
+
+def openvino_path(imgsz=320):
+    return ensure("openvino", lambda tmp_dir: _export("openvino", imgsz, tmp_dir), imgsz)
+
+
+def build(variants=("onnx",), imgsz=320, calibration_clips=None):
+    """Construye (si hace falta) las variantes pedidas; pensado para correr antes que los workers."""
+    from .inference_backends import build_artifact
+    for variant in variants:
+        try:
+            build_artifact(variant, imgsz, calibration_clips)
+        except Exception as e:
+            print(f"[MODEL-STORE] Could not build {variant} ({imgsz}): {e}")
+
+
+def build_before_workers(variants, imgsz=320, calibration_clips=None):
+    """Paso de arranque: construye en un proceso aparte (sin cargar PyTorch en la API) y espera."""
+    if all(is_valid(v, imgsz) for v in variants):
+        return
+    process = mp.get_context("spawn").Process(target=build, args=(tuple(variants), imgsz, calibration_clips))
+    process.start()
+    process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye los artefactos de modelo en MODEL_DIR")
+    parser.add_argument("--backends", nargs="*", default=["onnx"], choices=list(VARIANTS))
+    parser.add_argument("--imgsz", type=int, nargs="*", default=[320])
+    parser.add_argument("--calibration", nargs="*", default=None, help="Clips para calibrar onnx-int8")
+    args = parser.parse_args()
+    for imgsz in args.imgsz:
+        build(args.backends, imgsz, args.calibration)
+    print(f"[MODEL-STORE] Artifacts in {MODEL_DIR}:")
+    for name, digest in sorted(_read_manifest().items()):
+        print(f"  {name}  {digest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import time
+import cv2
+import numpy as np
+
+from .tripwire_engine import line_configs
+
+
+class MotionGate:
+    """
+    Pre-filtro barato que decide si vale la pena correr YOLO sobre un frame.
+    Compara una versión reducida en escala de grises contra un fondo promedio
+    (cv2.accumulateWeighted) y solo mira la franja alrededor del tripwire, que es
+    lo único que afecta al conteo.
+
+    La inferencia se mantiene a tasa completa mientras haya personas siendo
+    seguidas o movimiento en la franja; con la escena vacía y quieta solo se
+    hace una inferencia de refresco cada `idle_refresh_sec`. El servidor además
+    llama a has_motion() entre inferencias (sondeo a tasa propia), así que el
+    movimiento se nota aunque la tasa de inferencia esté en su mínimo.
+    """
+    def __init__(self, scale_width=160, pixel_threshold=25, motion_ratio=0.002,
+                 band_padding=0.15, background_alpha=0.05, idle_refresh_sec=2.0):
+        self.scale_width = scale_width
+        self.pixel_threshold = pixel_threshold
+        self.motion_ratio = motion_ratio
+        self.band_padding = band_padding
+        self.background_alpha = background_alpha
+        self.idle_refresh_sec = idle_refresh_sec
+
+        self.background = None
+        self.mask = None
+        self.mask_key = None
+        self.mask_pixels = 0
+        self.last_inference = 0.0
+        self.skipped = 0
+        # Resultado del último has_motion(), para que el control de tasa suba apenas hay movimiento
+        self.motion = False
+
+    def _small_gray(self, frame):
+        h, w = frame.shape[:2]
+        scale = self.scale_width / float(w)
+        small = cv2.resize(frame, (self.scale_width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _band_mask(self, shape, tripwire_data):
+        """Máscara de la franja alrededor de las líneas de conteo (o None para usar todo el frame)."""
+        lines = line_configs(tripwire_data)
+        if lines:
+            key = (shape,) + tuple(tuple(map(tuple, l["points"])) for l in lines)
+        else:
+            key = (shape,)
+        if key == self.mask_key:
+            return self.mask
+
+        self.mask_key = key
+        if len(key) == 1:
+            self.mask = None
+            self.mask_pixels = shape[0] * shape[1]
+            return None
+
+        h, w = shape
+        mask = np.zeros((h, w), dtype=np.uint8)
+        # Una línea gruesa es exactamente la franja a distancia <= padding del segmento
+        thickness = max(3, int(2 * self.band_padding * max(w, h)))
+        for line in lines:
+            pts = np.array([[int(x * w), int(y * h)] for x, y in line["points"]], dtype=np.int32)
+            cv2.polylines(mask, [pts], False, 255, thickness)
+        self.mask = mask
+        self.mask_pixels = max(1, int(np.count_nonzero(mask)))
+        return mask
+
+    def has_motion(self, frame, tripwire_data=None):
+        gray = self._small_gray(frame)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            self.motion = True
+            return True
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(gray, self.background, self.background_alpha)
+
+        _, moving = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        mask = self._band_mask(gray.shape, tripwire_data)
+        if mask is not None:
+            moving = cv2.bitwise_and(moving, mask)
+        self.motion = cv2.countNonZero(moving) / float(self.mask_pixels) >= self.motion_ratio
+        return self.motion
+
+    def should_infer(self, frame, tripwire_data=None, active_tracks=0, now=None, motion=None):
+        """motion: resultado ya calculado por un sondeo sobre este mismo frame (no se vuelve a comparar)."""
+        now = time.time() if now is None else now
+        # Siempre evaluamos el movimiento para que el fondo siga actualizándose
+        if motion is None:
+            motion = self.has_motion(frame, tripwire_data)
+
+        if motion or active_tracks > 0 or now - self.last_inference >= self.idle_refresh_sec:
+            self.last_inference = now
+            return True
+
+        self.skipped += 1
+        return False
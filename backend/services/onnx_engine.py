@@ -0,0 +1,139 @@
+import cv2
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+
+def nms(boxes, scores, iou_threshold):
+    """
+    NMS sobre cajas xyxy ya ordenadas por score descendente. La matriz IoU se calcula
+    de una sola vez; el recorrido solo combina filas booleanas.
+    Devuelve los índices conservados.
+    """
+    n = len(boxes)
+    if n == 0:
+        return np.zeros((0,), dtype=np.int64)
+    lt = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    rb = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    overlaps = inter / (area[:, None] + area[None, :] - inter + 1e-7) > iou_threshold
+
+    suppressed = np.zeros(n, dtype=bool)
+    keep = []
+    for i in range(n):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= overlaps[i]
+    return np.asarray(keep, dtype=np.int64)
+
+
+class OnnxDetector:
+    """
+    Corre el yolo11n.onnx exportado directamente con onnxruntime, sin el predictor de
+    Ultralytics. El letterbox y los tensores de entrada/salida se reservan una vez
+    para `max_batch` frames; el post-proceso (filtro de confianza + NMS) es NumPy.
+
+    detect(frames) cumple el mismo contrato que YoloDetector.detect: una lista de
+    arrays (N, 6) float32 con x1, y1, x2, y2, conf, cls en píxeles de cada frame.
+    """
+    def __init__(self, model_path, imgsz=320, conf_threshold=0.40, iou_threshold=0.7,
+                 classes=(0,), max_batch=8, num_threads=1, max_det=300):
+        if ort is None:
+            raise ImportError("onnxruntime no está instalado")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.output_name = self.session.get_outputs()[0].name
+        # Export con dynamic=True -> batch simbólico; un export estático solo acepta 1 frame
+        self.max_batch = max_batch if not isinstance(model_input.shape[0], int) else 1
+
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.classes = np.asarray(classes, dtype=np.int64) if classes is not None else None
+        self.max_det = max_det
+
+        self.canvas = np.full((self.max_batch, imgsz, imgsz, 3), 114, dtype=np.uint8)
+        self.blob = np.zeros((self.max_batch, 3, imgsz, imgsz), dtype=np.float32)
+        self.output = None
+        self.binding = self.session.io_binding()
+
+    def _letterbox(self, frames):
+        """Escala cada frame dentro de `canvas` manteniendo aspecto. Devuelve (gain, pad_x, pad_y) por frame."""
+        transforms = []
+        for i, frame in enumerate(frames):
+            h, w = frame.shape[:2]
+            gain = min(self.imgsz / h, self.imgsz / w)
+            nw, nh = int(round(w * gain)), int(round(h * gain))
+            px, py = (self.imgsz - nw) // 2, (self.imgsz - nh) // 2
+
+            canvas = self.canvas[i]
+            canvas[:] = 114
+            canvas[py:py + nh, px:px + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+            transforms.append((gain, px, py))
+
+        n = len(frames)
+        # BGR HWC uint8 -> RGB CHW float32 [0, 1], escrito directamente en el blob preasignado
+        np.multiply(self.canvas[:n, :, :, ::-1].transpose(0, 3, 1, 2), 1.0 / 255.0, out=self.blob[:n], casting="unsafe")
+        return transforms
+
+    def _run(self, n):
+        if self.output is None:
+            # La forma de salida (B, 4 + clases, anclas) solo se conoce tras la primera corrida
+            probe = self.session.run([self.output_name], {self.input_name: self.blob[:1]})[0]
+            self.output = np.zeros((self.max_batch,) + probe.shape[1:], dtype=np.float32)
+
+        out = self.output[:n]
+        self.binding.bind_input(self.input_name, "cpu", 0, np.float32, self.blob[:n].shape, self.blob.ctypes.data)
+        self.binding.bind_output(self.output_name, "cpu", 0, np.float32, out.shape, self.output.ctypes.data)
+        self.session.run_with_iobinding(self.binding)
+        return out
+
+    def _postprocess(self, pred, frame_shape, transform):
+        # pred: (4 + clases, anclas) con cx, cy, w, h en píxeles del letterbox
+        class_scores = pred[4:]
+        if self.classes is not None:
+            cls = self.classes[np.argmax(class_scores[self.classes], axis=0)]
+        else:
+            cls = np.argmax(class_scores, axis=0)
+        conf = class_scores[cls, np.arange(pred.shape[1])]
+
+        keep = conf > self.conf_threshold
+        if not np.any(keep):
+            return np.zeros((0, 6), dtype=np.float32)
+        cx, cy, bw, bh = pred[:4, keep]
+        conf, cls = conf[keep], cls[keep]
+
+        boxes = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+        order = np.argsort(-conf, kind="stable")[:30000]
+        boxes, conf, cls = boxes[order], conf[order], cls[order]
+
+        # NMS por clase desplazando cada clase a una región distinta del plano
+        kept = nms(boxes + cls[:, None] * 7680.0, conf, self.iou_threshold)[:self.max_det]
+        boxes, conf, cls = boxes[kept], conf[kept], cls[kept]
+
+        gain, px, py = transform
+        boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - px) / gain, 0, frame_shape[1])
+        boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - py) / gain, 0, frame_shape[0])
+        return np.concatenate([boxes, conf[:, None], cls[:, None]], axis=1).astype(np.float32)
+
+    def detect(self, frames):
+        results = []
+        for start in range(0, len(frames), self.max_batch):
+            chunk = frames[start:start + self.max_batch]
+            transforms = self._letterbox(chunk)
+            preds = self._run(len(chunk))
+            for frame, pred, transform in zip(chunk, preds, transforms):
+                results.append(self._postprocess(pred, frame.shape, transform))
+        return results
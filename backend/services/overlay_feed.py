@@ -0,0 +1,42 @@
+import json
+
+# Decimales de las coordenadas normalizadas de las líneas
+LINE_DECIMALS = 4
+
+
+def compact_metadata(seq, meta, include_lines=True):
+    """
+    Metadatos de un resultado del servidor en forma compacta para el navegador:
+    cajas en píxeles del frame ([x1, y1, x2, y2, id]), tamaño del frame, conteos
+    y, solo cuando cambian, las líneas del tripwire en coordenadas normalizadas.
+    Los trails los acumula el cliente con los centros de cada caja.
+    """
+    boxes = meta.get("boxes")
+    ids = meta.get("track_ids")
+    w, h = meta.get("orig_shape") or (0, 0)
+    data = {
+        "seq": seq,
+        "ts": round(meta.get("ts") or 0.0, 3),
+        "w": int(w),
+        "h": int(h),
+        "in": int(meta.get("entry_count", 0)),
+        "out": int(meta.get("exit_count", 0)),
+        "boxes": [list(map(int, box)) + [int(track_id)] for box, track_id in zip(boxes, ids)] if boxes is not None and ids is not None else []
+    }
+    if include_lines:
+        data["lines"] = [{
+            "name": line.get("name"),
+            "direction": line.get("direction") or "IN",
+            "points": [[round(float(x), LINE_DECIMALS), round(float(y), LINE_DECIMALS)] for x, y in line["points"]]
+        } for line in meta.get("lines") or []]
+    return data
+
+
+def lines_key(meta):
+    return json.dumps([(l.get("name"), l.get("direction"), l["points"]) for l in meta.get("lines") or []], default=float)
+
+
+def sse_event(data, event=None):
+    """Un evento text/event-stream con el JSON en una sola línea."""
+    head = f"event: {event}\n" if event else ""
+    return (head + "data: " + json.dumps(data, separators=(",", ":")) + "\n\n").encode()
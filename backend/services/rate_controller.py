@@ -0,0 +1,84 @@
+import os
+import time
+
+
+def host_cpu_saturation():
+    """Carga promedio del último minuto dividida por el número de núcleos (1.0 = CPU llena)."""
+    try:
+        return os.getloadavg()[0] / float(os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+class AdaptiveRateController:
+    """
+    Decide a cuántos FPS inferir una cámara, entre `min_fps` y `max_fps`.
+    El piso es solo de la inferencia: el sondeo de movimiento del servidor
+    corre a su propia tasa (MOTION_PROBE_FPS en async_yolo).
+
+    - Escena con personas o movimiento en la franja -> más frames; escena vacía y quieta -> `min_fps`.
+    - Personas rápidas respecto al tripwire -> suficientes frames para que nadie
+      avance más de `max_step` (fracción del frame) entre dos inferencias.
+    - Latencia de inferencia alta o CPU del host saturada -> se recorta la tasa.
+
+    Sube de inmediato (no perder cruces) y baja de forma suavizada.
+    """
+    def __init__(self, min_fps=2.0, max_fps=15.0, initial_fps=12.0, max_step=0.05,
+                 busy_fps=10.0, cpu_target=0.85, decay=0.2):
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.max_step = max_step
+        self.busy_fps = busy_fps
+        self.cpu_target = cpu_target
+        self.decay = decay
+        self.fps = min(max(initial_fps, min_fps), max_fps)
+
+    def target_fps(self, latency, cpu_saturation, active_tracks, approach_speed, motion=False):
+        """
+        latency: segundos que tomó la última inferencia de esta cámara.
+        cpu_saturation: carga del host / núcleos.
+        active_tracks: personas seguidas actualmente.
+        approach_speed: velocidad máxima hacia el tripwire, en fracciones del frame por segundo.
+        motion: el MotionGate vio movimiento en la franja (alguien entra antes de que haya pistas).
+        """
+        if active_tracks <= 0 and not motion:
+            target = self.min_fps
+        else:
+            target = max(self.busy_fps, approach_speed / self.max_step)
+
+        # No pedir más de lo que la inferencia puede entregar
+        if latency > 0:
+            target = min(target, 1.0 / latency)
+
+        # Ceder CPU cuando el host está saturado
+        if cpu_saturation > self.cpu_target:
+            target *= self.cpu_target / cpu_saturation
+
+        return min(max(target, self.min_fps), self.max_fps)
+
+    def update(self, latency, cpu_saturation, active_tracks, approach_speed, motion=False):
+        target = self.target_fps(latency, cpu_saturation, active_tracks, approach_speed, motion)
+        if target >= self.fps:
+            self.fps = target
+        else:
+            self.fps += (target - self.fps) * self.decay
+        return self.fps
+
+    @property
+    def interval(self):
+        return 1.0 / self.fps
+
+
+class CpuSaturationSampler:
+    """Cachea host_cpu_saturation() para no consultarla en cada iteración del servidor."""
+    def __init__(self, period=1.0):
+        self.period = period
+        self.value = 0.0
+        self.last_sample = 0.0
+
+    def sample(self, now=None):
+        now = time.time() if now is None else now
+        if now - self.last_sample >= self.period:
+            self.value = host_cpu_saturation()
+            self.last_sample = now
+        return self.value
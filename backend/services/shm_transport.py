@@ -0,0 +1,212 @@
+import pickle
+import time
+import uuid
+import numpy as np
+from multiprocessing import shared_memory
+
+# Los frames llegan del VideoReaderWrapper con un ancho máximo de 800px.
+# Reservamos hasta 1600px de alto para cubrir cámaras verticales; las páginas
+# de /dev/shm solo se materializan cuando se escriben, así que el tamaño
+# reservado no se traduce en RAM real.
+MAX_FRAME_WIDTH = 800
+MAX_FRAME_HEIGHT = 1600
+DEFAULT_SLOTS = 3
+DEFAULT_META_BYTES = 256 * 1024
+
+# Cabecera global: [ultimo_seq_publicado, contadores de usuario...]
+_CONTROL_FIELDS = 8
+# Cabecera por slot: [seq, alto, ancho, canales, bytes_meta, reservado...]
+_SLOT_FIELDS = 8
+_SEQ, _H, _W, _C, _META_LEN = range(5)
+
+
+class SharedFrameRing:
+    """
+    Ring buffer de frames BGR en memoria compartida (un productor, N lectores).
+    El productor escribe el frame directamente en un slot y publica un número de
+    secuencia; el lector copia el slot más reciente a su propio buffer y valida
+    que la secuencia no cambió durante la copia (seqlock). No hay pickling de
+    imágenes: solo viaja un pequeño diccionario de metadatos por slot.
+    """
+    def __init__(self, name=None, create=True, slots=DEFAULT_SLOTS,
+                 max_width=MAX_FRAME_WIDTH, max_height=MAX_FRAME_HEIGHT,
+                 meta_bytes=DEFAULT_META_BYTES):
+        self.slots = slots
+        self.max_width = max_width
+        self.max_height = max_height
+        self.meta_bytes = meta_bytes
+        self.frame_bytes = max_width * max_height * 3
+        self.owner = create
+        # Escrituras descartadas / metadatos recortados (se loguean, nunca se pierden en silencio)
+        self.dropped = 0
+        self.trimmed = 0
+
+        control_size = _CONTROL_FIELDS * 8
+        headers_size = slots * _SLOT_FIELDS * 8
+        self._meta_offset = control_size + headers_size
+        self._frames_offset = self._meta_offset + slots * meta_bytes
+        total = self._frames_offset + slots * self.frame_bytes
+
+        if create:
+            name = name or f"cntprs_{uuid.uuid4().hex[:12]}"
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        else:
+            # Los workers se crean con 'spawn' y comparten el resource_tracker del padre,
+            # así que adjuntarse no duplica la responsabilidad de hacer unlink.
+            self.shm = shared_memory.SharedMemory(name=name, create=False)
+        self.name = self.shm.name
+
+        buf = self.shm.buf
+        self.control = np.ndarray((_CONTROL_FIELDS,), dtype=np.int64, buffer=buf, offset=0)
+        self.headers = np.ndarray((slots, _SLOT_FIELDS), dtype=np.int64, buffer=buf, offset=control_size)
+        self.meta = np.ndarray((slots, meta_bytes), dtype=np.uint8, buffer=buf, offset=self._meta_offset)
+        self.frames = np.ndarray((slots, self.frame_bytes), dtype=np.uint8, buffer=buf, offset=self._frames_offset)
+
+        if create:
+            self.control[:] = 0
+            self.headers[:] = 0
+
+    def spec(self):
+        """Parámetros necesarios para abrir el mismo ring desde otro proceso."""
+        return {
+            "name": self.name,
+            "slots": self.slots,
+            "max_width": self.max_width,
+            "max_height": self.max_height,
+            "meta_bytes": self.meta_bytes,
+        }
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(create=False, **spec)
+
+    def fits(self, frame):
+        h, w = frame.shape[:2]
+        return w <= self.max_width and h <= self.max_height
+
+    @property
+    def latest_seq(self):
+        return int(self.control[0])
+
+    @property
+    def counters(self):
+        """Enteros libres de la cabecera (p. ej. entradas/salidas) visibles para todos los procesos."""
+        return self.control[1:]
+
+    def _log_drop(self, counter, message):
+        # Primera vez y luego cada 100, para no inundar el log a 15 fps
+        if counter == 1 or counter % 100 == 0:
+            print(f"[SHM] ERROR: ring {self.name}: {message} ({counter} so far)")
+
+    def write(self, frame, meta=None, essential=None):
+        """
+        Publica un frame (y opcionalmente un dict pequeño de metadatos).
+        Si los metadatos no entran en su región y se indican claves `essential`, se
+        publican solo esas (p. ej. conteos y eventos) en lugar de perderlas.
+        Retorna el número de secuencia asignado, o 0 si el frame o los metadatos no
+        caben; el descarte queda en el log y en `dropped`.
+        """
+        if frame is not None and not self.fits(frame):
+            self.dropped += 1
+            self._log_drop(self.dropped, f"frame {frame.shape[1]}x{frame.shape[0]} exceeds {self.max_width}x{self.max_height}, write dropped")
+            return 0
+
+        payload = None
+        if meta is not None:
+            payload = pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL)
+            if len(payload) > self.meta_bytes and essential:
+                self.trimmed += 1
+                self._log_drop(self.trimmed, f"metadata of {len(payload)} bytes exceeds {self.meta_bytes}, sending only {', '.join(essential)}")
+                payload = pickle.dumps({k: meta[k] for k in essential if k in meta}, protocol=pickle.HIGHEST_PROTOCOL)
+            if len(payload) > self.meta_bytes:
+                self.dropped += 1
+                self._log_drop(self.dropped, f"metadata of {len(payload)} bytes exceeds {self.meta_bytes}, write dropped")
+                return 0
+
+        seq = self.latest_seq + 1
+        slot = seq % self.slots
+        header = self.headers[slot]
+
+        # seq=0 marca el slot como "en escritura" para los lectores
+        header[_SEQ] = 0
+
+        if frame is not None:
+            h, w = frame.shape[:2]
+            c = frame.shape[2] if frame.ndim == 3 else 1
+            view = self.frames[slot, :h * w * c].reshape(h, w, c) if c > 1 else self.frames[slot, :h * w].reshape(h, w)
+            np.copyto(view, frame)
+            header[_H], header[_W], header[_C] = h, w, c
+        else:
+            header[_H], header[_W], header[_C] = 0, 0, 0
+
+        meta_len = 0
+        if payload is not None:
+            meta_len = len(payload)
+            self.meta[slot, :meta_len] = np.frombuffer(payload, dtype=np.uint8)
+        header[_META_LEN] = meta_len
+
+        header[_SEQ] = seq
+        self.control[0] = seq
+        return seq
+
+    def read_latest(self, after_seq=0, out=None):
+        """
+        Lee el slot más reciente si su secuencia es mayor que `after_seq`.
+        Copia el frame en `out` (buffer preasignado del lector) cuando se entrega,
+        o en un array nuevo si no. Retorna (seq, frame, meta) o (0, None, None).
+        """
+        for _ in range(3):
+            seq = self.latest_seq
+            if seq <= after_seq:
+                return 0, None, None
+
+            slot = seq % self.slots
+            header = self.headers[slot]
+            if int(header[_SEQ]) != seq:
+                continue
+
+            h, w, c = int(header[_H]), int(header[_W]), int(header[_C])
+            meta_len = int(header[_META_LEN])
+
+            frame = None
+            if h > 0 and w > 0:
+                size = h * w * c
+                shape = (h, w, c) if c > 1 else (h, w)
+                if out is not None and out.size >= size:
+                    frame = out.reshape(-1)[:size].reshape(shape)
+                    np.copyto(frame, self.frames[slot, :size].reshape(shape))
+                else:
+                    frame = self.frames[slot, :size].reshape(shape).copy()
+
+            meta_raw = bytes(self.meta[slot, :meta_len]) if meta_len else None
+
+            # El productor dio la vuelta al ring mientras copiábamos: reintentar
+            if int(header[_SEQ]) != seq:
+                continue
+
+            meta = pickle.loads(meta_raw) if meta_raw else None
+            return seq, frame, meta
+
+        return 0, None, None
+
+    def wait_for(self, after_seq, timeout=1.0, poll_interval=0.002):
+        """Espera (sondeando un entero en shm) hasta que exista un frame más nuevo que `after_seq`."""
+        deadline = time.time() + timeout
+        while self.latest_seq <= after_seq:
+            if time.time() >= deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def close(self):
+        # Los arrays numpy mantienen referencias al buffer; hay que soltarlas antes de cerrar
+        self.control = self.headers = self.meta = self.frames = None
+        try:
+            self.shm.close()
+        except Exception:
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
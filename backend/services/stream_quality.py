@@ -0,0 +1,75 @@
+from .jpeg_hub import JPEG_QUALITY
+
+# Anchos a los que se redondea lo que pide cada visor, para que pedidos parecidos compartan la misma codificación.
+# Por encima del mayor se envía el frame completo (el lector ya lo limita a MAX_WIDTH).
+STREAM_WIDTHS = (160, 240, 320, 480, 640)
+MIN_QUALITY = 20
+MAX_QUALITY = 90
+
+# Intervalo de referencia para visores sin FPS máximo (~ lo que publica el servidor de inferencia)
+DEFAULT_INTERVAL = 0.1
+# Escalones del modo adaptativo: (ancho, calidad), del mejor al más liviano
+ADAPTIVE_LADDER = ((None, JPEG_QUALITY), (640, 55), (480, 45), (320, 40), (240, 30))
+# Visores con la vista oculta: una instantánea chica cada 1/HIDDEN_FPS segundos, compartida por todos
+HIDDEN_VARIANT = (320, 40)
+HIDDEN_FPS = 0.2
+# Enviar un frame tarda más que SLOW_FACTOR intervalos => el socket no drena
+SLOW_FACTOR = 1.0
+SLOW_FRAMES = 3
+# Envíos holgados seguidos antes de volver a subir un escalón
+FAST_FRAMES = 50
+
+
+def stream_variant(width=None, quality=None):
+    """(ancho, calidad) normalizados para un visor: ancho redondeado hacia arriba a STREAM_WIDTHS, calidad de a 5."""
+    if width:
+        width = next((w for w in STREAM_WIDTHS if w >= width), None)
+    if quality:
+        quality = min(MAX_QUALITY, max(MIN_QUALITY, int(round(quality / 5.0)) * 5))
+    else:
+        quality = JPEG_QUALITY
+    return width, quality
+
+
+def _smaller_or_equal(a, b):
+    return b is None or (a is not None and a <= b)
+
+
+class AdaptiveQuality:
+    """
+    Elige la variante de un visor según lo que tarda en salir cada frame. En el generador
+    async cada yield vuelve cuando el servidor pudo escribir la parte en el socket, así que
+    ese tiempo mide cuánto se está atrasando el cliente: si supera el intervalo entre frames
+    se baja un escalón (menos resolución y calidad), y tras muchos envíos holgados se sube.
+    Nunca pasa del ancho y la calidad que pidió el visor.
+    """
+    def __init__(self, width=None, quality=None):
+        top = stream_variant(width, quality)
+        self.ladder = [top] + [v for v in ADAPTIVE_LADDER
+                               if _smaller_or_equal(v[0], top[0]) and v[1] <= top[1] and v != top]
+        self.level = 0
+        self.slow = 0
+        self.fast = 0
+
+    @property
+    def variant(self):
+        return self.ladder[self.level]
+
+    def update(self, send_seconds, interval):
+        """Registra lo que tardó un envío; retorna True si cambió la variante."""
+        interval = max(interval, 0.05)
+        if send_seconds > interval * SLOW_FACTOR:
+            self.slow += 1
+            self.fast = 0
+            if self.slow >= SLOW_FRAMES and self.level < len(self.ladder) - 1:
+                self.level += 1
+                self.slow = 0
+                return True
+        elif send_seconds < interval * 0.25:
+            self.fast += 1
+            self.slow = 0
+            if self.fast >= FAST_FRAMES and self.level > 0:
+                self.level -= 1
+                self.fast = 0
+                return True
+        return False
@@ -0,0 +1,138 @@
+import numpy as np
+
+# Las líneas ya contadas por cada track se guardan como bits de un int64 (sin el bit de signo):
+# una cámara admite como máximo estas líneas, contando el tripwire principal
+MAX_LINES = 63
+
+
+class TrackStore:
+    """
+    Estado de trayectorias de una cámara en buffers NumPy preasignados.
+
+    Cada track ocupa un slot fijo; sus últimos `history` centroides viven en un
+    ring duplicado (cada punto se escribe en i y en i + history), así la ventana
+    cronológica siempre es un slice contiguo y se entrega como vista de solo
+    lectura, sin copiar ni crear listas por frame. Los tracks que desaparecen se
+    liberan en bloque al final de cada update().
+    """
+    def __init__(self, capacity=64, history=30):
+        self.history = history
+        self.slot_of = {}
+        self.free = []
+        self.stamp = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        old = getattr(self, "ids", None)
+        n_old = 0 if old is None else len(old)
+
+        points = np.zeros((capacity, 2 * self.history, 2), dtype=np.int32)
+        pushes = np.zeros(capacity, dtype=np.int64)
+        ids = np.full(capacity, -1, dtype=np.int64)
+        seen = np.zeros(capacity, dtype=np.int64)
+        # Bit l encendido = este track ya contó en la línea l
+        counted = np.zeros(capacity, dtype=np.int64)
+        if n_old:
+            points[:n_old] = self.points
+            pushes[:n_old] = self.pushes
+            ids[:n_old] = self.ids
+            seen[:n_old] = self.seen
+            counted[:n_old] = self.counted
+
+        self.points, self.pushes, self.ids, self.seen, self.counted = points, pushes, ids, seen, counted
+        # Slots libres en orden para reutilizar primero los más bajos
+        self.free.extend(range(capacity - 1, n_old - 1, -1))
+
+    def clear(self):
+        """Olvida todos los tracks conservando los buffers reservados."""
+        self.slot_of.clear()
+        self.ids.fill(-1)
+        self.pushes.fill(0)
+        self.counted.fill(0)
+        self.seen.fill(0)
+        self.stamp = 0
+        self.free = list(range(len(self.ids) - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, track_id):
+        return track_id in self.slot_of
+
+    def _slots_for(self, track_ids):
+        slots = np.empty(len(track_ids), dtype=np.int64)
+        for i, track_id in enumerate(track_ids.tolist()):
+            slot = self.slot_of.get(track_id)
+            if slot is None:
+                if not self.free:
+                    # Crecer es excepcional: duplicamos una sola vez y seguimos sin asignar
+                    self._allocate(2 * len(self.ids))
+                slot = self.free.pop()
+                self.slot_of[track_id] = slot
+                self.ids[slot] = track_id
+                self.pushes[slot] = 0
+                self.counted[slot] = 0
+            slots[i] = slot
+        return slots
+
+    def update(self, track_ids, centers):
+        """
+        track_ids: (N,) ids activos en este frame; centers: (N, 2) centroides en píxeles.
+        Agrega un punto a cada track, libera los que ya no aparecen y devuelve sus slots.
+        """
+        self.stamp += 1
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        slots = self._slots_for(track_ids)
+
+        if len(slots):
+            idx = self.pushes[slots] % self.history
+            self.points[slots, idx] = centers
+            self.points[slots, idx + self.history] = centers
+            self.pushes[slots] += 1
+            self.seen[slots] = self.stamp
+
+        # Cleanup untracked IDs to avoid memory leaks (en bloque)
+        dead = np.flatnonzero((self.ids >= 0) & (self.seen != self.stamp))
+        for slot in dead.tolist():
+            del self.slot_of[int(self.ids[slot])]
+            self.free.append(slot)
+        if len(dead):
+            self.ids[dead] = -1
+            self.pushes[dead] = 0
+            self.counted[dead] = 0
+        return slots
+
+    def last_steps(self, slots):
+        """Para los slots con al menos dos puntos: (índices en `slots`, punto previo, punto actual)."""
+        moving = np.flatnonzero(self.pushes[slots] >= 2)
+        s = slots[moving]
+        last = (self.pushes[s] - 1) % self.history + self.history
+        return moving, self.points[s, last - 1], self.points[s, last]
+
+    def counted_mask(self, slots, n_lines):
+        """(len(slots), n_lines) bool: pares (track, línea) que ya contaron."""
+        if n_lines > MAX_LINES:
+            raise ValueError(f"At most {MAX_LINES} lines per camera, got {n_lines}")
+        bits = np.left_shift(1, np.arange(n_lines, dtype=np.int64))
+        return (self.counted[slots, None] & bits) != 0
+
+    def mark_counted(self, slot, line_idx):
+        if not 0 <= line_idx < MAX_LINES:
+            raise ValueError(f"Line index {line_idx} out of range (max {MAX_LINES} lines)")
+        self.counted[slot] |= 1 << line_idx
+
+    def trail(self, track_id):
+        """Vista de solo lectura con la trayectoria (en orden cronológico) del track."""
+        slot = self.slot_of.get(track_id)
+        if slot is None:
+            return self.points[0, :0]
+        n = int(self.pushes[slot])
+        length = min(n, self.history)
+        end = (n - 1) % self.history + self.history + 1
+        view = self.points[slot, end - length:end]
+        view.flags.writeable = False
+        return view
+
+    def trails(self):
+        """{track_id: vista de solo lectura} para todos los tracks vivos."""
+        return {track_id: self.trail(track_id) for track_id in self.slot_of}
@@ -0,0 +1,222 @@
+"""
+Almacén de trayectorias por cámara, para recalcular conteos con otra línea sin volver a correr YOLO.
+
+Cada punto es un registro binario de 20 bytes (timestamp, id de track, centroide
+normalizado en uint16) que los servidores de inferencia agregan al final de un
+archivo por cámara y por hora:
+
+    TRAJECTORY_DIR/<source_id>/<YYYYmmddHH>.traj
+
+Junto a los archivos horarios, frame.json guarda el tamaño del frame (w, h) para
+que el recálculo mida los saltos en anchos de frame, igual que el conteo en vivo.
+
+Los ids de ByteTrack se reinician con cada alta de cámara, así que el id guardado
+lleva en los 32 bits altos una sesión aleatoria elegida en cada reset().
+"""
+import datetime
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from .tripwire_engine import MAX_JUMP_WIDTH, long_jumps, segment_crossings
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TRAJECTORY_DIR = os.environ.get("TRAJECTORY_DIR", os.path.join(PROJECT_DIR, "trajectories"))
+RETENTION_DAYS = 30
+
+POINT = np.dtype([("t", "<f8"), ("track", "<u8"), ("x", "<u2"), ("y", "<u2")])
+COORD_SCALE = 65535
+# Pasos evaluados por bloque al recalcular (acota la memoria de la matriz pasos x segmentos)
+RECOUNT_BLOCK = 1 << 18
+
+
+def _frame_file(root, source_id):
+    return os.path.join(root, str(source_id), "frame.json")
+
+
+def _hour_file(root, source_id, ts):
+    hour = datetime.datetime.fromtimestamp(ts).strftime("%Y%m%d%H")
+    return os.path.join(root, str(source_id), f"{hour}.traj")
+
+
+class TrajectoryWriter:
+    """
+    Buffer preasignado de puntos de una cámara; se vuelca al archivo de la hora cada
+    `flush_sec` segundos (o al llenarse) con una sola escritura en modo append. El
+    servidor llama a maybe_flush() en cada vuelta, así una escena que queda quieta no
+    deja puntos sin escribir; al soltar la cámara (close/reset) se vuelca todo.
+    """
+    def __init__(self, root=TRAJECTORY_DIR, capacity=4096, flush_sec=5.0):
+        self.root = root
+        self.flush_sec = flush_sec
+        self.buffer = np.zeros(capacity, dtype=POINT)
+        self.size = 0
+        self.source_id = None
+        self.session = 0
+        self.frame_size = None
+        self.last_flush = time.time()
+
+    def reset(self, source_id):
+        self.flush()
+        self.source_id = source_id
+        self.session = int(np.random.randint(1, 2 ** 31)) << 32
+        self.frame_size = None
+
+    def append(self, ts, track_ids, centers, frame_w, frame_h):
+        """centers: (N, 2) centroides en píxeles de un frame de frame_w x frame_h."""
+        n = len(track_ids)
+        if self.source_id is None:
+            return
+        if self.frame_size != (frame_w, frame_h):
+            self._write_frame_size(frame_w, frame_h)
+        if self.size + n > len(self.buffer):
+            self.flush()
+            if n > len(self.buffer):
+                self.buffer = np.zeros(2 * n, dtype=POINT)
+        rows = self.buffer[self.size:self.size + n]
+        rows["t"] = ts
+        rows["track"] = self.session | np.asarray(track_ids, dtype=np.uint64)
+        rows["x"] = np.clip(centers[:, 0] / frame_w, 0, 1) * COORD_SCALE
+        rows["y"] = np.clip(centers[:, 1] / frame_h, 0, 1) * COORD_SCALE
+        self.size += n
+        if ts - self.last_flush >= self.flush_sec:
+            self.flush()
+
+    def _write_frame_size(self, frame_w, frame_h):
+        """Solo cuando cambia la resolución de la cámara (una vez por reset en la práctica)."""
+        path = _frame_file(self.root, self.source_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"w": int(frame_w), "h": int(frame_h)}, f)
+        self.frame_size = (frame_w, frame_h)
+
+    def maybe_flush(self, now=None):
+        """Vuelca lo pendiente si pasaron `flush_sec` desde el último volcado (aunque no lleguen puntos nuevos)."""
+        now = time.time() if now is None else now
+        if self.size and now - self.last_flush >= self.flush_sec:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if self.size == 0 or self.source_id is None:
+            self.size = 0
+            return
+        rows = self.buffer[:self.size]
+        # Un lote puede cruzar el cambio de hora: se parte por archivo
+        hours = (rows["t"] // 3600).astype(np.int64)
+        for hour in np.unique(hours):
+            path = _hour_file(self.root, self.source_id, float(hour) * 3600)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            new_file = not os.path.exists(path)
+            with open(path, "ab") as f:
+                f.write(rows[hours == hour].tobytes())
+            if new_file:
+                # Hora nueva: buen momento para borrar lo que ya venció
+                prune(self.root, self.source_id)
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        self.source_id = None
+
+
+def prune(root, source_id, days=RETENTION_DAYS):
+    """Borra los archivos horarios de la cámara más viejos que `days`."""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    for path in glob.glob(os.path.join(root, str(source_id), "*.traj")):
+        try:
+            hour = datetime.datetime.strptime(os.path.basename(path)[:-5], "%Y%m%d%H")
+        except ValueError:
+            continue
+        if hour < cutoff:
+            os.remove(path)
+
+
+def frame_size(source_id, root=TRAJECTORY_DIR):
+    """(w, h) del último frame guardado de la cámara, o None si no hay."""
+    try:
+        with open(_frame_file(root, source_id)) as f:
+            size = json.load(f)
+        return int(size["w"]), int(size["h"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def load(source_id, start, end, root=TRAJECTORY_DIR):
+    """Puntos de la cámara con start <= t < end (timestamps epoch), de los archivos horarios que tocan la ventana."""
+    parts = []
+    hour = int(start // 3600) * 3600
+    while hour < end:
+        path = _hour_file(root, source_id, hour)
+        if os.path.exists(path):
+            size = os.path.getsize(path) // POINT.itemsize
+            if size:
+                # Una escritura a medio terminar deja una cola incompleta: se ignora
+                rows = np.memmap(path, dtype=POINT, mode="r", shape=(size,))
+                parts.append(rows[(rows["t"] >= start) & (rows["t"] < end)])
+        hour += 3600
+    if not parts:
+        return np.zeros(0, dtype=POINT)
+    return np.concatenate(parts)
+
+
+def recount(points, lines, frame_size=None):
+    """
+    Conteo que habrían dado `lines` ({"name", "points", "direction"}, coordenadas 0-1)
+    sobre las trayectorias guardadas, con las mismas reglas que TripwireEngine:
+    una polilínea cuenta una vez por paso, cada track cuenta una sola vez por línea
+    y los saltos de MAX_JUMP_WIDTH anchos de frame o más se ignoran.
+    frame_size=(w, h) (ver frame_size()) da la proporción del frame; sin él se asume cuadrado.
+    Devuelve [{"name", "in", "out"}, ...] en el orden de `lines`.
+    """
+    result = [{"name": l.get("name"), "in": 0, "out": 0} for l in lines]
+    seg_a, seg_b, seg_line = [], [], []
+    for idx, line in enumerate(lines):
+        for p1, p2 in zip(line["points"][:-1], line["points"][1:]):
+            seg_a.append(p1)
+            seg_b.append(p2)
+            seg_line.append(idx)
+    if len(points) < 2 or not seg_line:
+        return result
+    # Todo en anchos de frame (y * h/w), como los píxeles / ancho del conteo en vivo;
+    # escalar un eje no cambia de qué lado de un segmento queda cada punto
+    aspect = np.float32([1.0, frame_size[1] / frame_size[0] if frame_size else 1.0])
+    seg_a = np.asarray(seg_a, dtype=np.float32) * aspect
+    seg_b = np.asarray(seg_b, dtype=np.float32) * aspect
+    seg_line = np.asarray(seg_line, dtype=np.int64)
+    line_sign = np.asarray([1 if (l.get("direction") or 'IN') == 'IN' else -1 for l in lines], dtype=np.int8)
+
+    # Orden cronológico dentro de cada track; un paso une dos puntos consecutivos del mismo track
+    order = np.lexsort((points["t"], points["track"]))
+    track = points["track"][order]
+    xy = np.stack([points["x"][order], points["y"][order]], axis=1).astype(np.float32) / COORD_SCALE * aspect
+    step = np.flatnonzero(track[1:] == track[:-1])
+    if len(step) == 0:
+        return result
+
+    hit_step, hit_line, hit_sign = [], [], []
+    for begin in range(0, len(step), RECOUNT_BLOCK):
+        s = step[begin:begin + RECOUNT_BLOCK]
+        prev, curr = xy[s], xy[s + 1]
+        signs = segment_crossings(prev, curr, seg_a, seg_b)
+        signs[long_jumps(prev, curr, MAX_JUMP_WIDTH)] = 0
+        per_line = np.zeros((len(s), len(lines)), dtype=np.int8)
+        rows, segs = np.nonzero(signs)
+        per_line[rows, seg_line[segs]] = signs[rows, segs]
+        rows, cols = np.nonzero(per_line)
+        hit_step.append(s[rows])
+        hit_line.append(cols)
+        hit_sign.append(per_line[rows, cols])
+
+    hit_step = np.concatenate(hit_step)
+    hit_line = np.concatenate(hit_line)
+    hit_sign = np.concatenate(hit_sign)
+    # Solo el primer cruce de cada (track, línea); los pasos ya están en orden cronológico por track
+    _, first = np.unique(np.stack([track[hit_step], hit_line.astype(np.uint64)], axis=1), axis=0, return_index=True)
+    directions = hit_sign[first] * line_sign[hit_line[first]]
+    for line_idx, direction in zip(hit_line[first].tolist(), directions.tolist()):
+        result[line_idx]["in" if direction > 0 else "out"] += 1
+    return result
@@ -0,0 +1,153 @@
+import numpy as np
+
+from .track_store import MAX_LINES
+
+# Nombre de la línea del Tripwire clásico (x1, y1, x2, y2) dentro de la lista de líneas
+LEGACY_LINE_NAME = "principal"
+# Saltos de más de 1/3 del ancho del frame en un paso son loops del video, no personas
+# (lo aplican igual el conteo en vivo y el recálculo what-if, vía long_jumps)
+MAX_JUMP_WIDTH = 1.0 / 3.0
+
+
+def _field(tripwire_data, name, default=None):
+    if isinstance(tripwire_data, dict):
+        return tripwire_data.get(name, default)
+    return getattr(tripwire_data, name, default)
+
+
+def line_configs(tripwire_data):
+    """
+    Normalized line list for a camera: the legacy Tripwire (x1, y1, x2, y2) as
+    line 0 plus any extra lines/polylines attached as `tripwire_data.lines`.
+    Accepts the Tripwire-like object built by tripwire_from_dict or the plain dict
+    from crud.get_tripwire_config (the offline counter passes it through as is).
+    Each entry is {"name", "points": [[x, y], ...], "direction"}.
+    """
+    if tripwire_data is None:
+        return []
+    lines = []
+    if _field(tripwire_data, 'x1') is not None:
+        lines.append({
+            "name": LEGACY_LINE_NAME,
+            "points": [[_field(tripwire_data, 'x1'), _field(tripwire_data, 'y1')],
+                       [_field(tripwire_data, 'x2'), _field(tripwire_data, 'y2')]],
+            "direction": _field(tripwire_data, 'direction', 'IN') or 'IN'
+        })
+    for line in _field(tripwire_data, 'lines') or []:
+        if len(line.get("points") or []) >= 2:
+            lines.append(line)
+    return lines
+
+
+def segment_crossings(P, Q, A, B):
+    """
+    Tests every movement segment P->Q (M, 2) against every line segment A->B (S, 2)
+    in one broadcasted pass. Returns an (M, S) int8 matrix: +1 when the track moved
+    to the negative side of the segment (the arrow side for 'IN'), -1 when it moved
+    to the positive side, 0 when it did not cross.
+    """
+    P = P[:, None, :]
+    Q = Q[:, None, :]
+    A = A[None, :, :]
+    B = B[None, :, :]
+
+    AB = B - A
+    # Side of the track's previous/current point with respect to each line (2D cross product)
+    side_prev = AB[..., 0] * (P[..., 1] - A[..., 1]) - AB[..., 1] * (P[..., 0] - A[..., 0])
+    side_curr = AB[..., 0] * (Q[..., 1] - A[..., 1]) - AB[..., 1] * (Q[..., 0] - A[..., 0])
+
+    # Side of each line endpoint with respect to the track's movement
+    PQ = Q - P
+    side_a = PQ[..., 0] * (A[..., 1] - P[..., 1]) - PQ[..., 1] * (A[..., 0] - P[..., 0])
+    side_b = PQ[..., 0] * (B[..., 1] - P[..., 1]) - PQ[..., 1] * (B[..., 0] - P[..., 0])
+
+    intersects = ((side_prev > 0) != (side_curr > 0)) & ((side_a > 0) != (side_b > 0))
+
+    # Same boundary rule as the original scalar code: strictly leave one side, reach or pass the other
+    to_negative = intersects & (side_prev > 0) & (side_curr <= 0)
+    to_positive = intersects & (side_prev < 0) & (side_curr >= 0)
+    return to_negative.astype(np.int8) - to_positive.astype(np.int8)
+
+
+def long_jumps(prev, curr, max_jump):
+    """(M,) bool: steps prev->curr whose length (same units as the points) reaches max_jump."""
+    return np.hypot(*(curr - prev).T) >= max_jump
+
+
+class TripwireEngine:
+    """
+    Multi-line crossing engine. Keeps every configured line (or polyline) of a
+    camera flattened into segment arrays and evaluates all tracks against all
+    segments in one vectorized pass per frame, with per-line directional counts.
+    """
+    def __init__(self):
+        self.lines = []
+        self.key = None
+        self.seg_a = np.zeros((0, 2), dtype=np.float32)
+        self.seg_b = np.zeros((0, 2), dtype=np.float32)
+        self.seg_line = np.zeros((0,), dtype=np.int32)
+        # +1 crossings count as IN when the line direction is 'IN', as OUT otherwise
+        self.line_sign = np.zeros((0,), dtype=np.int8)
+        self.counts = []
+
+    def set_lines(self, lines):
+        key = tuple((l.get("name"), tuple(map(tuple, l["points"])), l.get("direction")) for l in lines)
+        if key == self.key:
+            return
+        self.key = key
+        if len(lines) > MAX_LINES:
+            # La API no deja crear más; si igual llegan (p. ej. filas viejas en la base) no se desborda el bitmask
+            print(f"[TRIPWIRE] ERROR: {len(lines)} lines configured, only the first {MAX_LINES} are counted")
+            lines = lines[:MAX_LINES]
+
+        previous = {l.get("name"): c for l, c in zip(self.lines, self.counts)}
+        seg_a, seg_b, seg_line = [], [], []
+        for idx, line in enumerate(lines):
+            points = line["points"]
+            for p1, p2 in zip(points[:-1], points[1:]):
+                seg_a.append(p1)
+                seg_b.append(p2)
+                seg_line.append(idx)
+
+        self.lines = lines
+        self.seg_a = np.asarray(seg_a, dtype=np.float32).reshape(-1, 2)
+        self.seg_b = np.asarray(seg_b, dtype=np.float32).reshape(-1, 2)
+        self.seg_line = np.asarray(seg_line, dtype=np.int32)
+        self.line_sign = np.asarray([1 if (l.get("direction") or 'IN') == 'IN' else -1 for l in lines], dtype=np.int8)
+        # Moving a line keeps its running counts; new lines start at zero
+        self.counts = [previous.get(l.get("name"), {"in": 0, "out": 0}) for l in lines]
+
+    def evaluate(self, prev, curr, frame_w, frame_h, max_jump=None, skip=None):
+        """
+        prev/curr: (M, 2) pixel centroids of each track on the previous and current frame.
+        skip: optional (M, L) bool mask of (track, line) pairs that must not count again.
+        Returns a list of (track_index, line_index, 'IN'/'OUT') and updates per-line counts.
+        """
+        if len(prev) == 0 or len(self.seg_line) == 0:
+            return []
+
+        scale = np.array([frame_w, frame_h], dtype=np.float32)
+        prev = np.asarray(prev, dtype=np.float32)
+        curr = np.asarray(curr, dtype=np.float32)
+        signs = segment_crossings(prev, curr, self.seg_a * scale, self.seg_b * scale)
+
+        # Ignore fake jumps (e.g. when a video file loops)
+        if max_jump is not None:
+            signs[long_jumps(prev, curr, max_jump)] = 0
+
+        # A polyline counts once per track even if a step crosses two of its segments
+        per_line = np.zeros((len(prev), len(self.lines)), dtype=np.int8)
+        track_idx, seg_idx = np.nonzero(signs)
+        per_line[track_idx, self.seg_line[seg_idx]] = signs[track_idx, seg_idx]
+        if skip is not None:
+            per_line[skip] = 0
+
+        crossings = []
+        for t, l in zip(*np.nonzero(per_line)):
+            direction = 'IN' if per_line[t, l] * self.line_sign[l] > 0 else 'OUT'
+            self.counts[l]["in" if direction == 'IN' else "out"] += 1
+            crossings.append((int(t), int(l), direction))
+        return crossings
+
+    def line_counts(self):
+        return {l.get("name"): dict(c) for l, c in zip(self.lines, self.counts)}
@@ -1,19 +1,40 @@
 import cv2
 import collections
+import json
+import os
 import threading
 import time
 
+try:
+    import av
+except ImportError:
+    av = None
+
+# Backend de decodificación: "opencv" (cv2.VideoCapture), "pyav" o "auto" (PyAV si está instalado)
+VIDEO_READER = os.environ.get("VIDEO_READER", "opencv").lower()
+MAX_WIDTH = 800
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Opciones por cámara para PyAV: {"<source_id>": {"format_options": {...}, "codec_options": {...}, "thread_type": "SLICE", "thread_count": 2}}
+READER_OPTIONS_PATH = os.environ.get("READER_OPTIONS_PATH", os.path.join(PROJECT_DIR, "reader_options.json"))
+# Frames corruptos seguidos que se saltean antes de dar el archivo por terminado
+MAX_DECODE_ERRORS = 100
+
 class VideoReaderWrapper:
     """
     Un Wrapper para cv2.VideoCapture que usa un hilo en segundo plano (solo para RTSP)
     Garantiza que leemos el frame MÁS RECIENTE bloqueando hasta que llega, 
     evitando enviar False si el consumidor es más rápido que la cámara.
+
+    grab() avanza sin convertir; retrieve() convierte a BGR y reduce solo el frame
+    que alguien va a usar. En RTSP el hilo solo hace grab() para drenar la cámara.
     """
     def __init__(self, cap, is_rtsp=False):
         self.cap = cap
         self.is_rtsp = is_rtsp
-        self.q = collections.deque(maxlen=1)
+        self.cap_lock = threading.Lock()
         self.cond = threading.Condition()
+        self.grabbed = 0
+        self.consumed = 0
         self.running = False
         self.thread = None
         
@@ -23,37 +44,52 @@ class VideoReaderWrapper:
             self.thread.start()
             
     def _reader(self):
-        # Continually drain frames from the OpenCV buffer as fast as possible
+        # Continually drain frames from the OpenCV buffer as fast as possible (sin convertir a BGR)
         while self.running:
-            ret, frame = self.cap.read()
+            with self.cap_lock:
+                ret = self.cap.grab()
             if ret:
                 with self.cond:
-                    self.q.append(frame)
+                    self.grabbed += 1
                     self.cond.notify()
             else:
                 time.sleep(0.005)
-                
-    def read(self):
-        ret, frame = False, None
-        if self.is_rtsp:
-            with self.cond:
-                if len(self.q) == 0:
-                    # Esperar hasta 1 segundo por un nuevo frame
-                    self.cond.wait(timeout=1.0)
-                
-                if len(self.q) > 0:
-                    ret, frame = True, self.q.pop()
-        else:
-            ret, frame = self.cap.read()
+
+    def grab(self):
+        """Avanza al siguiente frame sin convertirlo. En RTSP espera (hasta 1 s) uno más nuevo que el último consumido."""
+        if not self.is_rtsp:
+            return self.cap.grab()
+        with self.cond:
+            if self.grabbed <= self.consumed:
+                # Esperar hasta 1 segundo por un nuevo frame
+                self.cond.wait(timeout=1.0)
+            if self.grabbed > self.consumed:
+                self.consumed = self.grabbed
+                return True
+        return False
+
+    def retrieve(self):
+        """Convierte el último frame obtenido con grab() (en RTSP, el más reciente de la cámara)."""
+        with self.cap_lock:
+            ret, frame = self.cap.retrieve()
             
         # Reducir el tamano del frame si es muy grande para optimizar el stream y la red
         if ret and frame is not None:
             h, w = frame.shape[:2]
-            if w > 800:
-                scale = 800 / float(w)
-                frame = cv2.resize(frame, (800, int(h * scale)))
+            if w > MAX_WIDTH:
+                scale = MAX_WIDTH / float(w)
+                frame = cv2.resize(frame, (MAX_WIDTH, int(h * scale)))
                 
         return ret, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def set_demand(self, fps):
+        # OpenCV no expone skip_frame del decodificador
+        pass
             
     def release(self):
         self.running = False
@@ -70,3 +106,300 @@ class VideoReaderWrapper:
         
     def get(self, prop):
         return self.cap.get(prop)
+
+
+class PyAVReader:
+    """
+    Lector alternativo sobre PyAV, con la misma interfaz que VideoReaderWrapper.
+
+    - Decodificación multihilo: slices en RTSP (frame threading suma un frame de
+      latencia por hilo) y frame+slice en archivos.
+    - Opciones de demuxer/códec por fuente, sin variables de entorno globales.
+    - Escalado a MAX_WIDTH y conversión YUV->BGR en un solo paso de libswscale,
+      y solo para los frames que el consumidor efectivamente lee.
+    - set_demand(fps): si el consumidor usa pocos frames de una cámara en vivo, el
+      decodificador descarta los no-referencia o todo menos los keyframes (skip_frame).
+    """
+    def __init__(self, source_path, is_rtsp=False, options=None, codec_options=None, thread_type=None, thread_count=0):
+        self.source_path = source_path
+        self.is_rtsp = is_rtsp
+        self.options = dict(options or {})
+        self.codec_options = dict(codec_options or {})
+        self.thread_type = thread_type or ("SLICE" if is_rtsp else "AUTO")
+        self.thread_count = thread_count
+        self.skip_frame = "DEFAULT"
+        self.container = None
+        self.size = None
+        self.position = 0
+        self.decode_errors = 0
+        self.pending = None
+        self.q = collections.deque(maxlen=1)
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        self._open()
+        if self.is_rtsp and self.container is not None:
+            self.running = True
+            self.thread = threading.Thread(target=self._reader, daemon=True)
+            self.thread.start()
+
+    def _open(self):
+        try:
+            self.container = av.open(self.source_path, options=self.options, timeout=(10.0, 10.0) if self.is_rtsp else None)
+            self.stream = self.container.streams.video[0]
+        except Exception as e:
+            print(f"[PYAV] Could not open {self.source_path}: {e}")
+            self.container = None
+            return
+        self.stream.thread_type = self.thread_type
+        if self.thread_count:
+            self.stream.thread_count = self.thread_count
+        ctx = self.stream.codec_context
+        if self.codec_options:
+            ctx.options = dict(self.codec_options)
+        ctx.skip_frame = self.skip_frame
+
+        rate = self.stream.average_rate or self.stream.guessed_rate
+        self.fps = float(rate) if rate else 30.0
+        self.frame_count = self.stream.frames
+        if not self.frame_count and self.stream.duration and self.stream.time_base:
+            self.frame_count = int(self.stream.duration * self.stream.time_base * self.fps)
+
+        w, h = ctx.width, ctx.height
+        self.size = (MAX_WIDTH, int(h * MAX_WIDTH / float(w))) if w > MAX_WIDTH else (w, h)
+        self.frames = self.container.decode(self.stream)
+
+    def _close_container(self):
+        if self.container is not None:
+            try:
+                self.container.close()
+            except Exception:
+                pass
+            self.container = None
+
+    def _convert(self, frame):
+        # Escala y convierte a BGR en una sola llamada a sws_scale
+        return frame.reformat(width=self.size[0], height=self.size[1], format="bgr24",
+                              interpolation="BILINEAR").to_ndarray()
+
+    def _reader(self):
+        # Igual que VideoReaderWrapper: siempre drenando, guardando solo el último frame (sin convertir)
+        while self.running:
+            try:
+                for frame in self.frames:
+                    if not self.running:
+                        break
+                    with self.cond:
+                        self.q.append(frame)
+                        self.cond.notify()
+            except Exception as e:
+                print(f"[PYAV] Stream error on {self.source_path}: {e}")
+            if self.running:
+                # Corte de la cámara: reconectar con las mismas opciones
+                time.sleep(1.0)
+                self._close_container()
+                self._open()
+                if self.container is None:
+                    time.sleep(4.0)
+
+    def _next(self):
+        for _ in range(MAX_DECODE_ERRORS):
+            try:
+                frame = next(self.frames)
+            except StopIteration:
+                return None
+            except Exception as e:
+                if av is not None and isinstance(e, av.error.EOFError):
+                    return None
+                # Paquete corrupto: no es fin de archivo (el bucle volvería al frame 0), se saltea
+                self.decode_errors += 1
+                if self.decode_errors == 1 or self.decode_errors % 100 == 0:
+                    print(f"[PYAV] Decode error on {self.source_path} ({self.decode_errors} total), skipping frame: {e}")
+                # El generador de decode() queda cerrado tras la excepción; el demuxer sigue en el paquete siguiente
+                self.frames = self.container.decode(self.stream)
+                continue
+            self.position += 1
+            return frame
+        print(f"[PYAV] {MAX_DECODE_ERRORS} decode errors in a row on {self.source_path}, treating as end of file")
+        return None
+
+    def grab(self):
+        """Avanza un frame (decodificado, sin escalar ni convertir). En RTSP toma el más reciente."""
+        self.pending = None
+        if self.is_rtsp:
+            with self.cond:
+                if len(self.q) == 0:
+                    # Esperar hasta 1 segundo por un nuevo frame
+                    self.cond.wait(timeout=1.0)
+                if len(self.q) > 0:
+                    self.pending = self.q.pop()
+        elif self.container is not None:
+            self.pending = self._next()
+        return self.pending is not None
+
+    def retrieve(self):
+        if self.pending is None:
+            return False, None
+        return True, self._convert(self.pending)
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def _seek(self, frame_number):
+        frame_number = max(0, int(frame_number))
+        time_base = self.stream.time_base
+        start = self.stream.start_time or 0
+        target = start + int(frame_number / self.fps / time_base) if time_base else 0
+        # Seek al keyframe anterior y decodificar hacia adelante hasta el frame pedido
+        self.container.seek(target, stream=self.stream, backward=True, any_frame=False)
+        self.frames = self.container.decode(self.stream)
+        self.position = frame_number
+        if frame_number == 0:
+            return True
+        for frame in self.frames:
+            if frame.pts is not None and frame.pts >= target:
+                self.frames = _prepend(frame, self.frames)
+                return True
+        return False
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES and not self.is_rtsp and self.container is not None:
+            return self._seek(value)
+        # CAP_PROP_BUFFERSIZE y demás: el hilo lector ya se queda solo con el último frame
+        return False
+
+    def get(self, prop):
+        if self.container is None:
+            return 0
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.size[0]
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.size[1]
+        return 0
+
+    def set_demand(self, fps):
+        """
+        Frames por segundo que el consumidor realmente usa. Con menos de la mitad del
+        fps de la cámara se saltan los frames que ningún otro referencia (B-frames y
+        capas temporales de HEVC); con menos de 1 fps solo se decodifican keyframes.
+        Solo en vivo: en archivos cambiaría el índice de frame que usa el caché de detecciones.
+        """
+        if not self.is_rtsp or self.container is None or fps <= 0:
+            # Sin dato todavía (el servidor aún no asignó tasa): se decodifica todo
+            return
+        if fps < 1.0:
+            mode = "NONKEY"
+        elif fps < self.fps / 2:
+            mode = "NONREF"
+        else:
+            mode = "DEFAULT"
+        if mode != self.skip_frame:
+            self.skip_frame = mode
+            self.stream.codec_context.skip_frame = mode
+
+    def isOpened(self):
+        return self.container is not None
+
+    def release(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+        self._close_container()
+
+
+def _prepend(first, frames):
+    yield first
+    yield from frames
+
+
+class VodClock:
+    """
+    Reloj virtual para archivos: mantiene la reproducción en 1x comparando el número
+    de frame contra el reloj real. Si va adelantado duerme; si se atrasa salta los
+    frames atrasados con grab() (sin convertir) o, si el atraso es grande, con un seek.
+    """
+    def __init__(self, fps, seek_after_sec=2.0):
+        self.fps = fps if fps and fps > 0 else 30.0
+        self.seek_after_sec = seek_after_sec
+        self.skipped = 0
+        self.restart()
+
+    def restart(self):
+        self.start = time.time()
+
+    def pace(self, cap, frame_idx):
+        """frame_idx: frames ya consumidos del archivo. Devuelve el nuevo frame_idx después de saltar los atrasados."""
+        behind = (time.time() - self.start) - frame_idx / self.fps
+        if behind < 0:
+            time.sleep(-behind)
+            return frame_idx
+        late = int(behind * self.fps)
+        if late == 0:
+            return frame_idx
+        if behind >= self.seek_after_sec and cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx + late):
+            self.skipped += late
+            return frame_idx + late
+        for _ in range(late):
+            if not cap.grab():
+                break
+            frame_idx += 1
+            self.skipped += 1
+        return frame_idx
+
+
+def parse_capture_options(capture_options):
+    """'rtsp_transport;tcp|fflags;nobuffer|fflags;discardcorrupt' -> dict para av.open (flags repetidos se combinan con '+')."""
+    options = {}
+    for item in (capture_options or "").split("|"):
+        if ";" not in item:
+            continue
+        key, value = item.split(";", 1)
+        options[key] = f"{options[key]}+{value}" if key in options else value
+    return options
+
+
+def reader_options(source_id):
+    try:
+        with open(READER_OPTIONS_PATH) as f:
+            return json.load(f).get(str(source_id), {})
+    except (OSError, ValueError):
+        return {}
+
+
+def open_video_source(source_path, is_rtsp, source_id=None, capture_options=None):
+    """
+    Abre una fuente con el backend configurado en VIDEO_READER. `capture_options` usa
+    el formato de OPENCV_FFMPEG_CAPTURE_OPTIONS ("clave;valor|..."); con PyAV se pasa
+    directo al demuxer de esa fuente en lugar de a una variable de entorno global.
+    """
+    backend = VIDEO_READER
+    if backend in ("pyav", "auto") and av is None:
+        if backend == "pyav":
+            print("[VIDEO-READER] PyAV is not installed, falling back to OpenCV")
+        backend = "opencv"
+    elif backend == "auto":
+        backend = "pyav"
+
+    if backend == "pyav":
+        per_source = reader_options(source_id)
+        options = parse_capture_options(capture_options) if is_rtsp else {}
+        options.update(per_source.get("format_options", {}))
+        return PyAVReader(source_path, is_rtsp, options, per_source.get("codec_options"),
+                          per_source.get("thread_type"), per_source.get("thread_count", 0))
+
+    if is_rtsp and capture_options:
+        os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = capture_options
+    try:
+        raw_cap = cv2.VideoCapture(source_path, cv2.CAP_FFMPEG) if is_rtsp else cv2.VideoCapture(source_path)
+    finally:
+        os.environ.pop("OPENCV_FFMPEG_CAPTURE_OPTIONS", None)
+    return VideoReaderWrapper(raw_cap, is_rtsp=is_rtsp)
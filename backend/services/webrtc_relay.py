@@ -0,0 +1,247 @@
+import asyncio
+import concurrent.futures
+import fractions
+import os
+import time
+
+try:
+    import av
+    from aiortc import MediaStreamTrack, RTCConfiguration, RTCIceServer, RTCRtpSender
+    from aiortc.contrib.media import MediaRelay
+except ImportError:
+    av = None
+    MediaStreamTrack = object
+
+WEBRTC_AVAILABLE = av is not None
+
+VIDEO_TIME_BASE = fractions.Fraction(1, 90000)
+# h264: un solo encoder por fuente y los peers reciben los mismos paquetes; vp8: aiortc codifica por peer
+WEBRTC_CODEC = os.environ.get("WEBRTC_CODEC", "h264").lower()
+WEBRTC_BITRATE = int(os.environ.get("WEBRTC_BITRATE", "800000"))
+# STUN/TURN para sitios remotos, separados por coma (vacío = solo candidatos locales)
+WEBRTC_ICE_SERVERS = [u for u in os.environ.get("WEBRTC_ICE_SERVERS", "").split(",") if u]
+# Un peer nuevo (o uno que perdió paquetes) espera como mucho esto a un keyframe
+KEYFRAME_INTERVAL_SEC = 2.0
+PACKET_QUEUE = 60
+
+
+def rtc_configuration():
+    return RTCConfiguration(iceServers=[RTCIceServer(urls=u) for u in WEBRTC_ICE_SERVERS])
+
+
+def _force_keyframe(vf):
+    try:
+        vf.pict_type = av.video.frame.PictureType.I
+    except (AttributeError, TypeError):
+        vf.pict_type = "I"
+
+
+class _PipelineFollower:
+    """
+    Sigue al pipeline vigente de la fuente: si el suyo murió, revive(pipeline) (PipelineManager.revive)
+    lo reemplaza con los mismos suscriptores y el track pasa al hub nuevo sin que el peer reconecte.
+    """
+    def _follow(self, new_frame):
+        current = self.revive(self.pipeline) if self.revive else None
+        if current is None or current is self.pipeline:
+            return new_frame
+        self.hub.unsubscribe_async(self.loop, new_frame, feed="frame")
+        self.pipeline, self.hub = current, current.hub
+        self.sent_seq = 0
+        return self.hub.subscribe_async(self.loop, feed="frame")
+
+
+class SharedH264Encoder(_PipelineFollower):
+    """
+    Encoder H.264 único por fuente: codifica cada frame nuevo del hub una vez y
+    reparte los av.Packet a la cola de cada peer; aiortc solo los empaqueta en RTP.
+    Con peers nuevos o colas llenas se fuerza un keyframe para que puedan (re)empezar.
+    """
+    def __init__(self, pipeline, loop, revive=None):
+        self.pipeline = pipeline
+        self.hub = pipeline.hub
+        self.revive = revive
+        self.loop = loop
+        self.queues = set()
+        self.codec = None
+        self.keyframe_due = True
+        self.last_keyframe = 0
+        self.start_time = time.time()
+        self.task = None
+
+    def add_peer(self):
+        queue = asyncio.Queue(PACKET_QUEUE)
+        self.queues.add(queue)
+        self.keyframe_due = True
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+        return queue
+
+    def remove_peer(self, queue):
+        self.queues.discard(queue)
+        if not self.queues and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def encode(self, frame):
+        height, width = frame.shape[:2]
+        # yuv420p necesita dimensiones pares
+        width, height = width - width % 2, height - height % 2
+        if self.codec is None or (self.codec.width, self.codec.height) != (width, height):
+            self.codec = av.CodecContext.create("libx264", "w")
+            self.codec.width = width
+            self.codec.height = height
+            self.codec.pix_fmt = "yuv420p"
+            self.codec.time_base = VIDEO_TIME_BASE
+            self.codec.bit_rate = WEBRTC_BITRATE
+            # Los keyframes los decidimos nosotros (peers nuevos / cada KEYFRAME_INTERVAL_SEC)
+            self.codec.gop_size = 9999
+            # Mismo perfil que negocia aiortc (42e01f, packetization-mode=1)
+            self.codec.options = {"profile": "baseline", "level": "31", "tune": "zerolatency",
+                                  "preset": "ultrafast", "forced-idr": "1"}
+            self.keyframe_due = True
+
+        vf = av.VideoFrame.from_ndarray(frame[:height, :width], format="bgr24")
+        vf.pts = int((time.time() - self.start_time) * 90000)
+        vf.time_base = VIDEO_TIME_BASE
+        if self.keyframe_due or time.time() - self.last_keyframe > KEYFRAME_INTERVAL_SEC:
+            _force_keyframe(vf)
+            self.keyframe_due = False
+            self.last_keyframe = time.time()
+        return self.codec.encode(vf)
+
+    async def run(self):
+        new_frame = self.hub.subscribe_async(self.loop, feed="frame")
+        # Hilo propio: la codificación no ocupa el threadpool de la API
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.sent_seq = 0
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(new_frame.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    # Sin frames: si el pipeline se reinició, seguir al nuevo
+                    new_frame = self._follow(new_frame)
+                    continue
+                new_frame.clear()
+                seq, frame = self.hub.latest_frame()
+                if frame is None or seq <= self.sent_seq:
+                    continue
+                self.sent_seq = seq
+                try:
+                    packets = await self.loop.run_in_executor(executor, self.encode, frame)
+                except Exception as e:
+                    print(f"[WEBRTC-{self.hub.source_id}] Error codificando H.264: {e}")
+                    self.codec = None
+                    continue
+                for queue in list(self.queues):
+                    for packet in packets:
+                        if queue.full():
+                            # Peer que no drena: se descarta su atraso y retoma en el próximo keyframe
+                            while not queue.empty():
+                                queue.get_nowait()
+                            self.keyframe_due = True
+                        queue.put_nowait(packet)
+        finally:
+            self.hub.unsubscribe_async(self.loop, new_frame, feed="frame")
+            executor.shutdown(wait=False)
+
+
+class EncodedVideoTrack(MediaStreamTrack):
+    """Track de un peer que entrega paquetes H.264 ya codificados por SharedH264Encoder."""
+    kind = "video"
+
+    def __init__(self, encoder):
+        super().__init__()
+        self.encoder = encoder
+        self.queue = encoder.add_peer()
+
+    async def recv(self):
+        return await self.queue.get()
+
+    def stop(self):
+        super().stop()
+        self.encoder.remove_peer(self.queue)
+
+
+class HubVideoTrack(_PipelineFollower, MediaStreamTrack):
+    """Frames del hub como av.VideoFrame; para peers sin H.264 (aiortc codifica VP8 por peer)."""
+    kind = "video"
+
+    def __init__(self, pipeline, loop, revive=None):
+        super().__init__()
+        self.pipeline = pipeline
+        self.hub = pipeline.hub
+        self.revive = revive
+        self.loop = loop
+        self.new_frame = self.hub.subscribe_async(loop, feed="frame")
+        self.start_time = time.time()
+        self.sent_seq = 0
+
+    async def recv(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.new_frame.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                self.new_frame = self._follow(self.new_frame)
+                continue
+            self.new_frame.clear()
+            seq, frame = self.hub.latest_frame()
+            # El hub también despierta con metadatos nuevos: solo cuenta un frame nuevo
+            if frame is not None and seq > self.sent_seq:
+                self.sent_seq = seq
+                break
+        vf = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        vf.pts = int((time.time() - self.start_time) * 90000)
+        vf.time_base = VIDEO_TIME_BASE
+        return vf
+
+    def stop(self):
+        super().stop()
+        self.hub.unsubscribe_async(self.loop, self.new_frame, feed="frame")
+
+
+class WebRTCBroadcaster:
+    """Un encoder H.264 (o un HubVideoTrack compartido vía MediaRelay) por fuente, para todos sus peers."""
+    def __init__(self):
+        self.encoders = {}
+        self.raw_tracks = {}
+        self.raw_peers = {}
+        self.relay = MediaRelay() if WEBRTC_AVAILABLE else None
+
+    def create_track(self, source_id, pipeline, offer_sdp, revive=None):
+        """
+        Track para un peer nuevo y las preferencias de códec a fijar en su transceiver (o None).
+        revive(pipeline) devuelve el pipeline vigente de la fuente; con él los tracks siguen a un
+        pipeline reiniciado en lugar de quedarse con el hub del que murió.
+        """
+        loop = asyncio.get_running_loop()
+        if WEBRTC_CODEC == "h264" and "H264/90000" in offer_sdp:
+            encoder = self.encoders.get(source_id)
+            if encoder is None or encoder.pipeline is not pipeline:
+                # Primera vez, o el pipeline de la fuente se reinició y nadie lo siguió todavía
+                encoder = SharedH264Encoder(pipeline, loop, revive)
+                self.encoders[source_id] = encoder
+            codecs = [c for c in RTCRtpSender.getCapabilities("video").codecs
+                      if c.mimeType == "video/H264" or c.mimeType == "video/rtx"]
+            return EncodedVideoTrack(encoder), codecs
+
+        track = self.raw_tracks.get(source_id)
+        if track is None or track.pipeline is not pipeline:
+            if track is not None:
+                track.stop()
+            track = HubVideoTrack(pipeline, loop, revive)
+            self.raw_tracks[source_id] = track
+            self.raw_peers[source_id] = 0
+        self.raw_peers[source_id] += 1
+        return self.relay.subscribe(track), None
+
+    def release_track(self, source_id, track):
+        """Se llama al cerrar el peer; el track compartido de la fuente se detiene con el último."""
+        track.stop()
+        if isinstance(track, EncodedVideoTrack):
+            return
+        self.raw_peers[source_id] = self.raw_peers.get(source_id, 1) - 1
+        if self.raw_peers[source_id] <= 0 and source_id in self.raw_tracks:
+            self.raw_tracks.pop(source_id).stop()
+            del self.raw_peers[source_id]
@@ -12,6 +12,12 @@ let currentTripwire = {
 };
 let isDrawing = false;
 let dragNode = null; // 'start', 'end', or null
+let previewPc = null; // RTCPeerConnection de la vista previa (WebRTC)
+let previewToken = 0; // Cambia al abrir/cerrar la vista previa para ignorar negociaciones viejas
+let overlay = null; // Overlays dibujados en el navegador con los metadatos de /api/stream/meta/{id}
+let previewPresence = null; // Visibilidad de la vista previa que se reporta a /api/stream/presence
+const TRAIL_LENGTH = 30;
+const WEBRTC_TIMEOUT_MS = 5000;
 
 // DOM Elements
 const sourcesList = document.getElementById('sources-list');
@@ -298,54 +304,371 @@ function openPreview(id) {
     videoWrapper.appendChild(loadingDiv);
 
     if (source.type === 'rtsp' || source.type === 'file') {
-        const img = document.createElement('img');
-        img.src = `${STREAM_BASE_URL}/${source.type}/${id}?t=${startTime}`;
-        img.alt = `${source.type.toUpperCase()} Stream`;
-        img.className = 'w-full h-auto object-contain bg-black';
-        img.style.opacity = '0';
-
-        img.onload = () => {
-            const endTime = Date.now();
-            const totalFrontendDelay = ((endTime - startTime) / 1000).toFixed(2);
-            console.log(`[FRONTEND METRICA] Tiempo total desde Clic hasta 1er Frame: ${totalFrontendDelay} seg`);
-
-            fetch('/api/stream/metrics', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    source_id: source.id,
-                    camera_name: source.name,
-                    load_time_sec: parseFloat(totalFrontendDelay)
-                })
-            }).catch(err => console.error("Error logging metrics", err));
-
-            if (loadingDiv.parentNode) {
-                loadingDiv.style.backgroundColor = 'rgba(0, 128, 0, 0.8)';
-                loadingDiv.innerHTML = `<i class="fas fa-check mr-2"></i> Cargado en: ${totalFrontendDelay} seg`;
-                setTimeout(() => { if (loadingDiv.parentNode) loadingDiv.remove(); }, 4000);
+        startPresence();
+        // WebRTC (H.264, menos ancho de banda) y, si no conecta, MJPEG
+        const token = ++previewToken;
+        startWebRTCPreview(source, loadingDiv, startTime).catch(err => {
+            if (token !== previewToken) return;
+            console.warn(`[WEBRTC] Fallback a MJPEG: ${err.message}`);
+            closePreviewPc();
+            startMjpegPreview(source, loadingDiv, startTime);
+        });
+    }
+
+    previewModal.classList.add('active');
+}
+
+function onPreviewFirstFrame(source, loadingDiv, startTime, mode, media) {
+    startOverlay(source, media);
+    const endTime = Date.now();
+    const totalFrontendDelay = ((endTime - startTime) / 1000).toFixed(2);
+    console.log(`[FRONTEND METRICA] Tiempo total desde Clic hasta 1er Frame (${mode}): ${totalFrontendDelay} seg`);
+
+    fetch('/api/stream/metrics', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            source_id: source.id,
+            camera_name: source.name,
+            load_time_sec: parseFloat(totalFrontendDelay)
+        })
+    }).catch(err => console.error("Error logging metrics", err));
+
+    if (loadingDiv.parentNode) {
+        loadingDiv.style.backgroundColor = 'rgba(0, 128, 0, 0.8)';
+        loadingDiv.innerHTML = `<i class="fas fa-check mr-2"></i> Cargado en: ${totalFrontendDelay} seg (${mode})`;
+        setTimeout(() => { if (loadingDiv.parentNode) loadingDiv.remove(); }, 4000);
+    }
+}
+
+function startMjpegPreview(source, loadingDiv, startTime) {
+    const img = document.createElement('img');
+    // Solo los píxeles que se van a mostrar; adaptive baja calidad/resolución si la conexión no da abasto
+    const displayWidth = Math.round((videoWrapper.clientWidth || 800) * (window.devicePixelRatio || 1));
+    img.src = `${STREAM_BASE_URL}/${source.type}/${source.id}?width=${displayWidth}&adaptive=1&viewer=${previewPresence.id}&t=${startTime}`;
+    img.alt = `${source.type.toUpperCase()} Stream`;
+    img.className = 'w-full h-auto object-contain bg-black';
+    img.style.opacity = '0';
+
+    img.onload = () => {
+        onPreviewFirstFrame(source, loadingDiv, startTime, 'MJPEG', img);
+        img.style.opacity = '1';
+    };
+
+    img.onerror = () => {
+        if (loadingDiv.parentNode) {
+            loadingDiv.style.backgroundColor = 'rgba(255, 0, 0, 0.8)';
+            loadingDiv.innerHTML = `<i class="fas fa-exclamation-triangle mr-2"></i> Error de conexión.`;
+        }
+    };
+
+    videoWrapper.appendChild(img);
+}
+
+async function startWebRTCPreview(source, loadingDiv, startTime) {
+    if (!window.RTCPeerConnection) throw new Error('RTCPeerConnection no soportado');
+
+    const pc = new RTCPeerConnection();
+    previewPc = pc;
+    pc.addTransceiver('video', { direction: 'recvonly' });
+
+    const video = document.createElement('video');
+    video.autoplay = true;
+    video.muted = true;
+    video.playsInline = true;
+    video.className = 'w-full h-auto object-contain bg-black';
+    video.style.opacity = '0';
+
+    const firstFrame = new Promise((resolve, reject) => {
+        const timer = setTimeout(() => reject(new Error('Sin video tras 5 s')), WEBRTC_TIMEOUT_MS);
+        pc.ontrack = (event) => {
+            video.srcObject = event.streams[0] || new MediaStream([event.track]);
+        };
+        video.onloadeddata = () => {
+            clearTimeout(timer);
+            resolve();
+        };
+        pc.onconnectionstatechange = () => {
+            if (pc.connectionState === 'failed') {
+                clearTimeout(timer);
+                reject(new Error('Conexión WebRTC fallida'));
             }
-            img.style.opacity = '1';
         };
+    });
 
-        img.onerror = () => {
-            if (loadingDiv.parentNode) {
-                loadingDiv.style.backgroundColor = 'rgba(255, 0, 0, 0.8)';
-                loadingDiv.innerHTML = `<i class="fas fa-exclamation-triangle mr-2"></i> Error de conexión.`;
+    await pc.setLocalDescription(await pc.createOffer());
+    // Sin trickle ICE: se envía la oferta con todos los candidatos
+    await new Promise(resolve => {
+        if (pc.iceGatheringState === 'complete') return resolve();
+        const timer = setTimeout(resolve, 2000);
+        pc.addEventListener('icegatheringstatechange', () => {
+            if (pc.iceGatheringState === 'complete') {
+                clearTimeout(timer);
+                resolve();
             }
-        };
+        });
+    });
+
+    const response = await fetch(`${STREAM_BASE_URL}/webrtc/${source.id}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ sdp: pc.localDescription.sdp, type: pc.localDescription.type })
+    });
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    if (previewPc !== pc) return; // El modal se cerró mientras se negociaba
 
-        videoWrapper.appendChild(img);
+    await pc.setRemoteDescription(await response.json());
+    videoWrapper.appendChild(video);
+    await firstFrame;
+
+    onPreviewFirstFrame(source, loadingDiv, startTime, 'WebRTC', video);
+    video.style.opacity = '1';
+}
+
+function closePreviewPc() {
+    if (previewPc) {
+        previewPc.close();
+        previewPc = null;
     }
+    const vid = videoWrapper.querySelector('video');
+    if (vid) {
+        vid.srcObject = null;
+        vid.remove();
+    }
+}
 
-    previewModal.classList.add('active');
+// --- Overlays (cajas, IDs, trails, líneas y HUD dibujados en el navegador) ---
+function startOverlay(source, media) {
+    stopOverlay();
+    const canvas = document.createElement('canvas');
+    canvas.style.position = 'absolute';
+    canvas.style.pointerEvents = 'none';
+    canvas.style.zIndex = '10';
+    videoWrapper.appendChild(canvas);
+
+    const toggle = document.createElement('button');
+    toggle.style.background = 'rgba(0, 0, 0, 0.6)';
+    toggle.style.color = 'white';
+    toggle.style.border = '1px solid rgba(255, 255, 255, 0.4)';
+    toggle.style.borderRadius = '6px';
+    toggle.style.padding = '4px 10px';
+    toggle.style.cursor = 'pointer';
+    toggle.style.position = 'absolute';
+    toggle.style.top = '10px';
+    toggle.style.left = '10px';
+    toggle.style.zIndex = '20';
+    videoWrapper.appendChild(toggle);
+
+    overlay = {
+        canvas,
+        toggle,
+        media,
+        meta: null,
+        lines: [],
+        trails: new Map(),
+        visible: localStorage.getItem('overlaysVisible') !== '0',
+        events: new EventSource(`${STREAM_BASE_URL}/meta/${source.id}` + (previewPresence ? `?viewer=${previewPresence.id}` : '')),
+        frame: null
+    };
+    const current = overlay;
+
+    const updateToggle = () => {
+        toggle.innerHTML = `<i class="fas fa-${current.visible ? 'eye' : 'eye-slash'}"></i> Overlays`;
+    };
+    updateToggle();
+    toggle.onclick = () => {
+        current.visible = !current.visible;
+        localStorage.setItem('overlaysVisible', current.visible ? '1' : '0');
+        updateToggle();
+        requestOverlayDraw(current);
+    };
+
+    current.events.onmessage = (event) => {
+        const meta = JSON.parse(event.data);
+        if (meta.lines) current.lines = meta.lines;
+        // Trails: centros de cada caja, acumulados aquí en vez de viajar en cada mensaje
+        const alive = new Set();
+        for (const [x1, y1, x2, y2, id] of meta.boxes) {
+            alive.add(id);
+            const trail = current.trails.get(id) || [];
+            trail.push([(x1 + x2) / 2, (y1 + y2) / 2]);
+            if (trail.length > TRAIL_LENGTH) trail.shift();
+            current.trails.set(id, trail);
+        }
+        for (const id of current.trails.keys()) {
+            if (!alive.has(id)) current.trails.delete(id);
+        }
+        current.meta = meta;
+        requestOverlayDraw(current);
+    };
+}
+
+function requestOverlayDraw(state) {
+    if (state.frame) return;
+    state.frame = requestAnimationFrame(() => {
+        state.frame = null;
+        drawOverlay(state);
+    });
+}
+
+function drawOverlay(state) {
+    const { canvas, media, meta } = state;
+    const width = media.clientWidth;
+    const height = media.clientHeight;
+    const dpr = window.devicePixelRatio || 1;
+    canvas.style.left = `${media.offsetLeft}px`;
+    canvas.style.top = `${media.offsetTop}px`;
+    canvas.style.width = `${width}px`;
+    canvas.style.height = `${height}px`;
+    if (canvas.width !== Math.round(width * dpr) || canvas.height !== Math.round(height * dpr)) {
+        canvas.width = Math.round(width * dpr);
+        canvas.height = Math.round(height * dpr);
+    }
+    const c = canvas.getContext('2d');
+    c.setTransform(dpr, 0, 0, dpr, 0, 0);
+    c.clearRect(0, 0, width, height);
+    if (!state.visible || !meta || !meta.w) return;
+
+    // Área real del video dentro del elemento (object-fit: contain)
+    const naturalW = media.videoWidth || media.naturalWidth || meta.w;
+    const naturalH = media.videoHeight || media.naturalHeight || meta.h;
+    const scale = Math.min(width / naturalW, height / naturalH);
+    const areaW = naturalW * scale;
+    const areaH = naturalH * scale;
+    const offsetX = (width - areaW) / 2;
+    const offsetY = (height - areaH) / 2;
+    const sx = areaW / meta.w;
+    const sy = areaH / meta.h;
+
+    c.lineJoin = 'round';
+    c.font = '12px sans-serif';
+
+    // Trails
+    c.strokeStyle = '#ffff00';
+    c.lineWidth = 2;
+    for (const trail of state.trails.values()) {
+        if (trail.length < 2) continue;
+        c.beginPath();
+        trail.forEach(([x, y], i) => {
+            const px = offsetX + x * sx;
+            const py = offsetY + y * sy;
+            if (i === 0) c.moveTo(px, py); else c.lineTo(px, py);
+        });
+        c.stroke();
+    }
+
+    // Cajas e IDs
+    c.strokeStyle = '#00a5ff';
+    c.fillStyle = '#00a5ff';
+    for (const [x1, y1, x2, y2, id] of meta.boxes) {
+        c.strokeRect(offsetX + x1 * sx, offsetY + y1 * sy, (x2 - x1) * sx, (y2 - y1) * sy);
+        c.fillText(`ID:${id}`, offsetX + x1 * sx, offsetY + y1 * sy - 6);
+    }
+
+    // Líneas del tripwire (coordenadas normalizadas)
+    c.strokeStyle = '#ff0000';
+    c.fillStyle = '#ff0000';
+    c.lineWidth = 3;
+    for (const line of state.lines) {
+        c.beginPath();
+        line.points.forEach(([x, y], i) => {
+            const px = offsetX + x * areaW;
+            const py = offsetY + y * areaH;
+            if (i === 0) c.moveTo(px, py); else c.lineTo(px, py);
+        });
+        c.stroke();
+        const label = line.name === 'principal' ? 'LINE' : line.name;
+        const [x0, y0] = line.points[0];
+        c.fillText(`${label} (${line.direction})`, offsetX + x0 * areaW, offsetY + y0 * areaH - 8);
+    }
+
+    // HUD de conteos (arriba a la derecha)
+    const entries = `Entradas: ${meta.in}`;
+    const exits = `Salidas: ${meta.out}`;
+    c.font = '14px sans-serif';
+    const boxW = Math.max(c.measureText(entries).width, c.measureText(exits).width) + 30;
+    const boxH = 50;
+    const hudX = offsetX + areaW - boxW - 15;
+    const hudY = offsetY + 15;
+    c.fillStyle = 'rgba(0, 0, 0, 0.6)';
+    c.fillRect(hudX, hudY, boxW, boxH);
+    c.strokeStyle = '#ffffff';
+    c.lineWidth = 1;
+    c.strokeRect(hudX, hudY, boxW, boxH);
+    c.fillStyle = '#64ff64';
+    c.fillText(entries, hudX + 15, hudY + 20);
+    c.fillStyle = '#ff6464';
+    c.fillText(exits, hudX + 15, hudY + 40);
+}
+
+function stopOverlay() {
+    if (!overlay) return;
+    overlay.events.close();
+    if (overlay.frame) cancelAnimationFrame(overlay.frame);
+    overlay.canvas.remove();
+    overlay.toggle.remove();
+    overlay = null;
+}
+
+// --- Presencia: mientras la vista previa no se ve, el servidor manda solo instantáneas livianas ---
+function newViewerId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+function startPresence() {
+    stopPresence();
+    const state = { id: newViewerId(), onScreen: true, visible: true, observer: null, retry: null };
+
+    const send = () => {
+        clearTimeout(state.retry);
+        fetch(`${STREAM_BASE_URL}/presence`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ viewer_id: state.id, visible: state.visible }),
+            keepalive: true
+        })
+            .then(res => res.json())
+            .then(data => {
+                // El stream todavía no se conectó: reintentar hasta que el servidor conozca al visor
+                if (!data.known && !state.visible && previewPresence === state) state.retry = setTimeout(send, 1000);
+            })
+            .catch(err => console.error("Error reporting presence", err));
+    };
+
+    state.update = () => {
+        const visible = document.visibilityState === 'visible' && state.onScreen;
+        if (visible === state.visible) return;
+        state.visible = visible;
+        send();
+    };
+    document.addEventListener('visibilitychange', state.update);
+    if (window.IntersectionObserver) {
+        state.observer = new IntersectionObserver(entries => {
+            state.onScreen = entries[entries.length - 1].isIntersecting;
+            state.update();
+        });
+        state.observer.observe(videoWrapper);
+    }
+    previewPresence = state;
+}
+
+function stopPresence() {
+    if (!previewPresence) return;
+    document.removeEventListener('visibilitychange', previewPresence.update);
+    if (previewPresence.observer) previewPresence.observer.disconnect();
+    clearTimeout(previewPresence.retry);
+    previewPresence = null;
 }
 
 function closeModal(type) {
     if (type === 'preview') {
+        previewToken++;
+        stopOverlay();
+        stopPresence();
         const img = videoWrapper.querySelector('img');
         if (img) img.src = '';
-        const vid = videoWrapper.querySelector('video');
-        if (vid) vid.srcObject = null;
+        closePreviewPc();
 
         previewModal.classList.remove('active');
         videoWrapper.innerHTML = '';
@@ -0,0 +1,40 @@
+import contextlib
+import io
+import numpy as np
+import os
+import sys
+import threading
+
+# Add project root to path to import the backend package (async_yolo uses relative imports)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.services.async_yolo import MultiprocessYOLO
+
+class BrokenRing:
+    """Ring que falla al escribir, como uno que se cierra mientras el lector entrega un frame."""
+    def fits(self, frame):
+        return True
+
+    def write(self, frame, meta=None):
+        raise ValueError("mmap closed or invalid")
+
+def test_failed_frame_write_is_counted_and_logged():
+    print("Testing frame writes never fail silently...")
+    client = MultiprocessYOLO.__new__(MultiprocessYOLO)
+    client.source_id = 7
+    client.vod = None
+    client.frame_ring = BrokenRing()
+    client.dropped_frames = 0
+    client.ring_lock = threading.Lock()
+
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        for _ in range(3):
+            client.update_frame(frame)
+    assert client.dropped_frames == 3
+    # Logged once, not once per frame
+    assert out.getvalue().count("frame write failed") == 1
+    print("✓ Frame write failures passed")
+
+if __name__ == "__main__":
+    test_failed_frame_write_is_counted_and_logged()
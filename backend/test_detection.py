@@ -0,0 +1,150 @@
+import cv2
+import numpy as np
+import os
+import sys
+import tempfile
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import detection, inference_backends
+from services.detection import CameraTracker, YoloDetector, audit_single_model, loaded_models
+
+class FakeBackend:
+    def detect(self, frames):
+        return [np.array([[1, 2, 30, 40, 0.9, 0]], dtype=np.float32) for _ in frames]
+
+def _broken(*args):
+    raise FileNotFoundError("artifact missing")
+
+def _with_backends(**loaders):
+    """Reemplaza temporalmente loaders del registro de backends; devuelve los originales."""
+    saved = dict(inference_backends.BACKENDS)
+    inference_backends.BACKENDS.update(loaders)
+    return saved
+
+def test_failed_backend_falls_back():
+    print("Testing fallback when the configured backend does not load...")
+    saved = _with_backends(**{"onnx-int8": _broken, "onnx": lambda *args: FakeBackend()})
+    try:
+        detector = YoloDetector(engine="onnx-int8")
+        # No queda un detector vacío: corre sobre onnx y sigue encontrando personas
+        assert detector.engine_name == "onnx"
+        assert len(detector.detect([np.zeros((64, 64, 3), dtype=np.uint8)])[0]) == 1
+    finally:
+        inference_backends.BACKENDS.clear()
+        inference_backends.BACKENDS.update(saved)
+
+def test_no_backend_raises():
+    print("Testing that a detector with no backend refuses to start...")
+    saved = _with_backends(**{"onnx-int8": _broken, "onnx": _broken})
+    fallbacks = detection.FALLBACK_ENGINES
+    # Sin Ultralytics en la cadena: el resultado no depende de lo instalado en el host
+    detection.FALLBACK_ENGINES = ("onnx",)
+    try:
+        YoloDetector(engine="onnx-int8")
+        assert False, "expected RuntimeError"
+    except RuntimeError as e:
+        assert "onnx-int8" in str(e) and "onnx:" in str(e)
+    finally:
+        detection.FALLBACK_ENGINES = fallbacks
+        inference_backends.BACKENDS.clear()
+        inference_backends.BACKENDS.update(saved)
+
+def test_int8_builds_its_artifacts():
+    assert inference_backends.required_artifacts("onnx-int8") == ["onnx", "onnx-int8"]
+
+def test_audit_counts_loaded_models():
+    print("Testing single-model audit...")
+    saved = _with_backends(onnx=lambda *args: FakeBackend())
+    try:
+        detector = YoloDetector(engine="onnx")
+        before = loaded_models()
+        # Un wrapper sin modelo (p. ej. tras soltarlo) no cuenta como modelo cargado
+        empty = YoloDetector.__new__(YoloDetector)
+        empty.backend = empty.model = None
+        YoloDetector.live.add(empty)
+        assert loaded_models() == before
+
+        second = YoloDetector(engine="onnx")
+        try:
+            audit_single_model("TEST")
+            assert False, "expected RuntimeError"
+        except RuntimeError as e:
+            assert "found" in str(e)
+        del second
+        # Con solo el detector de este test la auditoría pasa
+        extra = [d for d in list(YoloDetector.live) if d is not detector]
+        for d in extra:
+            YoloDetector.live.discard(d)
+        audit_single_model("TEST")
+    finally:
+        inference_backends.BACKENDS.clear()
+        inference_backends.BACKENDS.update(saved)
+
+class FakeUltralyticsTracker:
+    """Misma forma que BYTETracker de Ultralytics; reset_id() es global al proceso."""
+    global_resets = 0
+
+    def __init__(self):
+        self.tracked_stracks, self.lost_stracks, self.removed_stracks = ["a"], ["b"], ["c"]
+        self.frame_id = 7
+
+    def get_kalmanfilter(self):
+        return object()
+
+    def reset(self):
+        self.reset_id()
+
+    @staticmethod
+    def reset_id():
+        FakeUltralyticsTracker.global_resets += 1
+
+def test_reset_keeps_other_cameras_ids():
+    print("Testing tracker reset without touching the shared ID counter...")
+    camera = CameraTracker(engine="onnx")
+    camera.native_tracker = False
+    camera.tracker = FakeUltralyticsTracker()
+    camera.reset()
+    assert FakeUltralyticsTracker.global_resets == 0
+    assert camera.tracker.tracked_stracks == [] and camera.tracker.lost_stracks == [] and camera.tracker.frame_id == 0
+
+def test_overlay_does_not_advance_tracker():
+    print("Testing viewer frames between inferences...")
+    camera = CameraTracker(engine="onnx")
+    frame = np.zeros((120, 160, 3), dtype=np.uint8)
+    tripwire = {"x1": 0.5, "y1": 0.0, "x2": 0.5, "y2": 1.0, "direction": "any"}
+    camera.process(frame.copy(), np.array([[10, 10, 40, 60, 0.9, 0]], dtype=np.float32), tripwire, draw=False)
+    frames, boxes = camera.frame_count, camera.last_xyxy.copy()
+
+    out, metadata = camera.overlay(frame, tripwire, draw=False)
+    assert out is frame and not frame.any()
+    assert camera.frame_count == frames
+    assert np.array_equal(metadata["boxes"], boxes) and metadata["orig_shape"] == (160, 120)
+    # Con overlays del servidor el último estado se dibuja sobre el frame nuevo
+    camera.overlay(frame, tripwire, draw=True)
+    assert frame.any()
+
+def test_calibration_skips_benchmark_frames():
+    print("Testing INT8 calibration holds out the evaluated frames...")
+    path = os.path.join(tempfile.mkdtemp(), "ref.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 15, (64, 48))
+    for i in range(30):
+        writer.write(np.full((48, 64, 3), i * 8, dtype=np.uint8))
+    writer.release()
+
+    evaluated = inference_backends.read_clip(path, max_frames=10)
+    holdout = inference_backends._holdout(path, len(evaluated))
+    calibration = inference_backends.read_clip(path, max_frames=10, start=holdout[os.path.abspath(path)])
+    # Calibración y evaluación sobre frames distintos del mismo clip
+    assert len(evaluated) == 10 and len(calibration) == 10
+    assert abs(float(calibration[0].mean()) - 80) < 4
+    assert all(abs(float(c.mean()) - float(e.mean())) > 40 for c in calibration for e in evaluated[:5])
+
+if __name__ == "__main__":
+    test_failed_backend_falls_back()
+    test_no_backend_raises()
+    test_int8_builds_its_artifacts()
+    test_audit_counts_loaded_models()
+    test_reset_keeps_other_cameras_ids()
+    test_overlay_does_not_advance_tracker()
+    test_calibration_skips_benchmark_frames()
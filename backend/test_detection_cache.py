@@ -0,0 +1,123 @@
+import numpy as np
+import os
+import sys
+import tempfile
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.detection_cache import DetectionCache, cache_key, cache_stride, file_key
+
+def test_put_and_replay():
+    print("Testing detection cache round trip...")
+    root = tempfile.mkdtemp()
+    key = cache_key("ab" * 32, "onnx", 320, (240, 320), None)
+    cache = DetectionCache(key, frame_count=10, root=root)
+
+    dets = np.array([[1, 2, 30, 40, 0.9, 0], [5, 6, 50, 60, 0.5, 0]], dtype=np.float32)
+    assert cache.get(3) is None
+    cache.put(3, dets)
+    cache.put(4, np.zeros((0, 6), dtype=np.float32))
+    # Out of range frames are ignored (CAP_PROP_FRAME_COUNT can be approximate)
+    cache.put(99, dets)
+
+    assert np.array_equal(cache.get(3), dets)
+    assert cache.get(4).shape == (0, 6)
+    assert cache.coverage() == 0.2
+    cache.close()
+
+    # A later pass (new process / new lease) reads the same data from disk
+    cache = DetectionCache(key, frame_count=10, root=root)
+    assert np.array_equal(cache.get(3), dets)
+    cache.close()
+    print("✓ Round trip passed")
+
+def test_second_opener_is_read_only():
+    print("Testing single writer...")
+    root = tempfile.mkdtemp()
+    writer = DetectionCache("k", frame_count=5, root=root)
+    reader = DetectionCache("k", frame_count=5, root=root)
+    assert writer.writer and not reader.writer
+
+    dets = np.ones((1, 6), dtype=np.float32)
+    reader.put(0, dets)
+    assert writer.get(0) is None
+    writer.put(0, dets)
+    assert np.array_equal(reader.get(0), dets)
+    reader.close()
+    writer.close()
+    print("✓ Single writer passed")
+
+def _sample(fps, phase, stride, video_fps=30.0, frame_count=300):
+    """Frames que entrega el pipeline a `fps`: cada vez que toca, el siguiente de la grilla del caché."""
+    frames, t = [], phase
+    while True:
+        i = int(np.ceil(t / stride)) * stride
+        if i >= frame_count:
+            return frames
+        if not frames or i > frames[-1]:
+            frames.append(i)
+        t += video_fps / fps
+
+def _run_pass(cache, frames):
+    """Simula una pasada del bucle: aciertos se reutilizan, fallos se 'infieren' y se guardan."""
+    hits = 0
+    for i in frames:
+        cached = cache.get(i)
+        if cached is not None:
+            # Exact frame: the tracker never gets boxes from another frame
+            assert cached[0, 0] == i
+            hits += 1
+        else:
+            cache.put(i, np.full((1, 6), i, dtype=np.float32))
+    return hits / len(frames)
+
+def test_hit_rate_with_different_sampling():
+    print("Testing hit rate across passes at different rates...")
+    root = tempfile.mkdtemp()
+    # 30 fps file, inference capped at 15 fps -> one cached frame every 2
+    stride = cache_stride(30.0, 15.0)
+    assert stride == 2
+    cache = DetectionCache("k", frame_count=300, root=root, stride=stride)
+
+    # Off-grid frames are never stored nor served
+    cache.put(1, np.ones((1, 6), dtype=np.float32))
+    assert cache.get(1) is None and cache.coverage() == 0.0
+
+    # A slow first pass (5 fps) only covers a third of the grid
+    first = _sample(5, 0, stride)
+    assert _run_pass(cache, first) == 0.0
+    assert abs(cache.coverage() - 1 / 3) < 1e-6
+
+    # A pass at another rate and phase hits exactly the grid frames it shares with the earlier ones
+    second = _sample(12, 1, stride)
+    expected = len(set(first) & set(second)) / len(second)
+    assert expected > 0.3
+    assert abs(_run_pass(cache, second) - expected) < 1e-6
+
+    # Each miss fills its frame, so coverage only grows and a pass at the full rate completes the grid
+    before = cache.coverage()
+    assert abs(_run_pass(cache, _sample(15, 0.5, stride)) - before) < 0.01
+    assert cache.coverage() == 1.0
+    # From then on any rate or phase is all hits
+    assert _run_pass(cache, _sample(7, 3, stride)) == 1.0
+    cache.close()
+    print("✓ Hit rate passed")
+
+def test_key_depends_on_roi_and_content():
+    path = os.path.join(tempfile.mkdtemp(), "clip.bin")
+    with open(path, "wb") as f:
+        f.write(b"video")
+    h = file_key(path)
+    assert cache_key(h, "onnx", 320, (240, 320), None) != cache_key(h, "onnx", 320, (240, 320), (0.1, 0.2, 0.9, 0.8))
+    assert cache_key(h, "onnx", 320, (240, 320), None) != cache_key(h, "onnx", 640, (240, 320), None)
+    assert cache_key(h, "onnx", 320, (240, 320), None, 1) != cache_key(h, "onnx", 320, (240, 320), None, 2)
+    # Replacing the file (new size / mtime) gives a new key without reading the content
+    with open(path, "wb") as f:
+        f.write(b"another video")
+    assert file_key(path) != h
+
+if __name__ == "__main__":
+    test_put_and_replay()
+    test_second_opener_is_read_only()
+    test_hit_rate_with_different_sampling()
+    test_key_depends_on_roi_and_content()
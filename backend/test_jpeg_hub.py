@@ -0,0 +1,107 @@
+import numpy as np
+import os
+import sys
+import threading
+import time
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.jpeg_hub import JpegHub
+
+class FakeProcessor:
+    """Publica un frame nuevo cada vez que se llama a publish(), como el ring de resultados."""
+    def __init__(self):
+        self.latest_seq = 0
+        self.frame = None
+        self.new = threading.Event()
+
+    def publish(self):
+        self.frame = np.random.randint(0, 255, (120, 160, 3), np.uint8)
+        self.latest_seq += 1
+        self.new.set()
+
+    def wait_for_result(self, after_seq, timeout=1.0):
+        ok = self.new.wait(timeout)
+        self.new.clear()
+        return ok
+
+    def get_latest_processed_frame(self, fallback_frame):
+        return self.frame if self.frame is not None else fallback_frame
+
+    def get_latest_metadata(self):
+        return {"entry_count": self.latest_seq}
+
+def test_encodes_once_for_all_viewers():
+    print("Testing JPEG hub shares one encode per frame...")
+    processor = FakeProcessor()
+    hub = JpegHub(1)
+    hub.processor = processor
+    hub.start()
+
+    # Sin suscriptores no se codifica nada
+    processor.publish()
+    time.sleep(0.2)
+    assert hub.encoded == 0
+
+    received = [[] for _ in range(3)]
+    def viewer(i):
+        seq = 0
+        while len(received[i]) < 3:
+            seq, jpeg = hub.wait(seq, timeout=2.0)
+            assert jpeg is not None and jpeg[:2] == b'\xff\xd8'
+            received[i].append(seq)
+
+    for _ in received:
+        hub.subscribe()
+    threads = [threading.Thread(target=viewer, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        processor.publish()
+        time.sleep(0.05)
+    for t in threads:
+        t.join()
+
+    # Cada visor vio JPEGs nuevos; el hub codificó por frame, no por visor
+    assert all(r == sorted(set(r)) for r in received)
+    assert hub.encoded <= max(r[-1] for r in received)
+    hub.stop()
+    hub.join(timeout=2.0)
+    assert not hub.is_alive()
+
+def test_reader_frames_independent_of_results():
+    print("Testing live video from reader frames...")
+    processor = FakeProcessor()
+    hub = JpegHub(1, reader_frames=True)
+    hub.processor = processor
+    hub.start()
+
+    # Sin visores de video el lector no entrega nada
+    assert hub.view_fps() == 0 and not hub.frame_wanted()
+    hub.subscribe(fps=20)
+    assert hub.view_fps() == 20 and hub.frame_wanted()
+
+    # Diez frames del lector y un solo resultado del servidor: el video no espera a la inferencia
+    seq = 0
+    processor.publish()
+    frames = 0
+    for _ in range(10):
+        hub.push_frame(np.random.randint(0, 255, (120, 160, 3), np.uint8))
+        assert not hub.frame_wanted()
+        seq, jpeg = hub.wait(seq, timeout=2.0)
+        assert jpeg is not None
+        frames += 1
+        time.sleep(0.05)
+    assert frames == 10 and seq >= 8
+    meta_seq, meta = hub.latest_meta()
+    assert meta_seq == 1 and meta == {"entry_count": 1}
+
+    hub.unsubscribe(fps=20)
+    assert hub.view_fps() == 0
+    hub.stop()
+    hub.join(timeout=2.0)
+    assert not hub.is_alive()
+
+if __name__ == "__main__":
+    test_encodes_once_for_all_viewers()
+    test_reader_frames_independent_of_results()
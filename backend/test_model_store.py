@@ -0,0 +1,101 @@
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import model_store
+
+def _slow_builder(tmp_dir):
+    # Simulates an export: writes in pieces, takes a while
+    path = os.path.join(tmp_dir, "export.onnx")
+    with open(path, "wb") as f:
+        for _ in range(5):
+            f.write(b"x" * 1024)
+            time.sleep(0.05)
+    with open(os.path.join(os.path.dirname(tmp_dir), "builds.log"), "a") as log:
+        log.write("built\n")
+    return path
+
+def _worker(model_dir):
+    model_store.MODEL_DIR = model_dir
+    model_store.ensure("onnx", _slow_builder, 320)
+
+def test_concurrent_ensure_builds_once():
+    print("Testing concurrent builds...")
+    model_dir = tempfile.mkdtemp()
+    ctx = mp.get_context("spawn")
+    workers = [ctx.Process(target=_worker, args=(model_dir,)) for _ in range(4)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    with open(os.path.join(model_dir, "builds.log")) as log:
+        assert log.read().count("built") == 1
+    model_store.MODEL_DIR = model_dir
+    assert model_store.is_valid("onnx", 320)
+    # No temporary build directories left behind
+    assert not [d for d in os.listdir(model_dir) if d.startswith(".build-")]
+    print("✓ Concurrent builds passed")
+
+def _variant_worker(model_dir, variant, imgsz):
+    model_store.MODEL_DIR = model_dir
+    model_store.ensure(variant, _slow_builder, imgsz)
+
+def test_parallel_variants_keep_every_manifest_entry():
+    print("Testing manifest updates from parallel builds...")
+    model_dir = tempfile.mkdtemp()
+    ctx = mp.get_context("spawn")
+    # Cada build toma solo el lock de su artefacto; el manifest tiene el suyo
+    jobs = [("onnx", 320), ("onnx", 640), ("onnx-int8", 320), ("onnx-int8", 640)]
+    workers = [ctx.Process(target=_variant_worker, args=(model_dir, v, i)) for v, i in jobs]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    model_store.MODEL_DIR = model_dir
+    manifest = model_store._read_manifest()
+    assert sorted(manifest) == sorted(model_store.artifact_name(v, i) for v, i in jobs)
+    assert all(model_store.is_valid(v, i) for v, i in jobs)
+    print("✓ Manifest passed")
+
+def test_is_valid_hashes_only_when_changed():
+    print("Testing cached checksum verification...")
+    model_store.MODEL_DIR = tempfile.mkdtemp()
+    path = model_store.ensure("onnx", _slow_builder, 416)
+    hashed = []
+    original = model_store.sha256_of
+    model_store.sha256_of = lambda p: hashed.append(p) or original(p)
+    try:
+        assert model_store.is_valid("onnx", 416)
+        assert model_store.is_valid("onnx", 416)
+        assert len(hashed) <= 1
+        with open(path, "ab") as f:
+            f.write(b"garbage")
+        assert not model_store.is_valid("onnx", 416)
+    finally:
+        model_store.sha256_of = original
+    print("✓ Cached verification passed")
+
+def test_corrupted_artifact_is_rebuilt():
+    print("Testing checksum verification...")
+    model_store.MODEL_DIR = tempfile.mkdtemp()
+    path = model_store.ensure("onnx", _slow_builder, 640)
+    assert path.endswith("yolo11n_640.onnx")
+
+    with open(path, "ab") as f:
+        f.write(b"truncated export garbage")
+    assert not model_store.is_valid("onnx", 640)
+    model_store.ensure("onnx", _slow_builder, 640)
+    assert model_store.is_valid("onnx", 640)
+    print("✓ Checksum passed")
+
+if __name__ == "__main__":
+    test_concurrent_ensure_builds_once()
+    test_corrupted_artifact_is_rebuilt()
+    test_parallel_variants_keep_every_manifest_entry()
+    test_is_valid_hashes_only_when_changed()
@@ -0,0 +1,89 @@
+import numpy as np
+import sys
+import os
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.motion_gate import MotionGate
+
+class Line:
+    def __init__(self, x1, y1, x2, y2):
+        self.x1, self.y1, self.x2, self.y2 = x1, y1, x2, y2
+
+def test_static_scene_is_gated():
+    print("Testing static scene gating...")
+    gate = MotionGate(idle_refresh_sec=10.0)
+    frame = np.full((240, 320, 3), 80, dtype=np.uint8)
+
+    # First frame initializes the background and always runs inference
+    assert gate.should_infer(frame, now=0.0)
+    for i in range(1, 20):
+        assert not gate.should_infer(frame, now=i * 0.1)
+    assert gate.skipped == 19
+    print("✓ Static scene passed")
+
+def test_motion_in_band_resumes_inference():
+    print("Testing motion near the tripwire...")
+    gate = MotionGate(idle_refresh_sec=10.0)
+    line = Line(0.0, 0.5, 1.0, 0.5)
+    frame = np.full((240, 320, 3), 80, dtype=np.uint8)
+    gate.should_infer(frame, line, now=0.0)
+    assert not gate.should_infer(frame, line, now=0.1)
+
+    moving = frame.copy()
+    moving[100:140, 140:180] = 255  # Person-sized blob on the line
+    assert gate.should_infer(moving, line, now=0.2)
+    print("✓ Motion in band passed")
+
+def test_motion_outside_band_is_ignored():
+    print("Testing motion far from the tripwire...")
+    gate = MotionGate(idle_refresh_sec=10.0, band_padding=0.1)
+    line = Line(0.0, 0.9, 1.0, 0.9)
+    frame = np.full((240, 320, 3), 80, dtype=np.uint8)
+    gate.should_infer(frame, line, now=0.0)
+
+    moving = frame.copy()
+    moving[0:40, 140:180] = 255  # Top of the frame, far from the line
+    assert not gate.should_infer(moving, line, now=0.1)
+    print("✓ Motion outside band passed")
+
+def test_active_tracks_and_idle_refresh():
+    print("Testing active tracks and idle refresh...")
+    gate = MotionGate(idle_refresh_sec=1.0)
+    frame = np.full((240, 320, 3), 80, dtype=np.uint8)
+    gate.should_infer(frame, now=0.0)
+
+    # Someone is still being tracked: never gate
+    assert gate.should_infer(frame, active_tracks=2, now=0.1)
+    assert not gate.should_infer(frame, now=0.5)
+    # Periodic refresh even if nothing moves
+    assert gate.should_infer(frame, now=1.2)
+    print("✓ Active tracks and refresh passed")
+
+def test_probe_result_is_reused():
+    print("Testing motion probe between inferences...")
+    gate = MotionGate(idle_refresh_sec=10.0)
+    line = Line(0.0, 0.5, 1.0, 0.5)
+    frame = np.full((240, 320, 3), 80, dtype=np.uint8)
+    gate.should_infer(frame, line, now=0.0)
+
+    moving = frame.copy()
+    moving[100:140, 140:180] = 255
+    # El sondeo ya actualizó el fondo con este frame: should_infer usa su resultado sin volver a comparar
+    assert gate.has_motion(moving, line) and gate.motion
+    assert gate.should_infer(moving, line, now=0.05, motion=True)
+    print("✓ Motion probe passed")
+
+if __name__ == "__main__":
+    try:
+        test_static_scene_is_gated()
+        test_motion_in_band_resumes_inference()
+        test_motion_outside_band_is_ignored()
+        test_active_tracks_and_idle_refresh()
+        test_probe_result_is_reused()
+        print("\nALL TESTS PASSED!")
+    except Exception as e:
+        print(f"\nTEST FAILED: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,82 @@
+import cv2
+import datetime
+import multiprocessing as mp
+import numpy as np
+import os
+import sys
+import tempfile
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services import offline_counter
+from services.detection import CameraTracker
+from services.offline_counter import plan_chunks, bucket_counts, frame_stride, count_chunk
+
+def test_chunks_cover_every_frame_once():
+    print("Testing chunk plan...")
+    stride = frame_stride(30)
+    chunks = plan_chunks(30 * 700, 30, chunk_sec=300, overlap_sec=10, stride=stride)
+    assert len(chunks) == 3
+    # Los tramos propios [start, end) se tocan sin huecos ni solapes
+    assert chunks[0]["start"] == 0 and chunks[-1]["end"] == 30 * 700
+    for a, b in zip(chunks, chunks[1:]):
+        assert a["end"] == b["start"]
+        # El calentamiento empieza antes del borde y alineado al stride
+        assert b["warm_start"] < b["start"] and b["warm_start"] % stride == 0
+    print("✓ Chunk plan passed")
+
+def test_buckets_use_recording_clock():
+    print("Testing buckets...")
+    recorded_at = datetime.datetime(2026, 3, 2, 23, 50, 0)
+    fps = 10
+    events = [(0, 'IN'), (10 * 60 * 4, 'OUT'), (10 * 60 * 6, 'IN'), (10 * 60 * 11, 'IN')]
+    counts = bucket_counts(events, fps, recorded_at, bucket_minutes=15)
+    assert counts[datetime.datetime(2026, 3, 2, 23, 45)] == [2, 1]
+    # 00:01 ya cae en el primer bloque del día siguiente
+    assert counts[datetime.datetime(2026, 3, 3, 0, 0)] == [1, 0]
+    print("✓ Buckets passed")
+
+class BlobDetector:
+    """Detector de prueba: una caja por cada mancha blanca del frame."""
+    def detect(self, frames):
+        results = []
+        for frame in frames:
+            mask = (cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) > 128).astype(np.uint8)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            boxes = [[x, y, x + w, y + h, 0.9, 0] for x, y, w, h in map(cv2.boundingRect, contours)]
+            results.append(np.array(boxes, dtype=np.float32).reshape(-1, 6))
+        return results
+
+def test_count_chunk_counts_crossing():
+    print("Testing offline chunk counting with the DB tripwire dict...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "walk.avi")
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 15, (320, 240))
+        # Una "persona" cruza de izquierda a derecha la línea vertical x = 0.5
+        for i in range(40):
+            frame = np.zeros((240, 320, 3), dtype=np.uint8)
+            x = 20 + i * 6
+            cv2.rectangle(frame, (x, 80), (x + 30, 180), (255, 255, 255), -1)
+            writer.write(frame)
+        writer.release()
+
+        offline_counter._worker.update({
+            "detector": BlobDetector(),
+            "tracker_cls": CameraTracker,
+            "engine": "onnx",
+            "progress": mp.Value('q', 0),
+            "cancel": mp.Value('b', 0)
+        })
+        # Mismo formato que crud.get_tripwire_config
+        tripwire = {'x1': 0.5, 'y1': 0.0, 'x2': 0.5, 'y2': 1.0, 'direction': 'IN', 'lines': []}
+        chunk, events = count_chunk(path, {"warm_start": 0, "start": 0, "end": 40}, tripwire, 1)
+        assert len(events) == 1 and events[0][1] in ('IN', 'OUT')
+        # Los cruces del calentamiento no se reportan
+        _, events = count_chunk(path, {"warm_start": 0, "start": 35, "end": 40}, tripwire, 1)
+        assert events == []
+    print("✓ Chunk counting passed")
+
+if __name__ == "__main__":
+    test_chunks_cover_every_frame_once()
+    test_buckets_use_recording_clock()
+    test_count_chunk_counts_crossing()
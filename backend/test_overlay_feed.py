@@ -0,0 +1,43 @@
+import json
+import numpy as np
+import os
+import sys
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.overlay_feed import compact_metadata, lines_key, sse_event
+
+def test_compact_metadata():
+    print("Testing compact overlay metadata...")
+    meta = {
+        "ts": 1700000000.12345,
+        "boxes": np.array([[10, 20, 50, 120], [200, 30, 240, 140]], dtype=np.int32),
+        "track_ids": np.array([7, 9], dtype=np.int64),
+        "orig_shape": (800, 450),
+        "entry_count": 3,
+        "exit_count": 1,
+        "lines": [{"name": "principal", "points": [[0.0, 0.5], [1.0, 0.512345]], "direction": None}]
+    }
+    data = compact_metadata(5, meta)
+    assert data["boxes"] == [[10, 20, 50, 120, 7], [200, 30, 240, 140, 9]]
+    assert (data["w"], data["h"], data["in"], data["out"]) == (800, 450, 3, 1)
+    assert data["lines"] == [{"name": "principal", "direction": "IN", "points": [[0.0, 0.5], [1.0, 0.5123]]}]
+    # Se serializa a JSON sin tipos de numpy
+    json.dumps(data)
+
+    assert "lines" not in compact_metadata(6, meta, include_lines=False)
+    # Resultados headless (sin cajas) también se pueden enviar
+    assert compact_metadata(7, {"entry_count": 2})["boxes"] == []
+
+def test_lines_key_and_event():
+    print("Testing SSE framing...")
+    a = {"lines": [{"name": "a", "points": [[0, 0], [1, 1]], "direction": "IN"}]}
+    b = {"lines": [{"name": "a", "points": [[0, 0], [1, 0.9]], "direction": "IN"}]}
+    assert lines_key(a) == lines_key(dict(a)) and lines_key(a) != lines_key(b)
+
+    event = sse_event({"seq": 1})
+    assert event == b'data: {"seq":1}\n\n'
+
+if __name__ == "__main__":
+    test_compact_metadata()
+    test_lines_key_and_event()
@@ -5,7 +5,7 @@ import os
 
 # Add parent directory to path to import preprocessing
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from preprocessing import PreprocessingModule
+from preprocessing import PreprocessingModule, compute_tripwire_roi
 
 def test_basic_processing():
     print("Testing basic processing...")
@@ -99,6 +99,35 @@ def test_enhancement():
     assert np.all(p_frame >= 190) # Allow some variance due to denoise/rounding
     print("✓ Enhancement passed")
 
+def test_tripwire_roi():
+    print("Testing tripwire ROI computation...")
+    # Horizontal line across the middle: full width, padded band in height
+    roi = compute_tripwire_roi(0.0, 0.5, 1.0, 0.5, padding=0.2)
+    assert roi == [0.0, 0.3, 1.0, 0.7]
+
+    # Short line near the border keeps its minimum size inside the frame
+    x1, y1, x2, y2 = compute_tripwire_roi(0.95, 0.1, 1.0, 0.1, padding=0.05, min_size=0.4)
+    assert x2 == 1.0 and abs((x2 - x1) - 0.4) < 1e-9
+    assert y1 == 0.0 and abs((y2 - y1) - 0.4) < 1e-9
+    print("✓ Tripwire ROI passed")
+
+def test_crop_roi_offset():
+    print("Testing ROI crop offset...")
+    proc = PreprocessingModule({"roi": [0.25, 0.5, 0.75, 1.0]})
+    frame = np.zeros((100, 200, 3), dtype=np.uint8)
+    frame[60, 70] = [1, 2, 3]
+
+    crop, (ox, oy) = proc.crop_roi(frame)
+    assert crop.shape == (50, 100, 3)
+    assert (ox, oy) == (50, 50)
+    # A pixel found in the crop maps back to the same pixel in the full frame
+    assert np.array_equal(crop[60 - oy, 70 - ox], frame[60, 70])
+
+    proc.set_config({"roi": None})
+    crop, offset = proc.crop_roi(frame)
+    assert crop is frame and offset == (0, 0)
+    print("✓ ROI crop offset passed")
+
 if __name__ == "__main__":
     try:
         test_basic_processing()
@@ -106,6 +135,8 @@ if __name__ == "__main__":
         test_roi()
         test_normalization_and_color()
         test_enhancement()
+        test_tripwire_roi()
+        test_crop_roi_offset()
         print("\nALL TESTS PASSED!")
     except Exception as e:
         print(f"\nTEST FAILED: {str(e)}")
@@ -0,0 +1,56 @@
+import sys
+import os
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.rate_controller import AdaptiveRateController
+
+def test_idle_scene_decays_to_min():
+    print("Testing idle scene decay...")
+    ctrl = AdaptiveRateController(min_fps=2.0, max_fps=15.0, initial_fps=12.0)
+    for _ in range(50):
+        fps = ctrl.update(latency=0.05, cpu_saturation=0.2, active_tracks=0, approach_speed=0.0)
+    assert abs(fps - 2.0) < 0.1
+    print("✓ Idle decay passed")
+
+def test_fast_crossing_ramps_up_immediately():
+    print("Testing fast crossing ramp-up...")
+    ctrl = AdaptiveRateController(min_fps=2.0, max_fps=15.0, initial_fps=2.0, max_step=0.05)
+    # Person moving 0.6 frame-widths per second towards the line needs 12 FPS
+    fps = ctrl.update(latency=0.02, cpu_saturation=0.2, active_tracks=1, approach_speed=0.6)
+    assert abs(fps - 12.0) < 1e-6
+    # Never above max_fps
+    fps = ctrl.update(latency=0.02, cpu_saturation=0.2, active_tracks=1, approach_speed=5.0)
+    assert fps == 15.0
+    print("✓ Ramp-up passed")
+
+def test_latency_and_cpu_caps():
+    print("Testing latency and CPU caps...")
+    ctrl = AdaptiveRateController(min_fps=2.0, max_fps=15.0, busy_fps=10.0, cpu_target=0.8)
+    # Inference takes 200ms: can't do more than 5 FPS
+    assert ctrl.target_fps(0.2, 0.2, active_tracks=3, approach_speed=0.0) == 5.0
+    # Host at 160% of the target load halves the rate
+    assert ctrl.target_fps(0.01, 1.6, active_tracks=3, approach_speed=0.0) == 5.0
+    # Bounds are respected even under heavy load
+    assert ctrl.target_fps(1.0, 4.0, active_tracks=3, approach_speed=0.0) == 2.0
+    print("✓ Latency and CPU caps passed")
+
+def test_motion_ramps_up_without_tracks():
+    print("Testing motion ramp-up before tracks exist...")
+    ctrl = AdaptiveRateController(min_fps=2.0, max_fps=15.0, initial_fps=2.0, busy_fps=10.0)
+    # Movimiento en la franja: sube de inmediato aunque el tracker todavía no tenga pistas
+    assert ctrl.update(latency=0.02, cpu_saturation=0.2, active_tracks=0, approach_speed=0.0, motion=True) == 10.0
+    print("✓ Motion ramp-up passed")
+
+if __name__ == "__main__":
+    try:
+        test_idle_scene_decays_to_min()
+        test_fast_crossing_ramps_up_immediately()
+        test_latency_and_cpu_caps()
+        test_motion_ramps_up_without_tracks()
+        print("\nALL TESTS PASSED!")
+    except Exception as e:
+        print(f"\nTEST FAILED: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,82 @@
+import os
+import sys
+import threading
+import time
+
+# Add project root to path to import the backend package (scheduler uses relative imports)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import pipeline as pipeline_module
+from backend import scheduler
+
+class FakeProcessor:
+    def __init__(self):
+        self.counts = (0, 0)
+
+    def get_counts(self):
+        return self.counts
+
+    def poll_events(self):
+        return []
+
+class FakePipeline(threading.Thread):
+    """Pipeline sin video: vive hasta que el test lo mata con die o lo detiene el manager."""
+    created = []
+
+    def __init__(self, source_id, source_path, is_rtsp):
+        super().__init__(daemon=True)
+        self.source_id = source_id
+        self.source_path = source_path
+        self.is_rtsp = is_rtsp
+        self.refs = {pipeline_module.VIEWER: 0, pipeline_module.SCHEDULE: 0}
+        self.stop_event = threading.Event()
+        self.die = threading.Event()
+        self.processor = None
+        FakePipeline.created.append(self)
+
+    def run(self):
+        self.processor = FakeProcessor()
+        while not self.stop_event.is_set() and not self.die.wait(0.01):
+            pass
+
+def _wait_for(condition, timeout=3.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_task_follows_restarted_pipeline():
+    print("Testing scheduled counting across a pipeline restart...")
+    original = pipeline_module.SourcePipeline
+    pipeline_module.SourcePipeline = FakePipeline
+    saved = []
+    task = scheduler.HeadlessStreamTask(99, "fake.mp4", False)
+    task.POLL_SEC = 0.02
+    task.save_counts = lambda total_in, total_out: saved.append((total_in, total_out))
+    try:
+        task.start()
+        _wait_for(lambda: FakePipeline.created and FakePipeline.created[0].processor is not None)
+        first = FakePipeline.created[0]
+        # La sesión cuenta desde el primer sondeo (baseline)
+        _wait_for(lambda: task.baseline is not None)
+        first.processor.counts = (3, 1)
+        _wait_for(lambda: saved and saved[-1] == (3, 1))
+
+        # El pipeline muere solo (p. ej. se cayó la cámara): la tarea lo revive y sigue contando
+        first.die.set()
+        _wait_for(lambda: len(FakePipeline.created) == 2 and FakePipeline.created[1].processor is not None)
+        second = FakePipeline.created[1]
+        _wait_for(lambda: task.pipeline is second)
+        assert pipeline_module.pipelines.get(99) is second and second.refs[pipeline_module.SCHEDULE] == 1
+        _wait_for(lambda: task.baseline is not None)
+        second.processor.counts = (2, 0)
+        _wait_for(lambda: saved[-1] == (5, 1))
+    finally:
+        task.stop_event.set()
+        task.join(timeout=2.0)
+        pipeline_module.SourcePipeline = original
+    # Al terminar suelta su referencia y el pipeline se cierra
+    assert pipeline_module.pipelines.get(99) is None
+    print("✓ Pipeline restart passed")
+
+if __name__ == "__main__":
+    test_task_follows_restarted_pipeline()
@@ -0,0 +1,91 @@
+import numpy as np
+import sys
+import os
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.shm_transport import SharedFrameRing
+
+def test_write_and_read_latest():
+    print("Testing shared frame ring write/read...")
+    ring = SharedFrameRing(slots=3, max_width=64, max_height=64, meta_bytes=1024)
+    reader = SharedFrameRing.attach(ring.spec())
+    try:
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        frame[10:20, 10:20] = [0, 255, 0]
+
+        seq = ring.write(frame, {"x1": 0.1, "direction": "IN"})
+        assert seq == 1
+
+        r_seq, r_frame, meta = reader.read_latest(0)
+        assert r_seq == 1
+        assert r_frame.shape == (48, 64, 3)
+        assert np.array_equal(r_frame, frame)
+        assert meta == {"x1": 0.1, "direction": "IN"}
+
+        # Nothing new after the last sequence read
+        assert reader.read_latest(r_seq) == (0, None, None)
+    finally:
+        reader.close()
+        ring.close()
+    print("✓ Write/read passed")
+
+def test_ring_wraparound_keeps_latest():
+    print("Testing ring wraparound...")
+    ring = SharedFrameRing(slots=2, max_width=32, max_height=32, meta_bytes=64)
+    try:
+        out = np.empty(ring.frame_bytes, dtype=np.uint8)
+        for i in range(1, 6):
+            ring.write(np.full((16, 16, 3), i, dtype=np.uint8))
+
+        seq, frame, meta = ring.read_latest(0, out=out)
+        assert seq == 5
+        assert meta is None
+        assert np.all(frame == 5)
+        # The frame is copied into the reader's own buffer, not a view of the slot
+        assert np.shares_memory(frame, out)
+    finally:
+        ring.close()
+    print("✓ Wraparound passed")
+
+def test_oversized_frame_rejected():
+    print("Testing oversized frame rejection...")
+    ring = SharedFrameRing(slots=2, max_width=32, max_height=32, meta_bytes=64)
+    try:
+        assert ring.write(np.zeros((64, 64, 3), dtype=np.uint8)) == 0
+        assert ring.latest_seq == 0
+        assert not ring.wait_for(0, timeout=0.01)
+    finally:
+        ring.close()
+    print("✓ Oversized frame passed")
+
+def test_oversized_metadata_keeps_essentials():
+    print("Testing oversized metadata...")
+    ring = SharedFrameRing(slots=2, max_width=32, max_height=32, meta_bytes=256)
+    try:
+        meta = {"entry_count": 3, "events": [(1, 7, 'IN', 0.0)], "tracks": list(range(1000))}
+        # Con claves esenciales se publican conteos y eventos en vez de perderlos
+        seq = ring.write(np.zeros((8, 8, 3), dtype=np.uint8), meta, essential=("entry_count", "events"))
+        assert seq == 1 and ring.trimmed == 1
+        _, _, got = ring.read_latest(0)
+        assert got == {"entry_count": 3, "events": [(1, 7, 'IN', 0.0)]}
+
+        # Sin claves esenciales no se publica un frame sin sus metadatos: se descarta y se registra
+        assert ring.write(np.zeros((8, 8, 3), dtype=np.uint8), meta) == 0
+        assert ring.dropped == 1 and ring.latest_seq == 1
+    finally:
+        ring.close()
+    print("✓ Oversized metadata passed")
+
+if __name__ == "__main__":
+    try:
+        test_write_and_read_latest()
+        test_ring_wraparound_keeps_latest()
+        test_oversized_frame_rejected()
+        test_oversized_metadata_keeps_essentials()
+        print("\nALL TESTS PASSED!")
+    except Exception as e:
+        print(f"\nTEST FAILED: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,35 @@
+import os
+import sys
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.stream_quality import AdaptiveQuality, FAST_FRAMES, SLOW_FRAMES, stream_variant
+
+def test_stream_variant_snaps_requests():
+    print("Testing stream variant normalization...")
+    # Pedidos parecidos comparten variante
+    assert stream_variant(200, 48) == stream_variant(220, 52) == (240, 50)
+    assert stream_variant(None, None) == (None, 65)
+    # Más ancho que el mayor escalón: frame completo
+    assert stream_variant(1920, 100) == (None, 90)
+    assert stream_variant(100, 1) == (160, 20)
+
+def test_adaptive_steps_down_and_recovers():
+    print("Testing adaptive quality ladder...")
+    control = AdaptiveQuality(320, 60)
+    assert control.variant == (320, 60)
+    # Nunca ofrece más que lo pedido
+    assert all(w is not None and w <= 320 and q <= 60 for w, q in control.ladder)
+
+    changed = [control.update(0.5, 0.1) for _ in range(SLOW_FRAMES)]
+    assert changed[-1] and control.variant == control.ladder[1]
+
+    # Un envío lento aislado no cambia nada
+    assert not control.update(0.5, 0.1)
+    for _ in range(FAST_FRAMES - 1):
+        assert not control.update(0.001, 0.1)
+    assert control.update(0.001, 0.1) and control.variant == (320, 60)
+
+if __name__ == "__main__":
+    test_stream_variant_snaps_requests()
+    test_adaptive_steps_down_and_recovers()
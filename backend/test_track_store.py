@@ -0,0 +1,48 @@
+import numpy as np
+import sys
+import os
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.track_store import TrackStore
+
+def test_trail_is_chronological_view():
+    print("Testing ring buffer trails...")
+    store = TrackStore(capacity=4, history=5)
+    for i in range(8):
+        store.update([7], np.array([[i, 2 * i]]))
+
+    trail = store.trail(7)
+    # Only the last `history` points, oldest first, without copying
+    assert trail[:, 0].tolist() == [3, 4, 5, 6, 7]
+    assert np.shares_memory(trail, store.points)
+    assert not trail.flags.writeable
+    print("✓ Trails passed")
+
+def test_last_steps_and_eviction():
+    print("Testing last steps and bulk eviction...")
+    store = TrackStore(capacity=2, history=5)
+    store.update([1, 2], np.array([[0, 0], [10, 10]]))
+    slots = store.update([1, 2, 3], np.array([[1, 1], [11, 11], [50, 50]]))
+    # Capacity grows when every slot is taken
+    assert len(store) == 3 and len(store.ids) == 4
+
+    moving, prev, curr = store.last_steps(slots)
+    assert moving.tolist() == [0, 1]
+    assert prev.tolist() == [[0, 0], [10, 10]]
+    assert curr.tolist() == [[1, 1], [11, 11]]
+
+    store.mark_counted(slots[0], 1)
+    assert store.counted_mask(slots, 2).tolist() == [[False, True], [False, False], [False, False]]
+
+    # Track 1 and 3 vanish: their slots are freed and reused clean
+    store.update([2], np.array([[12, 12]]))
+    assert 1 not in store and 3 not in store and len(store) == 1
+    slots = store.update([2, 9], np.array([[13, 13], [0, 0]]))
+    assert store.counted_mask(slots, 2).sum() == 0
+    assert len(store.trail(9)) == 1
+    print("✓ Eviction passed")
+
+if __name__ == "__main__":
+    test_trail_is_chronological_view()
+    test_last_steps_and_eviction()
@@ -0,0 +1,76 @@
+import numpy as np
+import sys
+import os
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.tripwire_engine import MAX_LINES, TripwireEngine, segment_crossings
+
+def test_single_line_direction():
+    print("Testing crossing direction on a horizontal line...")
+    engine = TripwireEngine()
+    engine.set_lines([{"name": "principal", "points": [[0.0, 0.5], [1.0, 0.5]], "direction": "IN"}])
+
+    # Track 0 goes down, track 1 goes up, track 2 stays on one side
+    prev = np.array([[50, 40], [60, 60], [10, 10]], dtype=np.float32)
+    curr = np.array([[50, 60], [60, 40], [12, 12]], dtype=np.float32)
+    crossings = engine.evaluate(prev, curr, 100, 100)
+
+    directions = {t: d for t, _, d in crossings}
+    assert directions[0] != directions[1]
+    assert 2 not in directions
+    counts = engine.line_counts()["principal"]
+    assert counts["in"] == 1 and counts["out"] == 1
+    print("✓ Single line passed")
+
+def test_polyline_counts_once():
+    print("Testing polyline counted once per step...")
+    engine = TripwireEngine()
+    engine.set_lines([{"name": "puerta", "points": [[0.2, 0.2], [0.5, 0.5], [0.8, 0.2]], "direction": "OUT"}])
+
+    # Movement crossing exactly through the shared vertex region still counts once
+    prev = np.array([[50, 60]], dtype=np.float32)
+    curr = np.array([[50, 40]], dtype=np.float32)
+    crossings = engine.evaluate(prev, curr, 100, 100)
+    assert len(crossings) <= 1
+    print("✓ Polyline passed")
+
+def test_skip_and_max_jump():
+    print("Testing skip mask and jump filter...")
+    engine = TripwireEngine()
+    engine.set_lines([
+        {"name": "a", "points": [[0.0, 0.5], [1.0, 0.5]], "direction": "IN"},
+        {"name": "b", "points": [[0.5, 0.0], [0.5, 1.0]], "direction": "IN"},
+    ])
+    prev = np.array([[40, 40]], dtype=np.float32)
+    curr = np.array([[60, 60]], dtype=np.float32)
+
+    skip = np.array([[True, False]])
+    crossings = engine.evaluate(prev, curr, 100, 100, skip=skip)
+    assert [l for _, l, _ in crossings] == [1]
+
+    assert engine.evaluate(prev, curr, 100, 100, max_jump=10) == []
+    print("✓ Skip and jump passed")
+
+def test_matrix_shape():
+    P = np.zeros((3, 2), dtype=np.float32)
+    Q = np.ones((3, 2), dtype=np.float32)
+    A = np.zeros((4, 2), dtype=np.float32)
+    B = np.ones((4, 2), dtype=np.float32)
+    assert segment_crossings(P, Q, A, B).shape == (3, 4)
+
+def test_lines_capped_to_counted_bitmask():
+    print("Testing the per-camera line limit...")
+    engine = TripwireEngine()
+    lines = [{"name": f"l{i}", "points": [[i / 100.0, 0.0], [i / 100.0, 1.0]], "direction": "IN"} for i in range(MAX_LINES + 2)]
+    engine.set_lines(lines)
+    # Never more lines than bits in TrackStore.counted
+    assert len(engine.lines) == MAX_LINES and len(engine.counts) == MAX_LINES
+    assert engine.seg_line.max() == MAX_LINES - 1
+
+if __name__ == "__main__":
+    test_single_line_direction()
+    test_polyline_counts_once()
+    test_skip_and_max_jump()
+    test_matrix_shape()
+    test_lines_capped_to_counted_bitmask()
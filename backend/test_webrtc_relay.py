@@ -0,0 +1,37 @@
+import asyncio
+import os
+import sys
+
+# Add parent directory to path to import services
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.jpeg_hub import JpegHub
+from services.webrtc_relay import SharedH264Encoder
+
+class FakePipeline:
+    def __init__(self, source_id):
+        self.source_id = source_id
+        self.hub = JpegHub(source_id)
+
+def test_encoder_follows_revived_pipeline():
+    print("Testing WebRTC encoder across a pipeline restart...")
+    first, second = FakePipeline(5), FakePipeline(5)
+    current = {"pipeline": first}
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        encoder = SharedH264Encoder(first, loop, revive=lambda p: current["pipeline"])
+        new_frame = first.hub.subscribe_async(loop, feed="frame")
+        # Mismo pipeline vivo: nada cambia
+        assert encoder._follow(new_frame) is new_frame
+        # El pipeline murió y revive() arrancó otro: la suscripción pasa al hub nuevo
+        current["pipeline"] = second
+        new_frame = encoder._follow(new_frame)
+        assert encoder.pipeline is second and encoder.hub is second.hub
+        assert first.hub.frame_subscribers == 0 and second.hub.frame_subscribers == 1
+        second.hub.unsubscribe_async(loop, new_frame, feed="frame")
+
+    asyncio.run(scenario())
+    print("✓ WebRTC follow passed")
+
+if __name__ == "__main__":
+    test_encoder_follows_revived_pipeline()